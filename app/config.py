@@ -52,6 +52,125 @@ class Settings(BaseSettings):
     # Almacenamiento
     CONVERSATION_TIMEOUT: int = 60 * 60 * 24  # 24 horas
     UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "uploads")
+    # Límites de documentos subidos: tamaño máximo (bytes) y tipos
+    # permitidos (separados por comas)
+    MAX_UPLOAD_SIZE: int = int(os.getenv("MAX_UPLOAD_SIZE", str(10 * 1024 * 1024)))
+    ALLOWED_UPLOAD_TYPES: str = os.getenv(
+        "ALLOWED_UPLOAD_TYPES",
+        "application/pdf,"
+        "application/vnd.openxmlformats-officedocument.wordprocessingml.document,"
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet,"
+        "application/vnd.ms-excel,text/csv,text/plain,image/png,image/jpeg",
+    )
+
+    # Cuestionario compilado (python -m app.services.questionnaire_artifact);
+    # vacío usa app/data/questionnaire.bin
+    QUESTIONNAIRE_ARTIFACT: str = os.getenv("QUESTIONNAIRE_ARTIFACT", "")
+    # Si la respuesta se resuelve localmente (opción o sí/no), mostrar la
+    # siguiente pregunta desde la plantilla sin llamar al LLM
+    QUESTIONNAIRE_TEMPLATE_FAST_PATH: bool = os.getenv(
+        "QUESTIONNAIRE_TEMPLATE_FAST_PATH", "False"
+    ).lower() in ("true", "1", "t")
+
+    # Almacenamiento de blobs (PDFs, documentos, feedback): "local" usa
+    # UPLOAD_DIR; "s3" cualquier servicio compatible (AWS S3, MinIO)
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "local")
+    S3_BUCKET: str = os.getenv("S3_BUCKET", "hydrous")
+    S3_ENDPOINT_URL: str = os.getenv("S3_ENDPOINT_URL", "")  # MinIO: http://minio:9000
+    S3_REGION: str = os.getenv("S3_REGION", "us-east-1")
+    S3_ACCESS_KEY_ID: str = os.getenv("S3_ACCESS_KEY_ID", "")
+    S3_SECRET_ACCESS_KEY: str = os.getenv("S3_SECRET_ACCESS_KEY", "")
+    S3_KEY_PREFIX: str = os.getenv("S3_KEY_PREFIX", "")
+    S3_PRESIGNED_EXPIRES: int = int(os.getenv("S3_PRESIGNED_EXPIRES", "900"))
+    STORAGE_CHUNK_SIZE: int = int(
+        os.getenv("STORAGE_CHUNK_SIZE", str(8 * 1024 * 1024))
+    )
+
+    # Artefactos de depuración (prompts, respuestas, HTML): fracción de
+    # conversaciones muestreadas (0-1) y límites del directorio local
+    DEBUG_ARTIFACTS_SAMPLE_RATE: float = float(
+        os.getenv(
+            "DEBUG_ARTIFACTS_SAMPLE_RATE",
+            "1" if os.getenv("DEBUG", "False").lower() in ("true", "1", "t") else "0",
+        )
+    )
+    DEBUG_ARTIFACTS_QUEUE_SIZE: int = int(os.getenv("DEBUG_ARTIFACTS_QUEUE_SIZE", "200"))
+    DEBUG_ARTIFACTS_MAX_FILES: int = int(os.getenv("DEBUG_ARTIFACTS_MAX_FILES", "1000"))
+    DEBUG_ARTIFACTS_MAX_BYTES: int = int(
+        os.getenv("DEBUG_ARTIFACTS_MAX_BYTES", str(100 * 1024 * 1024))
+    )
+    DEBUG_ARTIFACTS_MAX_FILE_BYTES: int = int(
+        os.getenv("DEBUG_ARTIFACTS_MAX_FILE_BYTES", str(1024 * 1024))
+    )
+    DEBUG_ARTIFACTS_RETENTION_HOURS: int = int(
+        os.getenv("DEBUG_ARTIFACTS_RETENTION_HOURS", "72")
+    )
+
+    # Render de PDFs en pool de procesos
+    PDF_RENDER_WORKERS: int = int(os.getenv("PDF_RENDER_WORKERS", "2"))
+    PDF_RENDER_TIMEOUT: int = int(os.getenv("PDF_RENDER_TIMEOUT", "60"))
+
+    # Extracción de texto de documentos en pool de procesos: segundos por
+    # lote de páginas/hoja, segundos por archivo y tamaño máximo del texto
+    DOCUMENT_EXTRACTION_WORKERS: int = int(
+        os.getenv("DOCUMENT_EXTRACTION_WORKERS", "2")
+    )
+    DOCUMENT_EXTRACTION_TASK_TIMEOUT: int = int(
+        os.getenv("DOCUMENT_EXTRACTION_TASK_TIMEOUT", "30")
+    )
+    DOCUMENT_EXTRACTION_TIMEOUT: int = int(
+        os.getenv("DOCUMENT_EXTRACTION_TIMEOUT", "120")
+    )
+    DOCUMENT_TEXT_MAX_CHARS: int = int(os.getenv("DOCUMENT_TEXT_MAX_CHARS", "200000"))
+
+    # Fragmentos de documentos con embeddings (pgvector): "hash" es local,
+    # "openai" usa la API de embeddings. EMBEDDING_DIM debe coincidir con la
+    # columna de document_chunks (se comprueba al arrancar; cambiarla requiere
+    # una migración nueva y reindexar los documentos)
+    EMBEDDING_BACKEND: str = os.getenv("EMBEDDING_BACKEND", "hash")
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+    EMBEDDING_API_URL: str = os.getenv(
+        "EMBEDDING_API_URL", "https://api.openai.com/v1/embeddings"
+    )
+    EMBEDDING_DIM: int = int(os.getenv("EMBEDDING_DIM", "384"))
+    DOCUMENT_CHUNK_SIZE: int = int(os.getenv("DOCUMENT_CHUNK_SIZE", "1000"))
+    DOCUMENT_CHUNK_OVERLAP: int = int(os.getenv("DOCUMENT_CHUNK_OVERLAP", "150"))
+    # Fragmentos añadidos al prompt y distancia coseno máxima para incluirlos
+    DOCUMENT_CONTEXT_TOP_K: int = int(os.getenv("DOCUMENT_CONTEXT_TOP_K", "4"))
+    DOCUMENT_CONTEXT_MAX_DISTANCE: float = float(
+        os.getenv("DOCUMENT_CONTEXT_MAX_DISTANCE", "0.75")
+    )
+
+    # Caché de PDFs direccionada por contenido (uploads/pdf_cache, LRU)
+    PDF_CACHE_MAX_FILES: int = int(os.getenv("PDF_CACHE_MAX_FILES", "500"))
+    PDF_CACHE_MAX_BYTES: int = int(
+        os.getenv("PDF_CACHE_MAX_BYTES", str(500 * 1024 * 1024))
+    )
+    # Con S3 la eviction local no borra los PDFs del bucket: una regla de
+    # ciclo de vida los expira a los N días (0 = sin regla). Un PDF expirado
+    # se vuelve a renderizar desde proposal_text al descargarlo
+    PDF_CACHE_BLOB_TTL_DAYS: int = int(os.getenv("PDF_CACHE_BLOB_TTL_DAYS", "30"))
+
+    # Descarga de PDFs: segundos que el cliente puede reutilizar su copia
+    # sin revalidar (después revalida con If-None-Match → 304)
+    PDF_DOWNLOAD_MAX_AGE: int = int(os.getenv("PDF_DOWNLOAD_MAX_AGE", "300"))
+
+    # Cola de generación de propuestas (app.workers.proposal_worker)
+    PROPOSAL_JOB_MAX_ATTEMPTS: int = int(os.getenv("PROPOSAL_JOB_MAX_ATTEMPTS", "3"))
+    PROPOSAL_JOB_TIMEOUT: int = int(os.getenv("PROPOSAL_JOB_TIMEOUT", "600"))
+    PROPOSAL_WORKER_CONCURRENCY: int = int(
+        os.getenv("PROPOSAL_WORKER_CONCURRENCY", "2")
+    )
+
+    # Generación por secciones: llamadas LLM simultáneas por propuesta,
+    # intentos por sección y vida de las secciones ya generadas en Redis
+    PROPOSAL_SECTION_CONCURRENCY: int = int(
+        os.getenv("PROPOSAL_SECTION_CONCURRENCY", "4")
+    )
+    PROPOSAL_SECTION_ATTEMPTS: int = int(os.getenv("PROPOSAL_SECTION_ATTEMPTS", "2"))
+    PROPOSAL_SECTION_CACHE_TTL: int = int(
+        os.getenv("PROPOSAL_SECTION_CACHE_TTL", str(24 * 3600))
+    )
 
     # PostgreSQL
     POSTGRES_USER: str = os.getenv("POSTGRES_USER", "hydrous")
@@ -67,6 +186,45 @@ class Settings(BaseSettings):
 
     # Redis
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://:redis_password@localhost:6379/0")
+    REDIS_MAX_CONNECTIONS: int = int(os.getenv("REDIS_MAX_CONNECTIONS", "20"))
+    REDIS_POOL_TIMEOUT: float = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))
+    REDIS_SOCKET_TIMEOUT: float = float(os.getenv("REDIS_SOCKET_TIMEOUT", "2"))
+    REDIS_SOCKET_CONNECT_TIMEOUT: float = float(
+        os.getenv("REDIS_SOCKET_CONNECT_TIMEOUT", "2")
+    )
+    REDIS_HEALTH_CHECK_INTERVAL: int = int(
+        os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30")
+    )
+    REDIS_RETRY_ATTEMPTS: int = int(os.getenv("REDIS_RETRY_ATTEMPTS", "3"))
+
+    # Presupuesto de tokens LLM (rate limiting ponderado por costo)
+    LLM_TOKENS_PER_MINUTE_USER: int = int(
+        os.getenv("LLM_TOKENS_PER_MINUTE_USER", "30000")
+    )
+    LLM_TOKENS_PER_DAY_USER: int = int(os.getenv("LLM_TOKENS_PER_DAY_USER", "400000"))
+    LLM_TOKENS_PER_MINUTE_TENANT: int = int(
+        os.getenv("LLM_TOKENS_PER_MINUTE_TENANT", "90000")
+    )
+    LLM_TOKENS_PER_DAY_TENANT: int = int(
+        os.getenv("LLM_TOKENS_PER_DAY_TENANT", "1500000")
+    )
+
+    # Email (bandeja de salida procesada por app.workers.email_worker)
+    SMTP_SERVER: str = os.getenv("SMTP_SERVER", "localhost")
+    SMTP_PORT: int = int(os.getenv("SMTP_PORT", "587"))
+    SMTP_USER: str = os.getenv("SMTP_USER", "")
+    SMTP_PASSWORD: str = os.getenv("SMTP_PASSWORD", "")
+    SMTP_USE_TLS: bool = os.getenv("SMTP_USE_TLS", "True").lower() in ("true", "1", "t")
+    SMTP_TIMEOUT: int = int(os.getenv("SMTP_TIMEOUT", "10"))
+    SMTP_IDLE_TIMEOUT: int = int(os.getenv("SMTP_IDLE_TIMEOUT", "60"))
+    FROM_EMAIL: str = os.getenv("FROM_EMAIL", "noreply@hydrous.com")
+    EMAIL_BATCH_SIZE: int = int(os.getenv("EMAIL_BATCH_SIZE", "20"))
+    EMAIL_POLL_TIMEOUT: int = int(os.getenv("EMAIL_POLL_TIMEOUT", "5"))
+    EMAIL_MAX_ATTEMPTS: int = int(os.getenv("EMAIL_MAX_ATTEMPTS", "5"))
+    EMAIL_RETRY_BASE_SECONDS: int = int(os.getenv("EMAIL_RETRY_BASE_SECONDS", "30"))
+
+    # URL del frontend para enlaces en emails
+    FRONTEND_URL: str = os.getenv("FRONTEND_URL", "https://h2oassistant.com")
 
     # Seguridad
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY", "temporalsecretkey123456789")
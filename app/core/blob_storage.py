@@ -0,0 +1,567 @@
+"""
+Almacenamiento de blobs (PDFs de propuestas, documentos subidos, feedback).
+
+Backends:
+- LocalBlobStorage: archivos bajo settings.UPLOAD_DIR (desarrollo, un nodo)
+- S3BlobStorage: cualquier servicio compatible con S3 (AWS S3, MinIO).
+  Con él, varias réplicas o un contenedor reiniciado ven los mismos archivos.
+
+La API es asíncrona; la E/S bloqueante (disco, boto3) corre en hilos con
+asyncio.to_thread. Las claves son rutas relativas con "/" ("pdf_cache/x.pdf").
+
+Para probar S3 en local con MinIO:
+    docker compose up -d minio
+    STORAGE_BACKEND=s3 S3_ENDPOINT_URL=http://localhost:9000 \\
+    S3_ACCESS_KEY_ID=minioadmin S3_SECRET_ACCESS_KEY=minioadmin uvicorn app.main:app
+"""
+
+import os
+import uuid
+import shutil
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, NamedTuple, Optional
+
+from app.config import settings
+
+logger = logging.getLogger("hydrous")
+
+# Tamaño de lectura para descargas en streaming
+READ_CHUNK_SIZE = 64 * 1024
+
+# Mínimo de S3 para las partes de un multipart upload (salvo la última)
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class BlobInfo(NamedTuple):
+    key: str
+    size: int
+    etag: Optional[str] = None
+    content_type: Optional[str] = None
+
+
+def normalize_key(key: str) -> str:
+    """Valida una clave: relativa, con "/" y sin salir de la raíz"""
+    key = key.replace("\\", "/").lstrip("/")
+    if not key or any(part in ("", ".", "..") for part in key.split("/")):
+        raise ValueError(f"Clave de blob inválida: {key!r}")
+    return key
+
+
+class BlobStorage(ABC):
+    """Interfaz común de los backends"""
+
+    # True si presigned_url() devuelve URLs de descarga directa
+    supports_presigned_urls = False
+
+    @abstractmethod
+    async def put_file(
+        self, key: str, path: str, content_type: Optional[str] = None
+    ) -> BlobInfo:
+        """Sube un archivo local (en streaming desde disco)"""
+        pass
+
+    @abstractmethod
+    async def put_bytes(
+        self, key: str, data: bytes, content_type: Optional[str] = None
+    ) -> BlobInfo:
+        pass
+
+    @abstractmethod
+    async def put_stream(
+        self,
+        key: str,
+        chunks: AsyncIterator[bytes],
+        content_type: Optional[str] = None,
+    ) -> BlobInfo:
+        """Sube un flujo de bytes sin cargarlo completo en memoria"""
+        pass
+
+    @abstractmethod
+    async def stat(self, key: str) -> Optional[BlobInfo]:
+        """Información del blob o None si no existe"""
+        pass
+
+    async def exists(self, key: str) -> bool:
+        return await self.stat(key) is not None
+
+    @abstractmethod
+    def iter_bytes(
+        self, key: str, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        """Lee el blob en bloques; end es inclusivo (como en Range)"""
+        pass
+
+    @abstractmethod
+    async def download_to(self, key: str, path: str) -> bool:
+        """Copia el blob a un archivo local; False si no existe"""
+        pass
+
+    @abstractmethod
+    async def delete(self, key: str) -> bool:
+        pass
+
+    async def expire_prefix(self, prefix: str, days: int) -> bool:
+        """
+        Borra automáticamente los blobs bajo prefix a los days días (regla
+        de ciclo de vida). False si el backend no lo soporta.
+        """
+        return False
+
+    async def presigned_url(
+        self,
+        key: str,
+        expires: Optional[int] = None,
+        filename: Optional[str] = None,
+        content_type: Optional[str] = None,
+    ) -> Optional[str]:
+        """URL temporal de descarga directa (None si el backend no las soporta)"""
+        return None
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Ruta en disco del blob si el backend es local, None si no"""
+        return None
+
+
+class LocalBlobStorage(BlobStorage):
+    """Blobs como archivos bajo un directorio raíz"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def local_path(self, key: str) -> str:
+        return os.path.join(self.root, *normalize_key(key).split("/"))
+
+    def _temp_path(self, path: str) -> str:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return f"{path}.{uuid.uuid4().hex}.tmp"
+
+    def _info(self, key: str, path: str, content_type: Optional[str]) -> BlobInfo:
+        stat_result = os.stat(path)
+        return BlobInfo(
+            key=normalize_key(key),
+            size=stat_result.st_size,
+            etag=f"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}",
+            content_type=content_type,
+        )
+
+    def _publish(self, temp_path: str, path: str):
+        """Rename atómico: los lectores nunca ven un archivo a medias"""
+        os.replace(temp_path, path)
+        os.chmod(path, 0o644)
+
+    async def put_file(
+        self, key: str, path: str, content_type: Optional[str] = None
+    ) -> BlobInfo:
+        target = self.local_path(key)
+
+        def _copy():
+            if os.path.exists(target) and os.path.samefile(path, target):
+                return
+            temp_path = self._temp_path(target)
+            try:
+                shutil.copyfile(path, temp_path)
+                self._publish(temp_path, target)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+        await asyncio.to_thread(_copy)
+        return self._info(key, target, content_type)
+
+    async def put_bytes(
+        self, key: str, data: bytes, content_type: Optional[str] = None
+    ) -> BlobInfo:
+        target = self.local_path(key)
+
+        def _write():
+            temp_path = self._temp_path(target)
+            try:
+                with open(temp_path, "wb") as f:
+                    f.write(data)
+                self._publish(temp_path, target)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+        await asyncio.to_thread(_write)
+        return self._info(key, target, content_type)
+
+    async def put_stream(
+        self,
+        key: str,
+        chunks: AsyncIterator[bytes],
+        content_type: Optional[str] = None,
+    ) -> BlobInfo:
+        target = self.local_path(key)
+        temp_path = self._temp_path(target)
+        f = await asyncio.to_thread(open, temp_path, "wb")
+        try:
+            async for chunk in chunks:
+                await asyncio.to_thread(f.write, chunk)
+            await asyncio.to_thread(f.close)
+            await asyncio.to_thread(self._publish, temp_path, target)
+        finally:
+            f.close()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return self._info(key, target, content_type)
+
+    async def stat(self, key: str) -> Optional[BlobInfo]:
+        try:
+            return self._info(key, self.local_path(key), None)
+        except OSError:
+            return None
+
+    async def iter_bytes(
+        self, key: str, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        f = await asyncio.to_thread(open, self.local_path(key), "rb")
+        try:
+            f.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                size = (
+                    READ_CHUNK_SIZE
+                    if remaining is None
+                    else min(READ_CHUNK_SIZE, remaining)
+                )
+                chunk = await asyncio.to_thread(f.read, size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+        finally:
+            f.close()
+
+    async def download_to(self, key: str, path: str) -> bool:
+        source = self.local_path(key)
+        if not os.path.exists(source):
+            return False
+        if os.path.abspath(source) != os.path.abspath(path):
+            await asyncio.to_thread(shutil.copyfile, source, path)
+        return True
+
+    async def delete(self, key: str) -> bool:
+        try:
+            await asyncio.to_thread(os.remove, self.local_path(key))
+            return True
+        except OSError:
+            return False
+
+
+class S3BlobStorage(BlobStorage):
+    """
+    Blobs en un bucket compatible con S3 (boto3 en hilos).
+
+    - put_file usa el TransferManager de boto3 (multipart automático)
+    - put_stream acumula partes de chunk_size y hace multipart upload;
+      si el flujo cabe en una parte, un único put_object
+    - Las descargas pueden servirse con URLs prefirmadas (sin pasar por la API)
+    """
+
+    supports_presigned_urls = True
+
+    def __init__(
+        self,
+        bucket: str,
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        access_key_id: Optional[str] = None,
+        secret_access_key: Optional[str] = None,
+        key_prefix: str = "",
+        chunk_size: int = 8 * 1024 * 1024,
+        presigned_expires: int = 900,
+    ):
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url or None
+        self.region = region or None
+        self.access_key_id = access_key_id or None
+        self.secret_access_key = secret_access_key or None
+        self.key_prefix = key_prefix.strip("/")
+        self.chunk_size = max(chunk_size, S3_MIN_PART_SIZE)
+        self.presigned_expires = presigned_expires
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        """Cliente boto3 (thread-safe); crea el bucket si no existe (MinIO local)"""
+        with self._lock:
+            if self._client is None:
+                import boto3
+                from botocore.config import Config
+
+                client = boto3.client(
+                    "s3",
+                    endpoint_url=self.endpoint_url,
+                    region_name=self.region,
+                    aws_access_key_id=self.access_key_id,
+                    aws_secret_access_key=self.secret_access_key,
+                    config=Config(
+                        signature_version="s3v4",
+                        retries={"max_attempts": 3, "mode": "standard"},
+                        # MinIO no usa subdominios por bucket
+                        s3={"addressing_style": "path"},
+                    ),
+                )
+                try:
+                    client.head_bucket(Bucket=self.bucket)
+                except client.exceptions.ClientError:
+                    logger.info(f"Creando bucket {self.bucket}")
+                    client.create_bucket(Bucket=self.bucket)
+                self._client = client
+            return self._client
+
+    def _object_key(self, key: str) -> str:
+        key = normalize_key(key)
+        return f"{self.key_prefix}/{key}" if self.key_prefix else key
+
+    @staticmethod
+    def _is_not_found(error) -> bool:
+        code = str(error.response.get("Error", {}).get("Code", ""))
+        return code in ("404", "NoSuchKey", "NotFound")
+
+    async def put_file(
+        self, key: str, path: str, content_type: Optional[str] = None
+    ) -> BlobInfo:
+        extra_args = {"ContentType": content_type} if content_type else None
+        await asyncio.to_thread(
+            self._get_client().upload_file,
+            path,
+            self.bucket,
+            self._object_key(key),
+            ExtraArgs=extra_args,
+        )
+        return await self.stat(key)
+
+    async def put_bytes(
+        self, key: str, data: bytes, content_type: Optional[str] = None
+    ) -> BlobInfo:
+        params = {"Bucket": self.bucket, "Key": self._object_key(key), "Body": data}
+        if content_type:
+            params["ContentType"] = content_type
+        response = await asyncio.to_thread(self._get_client().put_object, **params)
+        return BlobInfo(
+            normalize_key(key), len(data), response.get("ETag"), content_type
+        )
+
+    async def put_stream(
+        self,
+        key: str,
+        chunks: AsyncIterator[bytes],
+        content_type: Optional[str] = None,
+    ) -> BlobInfo:
+        client = await asyncio.to_thread(self._get_client)
+        object_key = self._object_key(key)
+        buffer = bytearray()
+        upload_id = None
+        parts = []
+        total = 0
+
+        async def upload_part(data: bytes):
+            response = await asyncio.to_thread(
+                client.upload_part,
+                Bucket=self.bucket,
+                Key=object_key,
+                UploadId=upload_id,
+                PartNumber=len(parts) + 1,
+                Body=data,
+            )
+            parts.append({"ETag": response["ETag"], "PartNumber": len(parts) + 1})
+
+        try:
+            async for chunk in chunks:
+                buffer.extend(chunk)
+                total += len(chunk)
+                if len(buffer) < self.chunk_size:
+                    continue
+                if upload_id is None:
+                    params = {"Bucket": self.bucket, "Key": object_key}
+                    if content_type:
+                        params["ContentType"] = content_type
+                    response = await asyncio.to_thread(
+                        client.create_multipart_upload, **params
+                    )
+                    upload_id = response["UploadId"]
+                await upload_part(bytes(buffer))
+                buffer.clear()
+
+            if upload_id is None:
+                # Cupo en una sola parte
+                return await self.put_bytes(key, bytes(buffer), content_type)
+
+            if buffer:
+                await upload_part(bytes(buffer))
+            response = await asyncio.to_thread(
+                client.complete_multipart_upload,
+                Bucket=self.bucket,
+                Key=object_key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+            return BlobInfo(
+                normalize_key(key), total, response.get("ETag"), content_type
+            )
+
+        except BaseException:
+            if upload_id is not None:
+                try:
+                    await asyncio.to_thread(
+                        client.abort_multipart_upload,
+                        Bucket=self.bucket,
+                        Key=object_key,
+                        UploadId=upload_id,
+                    )
+                except Exception as e:
+                    logger.warning(f"No se pudo abortar el multipart de {key}: {e}")
+            raise
+
+    async def stat(self, key: str) -> Optional[BlobInfo]:
+        client = await asyncio.to_thread(self._get_client)
+        try:
+            response = await asyncio.to_thread(
+                client.head_object, Bucket=self.bucket, Key=self._object_key(key)
+            )
+        except client.exceptions.ClientError as e:
+            if self._is_not_found(e):
+                return None
+            raise
+        return BlobInfo(
+            normalize_key(key),
+            response["ContentLength"],
+            response.get("ETag"),
+            response.get("ContentType"),
+        )
+
+    async def iter_bytes(
+        self, key: str, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        client = await asyncio.to_thread(self._get_client)
+        params = {"Bucket": self.bucket, "Key": self._object_key(key)}
+        if start or end is not None:
+            params["Range"] = f"bytes={start}-{'' if end is None else end}"
+        response = await asyncio.to_thread(client.get_object, **params)
+        body = response["Body"]
+        try:
+            while True:
+                chunk = await asyncio.to_thread(body.read, READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+    async def download_to(self, key: str, path: str) -> bool:
+        client = await asyncio.to_thread(self._get_client)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            await asyncio.to_thread(
+                client.download_file, self.bucket, self._object_key(key), temp_path
+            )
+            os.replace(temp_path, path)
+            return True
+        except client.exceptions.ClientError as e:
+            if self._is_not_found(e):
+                return False
+            raise
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    async def delete(self, key: str) -> bool:
+        client = await asyncio.to_thread(self._get_client)
+        await asyncio.to_thread(
+            client.delete_object, Bucket=self.bucket, Key=self._object_key(key)
+        )
+        return True
+
+    async def expire_prefix(self, prefix: str, days: int) -> bool:
+        """
+        Crea o actualiza la regla de ciclo de vida del bucket para prefix,
+        conservando las demás reglas.
+        """
+        client = await asyncio.to_thread(self._get_client)
+        object_prefix = f"{self._object_key(prefix)}/"
+        rule_id = f"hydrous-expire-{object_prefix.strip('/').replace('/', '-')}"
+
+        def _apply():
+            try:
+                rules = client.get_bucket_lifecycle_configuration(
+                    Bucket=self.bucket
+                )["Rules"]
+            except client.exceptions.ClientError as e:
+                code = e.response.get("Error", {}).get("Code", "")
+                if code != "NoSuchLifecycleConfiguration":
+                    raise
+                rules = []
+            rules = [rule for rule in rules if rule.get("ID") != rule_id]
+            rules.append(
+                {
+                    "ID": rule_id,
+                    "Filter": {"Prefix": object_prefix},
+                    "Status": "Enabled",
+                    "Expiration": {"Days": days},
+                }
+            )
+            client.put_bucket_lifecycle_configuration(
+                Bucket=self.bucket, LifecycleConfiguration={"Rules": rules}
+            )
+
+        await asyncio.to_thread(_apply)
+        return True
+
+    async def presigned_url(
+        self,
+        key: str,
+        expires: Optional[int] = None,
+        filename: Optional[str] = None,
+        content_type: Optional[str] = None,
+    ) -> Optional[str]:
+        client = await asyncio.to_thread(self._get_client)
+        params = {"Bucket": self.bucket, "Key": self._object_key(key)}
+        if filename:
+            params["ResponseContentDisposition"] = f'attachment; filename="{filename}"'
+        if content_type:
+            params["ResponseContentType"] = content_type
+        return await asyncio.to_thread(
+            client.generate_presigned_url,
+            "get_object",
+            Params=params,
+            ExpiresIn=expires or self.presigned_expires,
+        )
+
+
+def create_blob_storage() -> BlobStorage:
+    """Backend según settings.STORAGE_BACKEND"""
+    if settings.STORAGE_BACKEND.lower() == "s3":
+        try:
+            import boto3  # noqa: F401
+        except ImportError:
+            logger.error(
+                "STORAGE_BACKEND=s3 pero boto3 no está instalado; usando almacenamiento local"
+            )
+        else:
+            logger.info(
+                f"Almacenamiento de blobs: S3 bucket={settings.S3_BUCKET} "
+                f"endpoint={settings.S3_ENDPOINT_URL or 'AWS'}"
+            )
+            return S3BlobStorage(
+                bucket=settings.S3_BUCKET,
+                endpoint_url=settings.S3_ENDPOINT_URL,
+                region=settings.S3_REGION,
+                access_key_id=settings.S3_ACCESS_KEY_ID,
+                secret_access_key=settings.S3_SECRET_ACCESS_KEY,
+                key_prefix=settings.S3_KEY_PREFIX,
+                chunk_size=settings.STORAGE_CHUNK_SIZE,
+                presigned_expires=settings.S3_PRESIGNED_EXPIRES,
+            )
+
+    return LocalBlobStorage(settings.UPLOAD_DIR)
+
+
+# Instancia global
+blob_storage = create_blob_storage()
@@ -0,0 +1,208 @@
+import os
+import time
+import queue
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from app.config import settings
+
+logger = logging.getLogger("hydrous")
+
+_STOP = object()
+
+
+class DebugArtifactRecorder:
+    """
+    Registro central de artefactos de depuración (prompts, respuestas, HTML).
+
+    - Muestreo por conversación: se decide con un hash del conversation_id,
+      así una conversación muestreada guarda todos sus artefactos y el resto
+      ninguno. conversation.metadata["debug_artifacts"] = True fuerza el
+      registro de esa conversación (opt_in).
+    - Fuera del camino de la petición: record() solo encola; un hilo de fondo
+      escribe. Si la cola está llena el artefacto se descarta.
+    - Límites: tamaño máximo por artefacto, retención por antigüedad y por
+      número de archivos / bytes totales (se borran los más antiguos).
+
+    Los artefactos son diagnóstico local del nodo: van a disco
+    (UPLOAD_DIR/debug), no al almacenamiento de blobs compartido.
+    """
+
+    # Cada cuántas escrituras se revisan los límites del directorio
+    SWEEP_EVERY = 50
+
+    def __init__(
+        self,
+        directory: str,
+        sample_rate: float,
+        queue_size: int,
+        max_files: int,
+        max_bytes: int,
+        max_file_bytes: int,
+        retention_seconds: int,
+    ):
+        self.directory = directory
+        self.sample_rate = max(0.0, min(1.0, sample_rate))
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.retention_seconds = retention_seconds
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._writes_since_sweep = 0
+        self._stats = {"recorded": 0, "dropped": 0, "written": 0, "removed": 0}
+
+    def is_sampled(self, conversation_id: Optional[str], opt_in: bool = False) -> bool:
+        """True si los artefactos de esta conversación deben guardarse"""
+        if opt_in:
+            return True
+        if self.sample_rate <= 0:
+            return False
+        if self.sample_rate >= 1:
+            return True
+        digest = hashlib.sha1(str(conversation_id).encode("utf-8")).digest()
+        return int.from_bytes(digest[:4], "big") / 2**32 < self.sample_rate
+
+    def record(
+        self,
+        conversation_id: Optional[str],
+        name: str,
+        content: str,
+        opt_in: bool = False,
+    ) -> bool:
+        """
+        Encola un artefacto sin bloquear.
+
+        Returns:
+            bool: True si se encoló (False si no está muestreado o la cola está llena)
+        """
+        if not content or not self.is_sampled(conversation_id, opt_in):
+            return False
+
+        self._ensure_thread()
+        item = (time.time(), str(conversation_id or "global"), name, content)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._stats["dropped"] += 1
+            return False
+        self._stats["recorded"] += 1
+        return True
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="debug-artifacts", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                self._write(*item)
+            except Exception as e:
+                logger.warning(f"No se pudo guardar artefacto de depuración: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, created_at: float, conversation_id: str, name: str, content: str):
+        os.makedirs(self.directory, exist_ok=True)
+
+        data = content.encode("utf-8")
+        if len(data) > self.max_file_bytes:
+            data = data[: self.max_file_bytes] + b"\n[... truncado ...]\n"
+
+        timestamp = datetime.fromtimestamp(created_at).strftime("%Y%m%dT%H%M%S")
+        safe_name = "".join(c if c.isalnum() or c in "._-" else "_" for c in name)
+        path = os.path.join(
+            self.directory, f"{timestamp}_{conversation_id}_{safe_name}"
+        )
+        with open(path, "wb") as f:
+            f.write(data)
+        self._stats["written"] += 1
+
+        self._writes_since_sweep += 1
+        if self._writes_since_sweep >= self.SWEEP_EVERY:
+            self._writes_since_sweep = 0
+            self.enforce_limits()
+
+    def enforce_limits(self) -> int:
+        """
+        Aplica retención y límites de tamaño (más antiguos primero).
+
+        Returns:
+            int: Archivos eliminados
+        """
+        try:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return 0
+
+        expires_before = time.time() - self.retention_seconds
+        total_files = len(entries)
+        total_bytes = sum(size for _, size, _ in entries)
+        removed = 0
+
+        for mtime, size, path in sorted(entries):
+            if (
+                mtime >= expires_before
+                and total_files <= self.max_files
+                and total_bytes <= self.max_bytes
+            ):
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_files -= 1
+            total_bytes -= size
+            removed += 1
+
+        self._stats["removed"] += removed
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "queued": self._queue.qsize(),
+            "sample_rate": self.sample_rate,
+        }
+
+    def stop(self, timeout: float = 5.0):
+        """Escribe lo pendiente y detiene el hilo (al apagar la aplicación)"""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning("Cola de artefactos de depuración llena al detener")
+            return
+        thread.join(timeout)
+
+
+# Instancia global
+debug_recorder = DebugArtifactRecorder(
+    directory=os.path.join(settings.UPLOAD_DIR, "debug"),
+    sample_rate=settings.DEBUG_ARTIFACTS_SAMPLE_RATE,
+    queue_size=settings.DEBUG_ARTIFACTS_QUEUE_SIZE,
+    max_files=settings.DEBUG_ARTIFACTS_MAX_FILES,
+    max_bytes=settings.DEBUG_ARTIFACTS_MAX_BYTES,
+    max_file_bytes=settings.DEBUG_ARTIFACTS_MAX_FILE_BYTES,
+    retention_seconds=settings.DEBUG_ARTIFACTS_RETENTION_HOURS * 3600,
+)
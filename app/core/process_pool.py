@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, List, Optional, Set
+
+from app.config import settings
+
+logger = logging.getLogger("hydrous")
+
+# Espera al detener un proceso antes de terminarlo
+STOP_TIMEOUT = 5.0
+
+
+def _init_worker():
+    """Configura logging en cada proceso hijo"""
+    from app.core.logging_config import get_logger
+
+    get_logger("hydrous")
+
+
+def _worker_main(conn):
+    """Bucle de un proceso del pool: ejecuta tareas (func, args) en orden"""
+    _init_worker()
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        if message is None:
+            return
+        func, args = message
+        try:
+            result = (True, func(*args))
+        except BaseException as e:
+            result = (False, e)
+        try:
+            conn.send(result)
+        except Exception as e:
+            # Resultado o excepción no picklable
+            conn.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+class ProcessPoolTimeout(Exception):
+    """La tarea superó el tiempo máximo y su proceso fue terminado"""
+
+
+class _Worker:
+    """Un proceso del pool y su extremo del Pipe (una tarea a la vez)"""
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn,), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def call(self, func: Callable[..., Any], args: tuple) -> Any:
+        """Ejecuta la tarea y espera su resultado (en un hilo, no en el loop)"""
+        try:
+            self.conn.send((func, args))
+            ok, value = self.conn.recv()
+        except (EOFError, OSError) as e:
+            raise BrokenProcessPool(
+                f"El proceso {self.process.pid} murió ejecutando {func.__name__}"
+            ) from e
+        if ok:
+            return value
+        raise value
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def kill(self):
+        try:
+            self.process.terminate()
+            self.process.join(STOP_TIMEOUT)
+        except Exception:
+            pass
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+            self.process.join(STOP_TIMEOUT)
+        except Exception:
+            pass
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+
+
+class IsolatedProcessPool:
+    """
+    Pool de procesos para trabajo CPU-bound fuera del event loop.
+
+    - Número de procesos acotado: un semáforo deja pasar como mucho
+      max_workers tareas; el resto espera su turno sin consumir timeout
+    - Timeout por tarea, contado desde que empieza a ejecutarse: si se
+      excede, se termina solo el proceso de esa tarea (un render colgado
+      no bloquea a los demás ni cancela sus tareas)
+    - Aislamiento: si un proceso muere (segfault, OOM) falla solo su tarea
+      y el siguiente run() crea un proceso nuevo
+
+    Las funciones y argumentos deben ser picklables (funciones a nivel de
+    módulo con payloads simples: str, dict, ...). Los procesos se crean con
+    "spawn" para no heredar el estado (event loop, conexiones) del padre y
+    se reutilizan entre tareas.
+    """
+
+    def __init__(self, name: str, max_workers: int, timeout: float):
+        self.name = name
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._context = multiprocessing.get_context("spawn")
+        self._semaphore = asyncio.Semaphore(max_workers)
+        self._idle: List[_Worker] = []
+        self._workers: Set[_Worker] = set()
+        self._lock = threading.Lock()
+
+    def _checkout(self) -> _Worker:
+        """Un proceso libre y vivo, o uno nuevo (corre en un hilo)"""
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.is_alive():
+                    return worker
+                self._workers.discard(worker)
+        worker = _Worker(self._context)
+        with self._lock:
+            self._workers.add(worker)
+            if len(self._workers) == 1:
+                logger.info(
+                    f"Pool de procesos '{self.name}' iniciado (hasta {self.max_workers} procesos)"
+                )
+        return worker
+
+    def _checkin(self, worker: _Worker):
+        with self._lock:
+            if worker in self._workers:
+                self._idle.append(worker)
+
+    def _discard(self, worker: _Worker):
+        with self._lock:
+            self._workers.discard(worker)
+        worker.kill()
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Ejecuta func(*args) en un proceso del pool.
+
+        Raises:
+            ProcessPoolTimeout: si la ejecución supera el timeout
+            BrokenProcessPool: si el proceso murió durante la tarea
+        """
+        loop = asyncio.get_running_loop()
+        async with self._semaphore:
+            worker = await loop.run_in_executor(None, self._checkout)
+            try:
+                result = await asyncio.wait_for(
+                    loop.run_in_executor(None, worker.call, func, args),
+                    timeout=self.timeout,
+                )
+            except asyncio.TimeoutError:
+                logger.error(
+                    f"Tarea {func.__name__} superó {self.timeout}s en pool '{self.name}'; "
+                    f"terminando su proceso ({worker.process.pid})"
+                )
+                await loop.run_in_executor(None, self._discard, worker)
+                raise ProcessPoolTimeout(f"{func.__name__} superó {self.timeout}s")
+            except BrokenProcessPool:
+                logger.error(
+                    f"Proceso caído ejecutando {func.__name__} en pool '{self.name}'; "
+                    f"se reemplaza en la siguiente tarea"
+                )
+                await loop.run_in_executor(None, self._discard, worker)
+                raise
+            except asyncio.CancelledError:
+                # La tarea sigue corriendo en el proceso: no reutilizarlo
+                await asyncio.shield(loop.run_in_executor(None, self._discard, worker))
+                raise
+            except Exception:
+                # La tarea lanzó una excepción: el proceso sigue sano
+                self._checkin(worker)
+                raise
+            self._checkin(worker)
+            return result
+
+    def shutdown(self):
+        """Detiene el pool (al apagar la aplicación)"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            busy = self._workers.difference(idle)
+            self._workers = set()
+        for worker in idle:
+            worker.stop()
+        for worker in busy:
+            worker.kill()
+        if idle or busy:
+            logger.info(f"Pool de procesos '{self.name}' detenido")
+
+
+# Instancia global para el render de PDFs (ReportLab / xhtml2pdf)
+pdf_render_pool = IsolatedProcessPool(
+    "pdf_render", settings.PDF_RENDER_WORKERS, settings.PDF_RENDER_TIMEOUT
+)
+
+# Instancia global para la extracción de texto de documentos (PyPDF2, openpyxl)
+document_extraction_pool = IsolatedProcessPool(
+    "document_extraction",
+    settings.DOCUMENT_EXTRACTION_WORKERS,
+    settings.DOCUMENT_EXTRACTION_TASK_TIMEOUT,
+)
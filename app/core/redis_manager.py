@@ -0,0 +1,284 @@
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
+from redis.asyncio.connection import BlockingConnectionPool
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError, TimeoutError
+
+from app.config import settings
+
+logger = logging.getLogger("hydrous")
+
+
+class RedisMetrics:
+    """
+    Métricas de uso de Redis compartidas por todos los servicios.
+
+    Por cada comando (o "PIPELINE" para lotes) guarda número de llamadas,
+    errores y latencia total/máxima en milisegundos.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._commands: Dict[str, Dict[str, float]] = {}
+
+    def record(self, command: str, elapsed: float, error: bool = False):
+        elapsed_ms = elapsed * 1000
+        with self._lock:
+            stats = self._commands.setdefault(
+                command, {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+            )
+            stats["count"] += 1
+            stats["total_ms"] += elapsed_ms
+            if elapsed_ms > stats["max_ms"]:
+                stats["max_ms"] = elapsed_ms
+            if error:
+                stats["errors"] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                command: {
+                    "count": int(stats["count"]),
+                    "errors": int(stats["errors"]),
+                    "avg_ms": round(stats["total_ms"] / stats["count"], 3),
+                    "max_ms": round(stats["max_ms"], 3),
+                }
+                for command, stats in self._commands.items()
+                if stats["count"]
+            }
+
+    def reset(self):
+        with self._lock:
+            self._commands.clear()
+
+
+class InstrumentedPipeline(Pipeline):
+    """Pipeline que registra la latencia de cada lote ejecutado"""
+
+    metrics: Optional[RedisMetrics] = None
+
+    async def execute(self, raise_on_error: bool = True):
+        size = len(self.command_stack)
+        start = time.perf_counter()
+        error = False
+        try:
+            return await super().execute(raise_on_error=raise_on_error)
+        except Exception:
+            error = True
+            raise
+        finally:
+            if self.metrics is not None and size:
+                self.metrics.record("PIPELINE", time.perf_counter() - start, error)
+
+
+class InstrumentedRedis(redis.Redis):
+    """Cliente Redis que registra la latencia de cada comando"""
+
+    metrics: Optional[RedisMetrics] = None
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        error = False
+        try:
+            return await super().execute_command(*args, **options)
+        except Exception:
+            error = True
+            raise
+        finally:
+            if self.metrics is not None:
+                self.metrics.record(
+                    str(args[0]).upper(), time.perf_counter() - start, error
+                )
+
+    def pipeline(
+        self, transaction: bool = True, shard_hint: Optional[str] = None
+    ) -> InstrumentedPipeline:
+        pipe = InstrumentedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+        pipe.metrics = self.metrics
+        return pipe
+
+
+class RedisManager:
+    """
+    Conexión a Redis única para toda la aplicación.
+
+    ¿Por qué?
+    - Antes cada servicio creaba su propio cliente sin límites ni timeouts
+    - Un solo pool acotado (BlockingConnectionPool): si se agotan las
+      conexiones se espera hasta REDIS_POOL_TIMEOUT en lugar de abrir más
+    - Timeouts de socket, health checks y reintentos con backoff exponencial
+      ante errores de conexión
+    - Métricas de latencia por comando y de uso del pool para todos los servicios
+
+    Se inicia y se detiene con la aplicación (startup/shutdown en main.py).
+    El cliente también se crea bajo demanda para scripts y workers.
+
+    Los comandos que esperan en el servidor (BLMOVE, suscripciones pub/sub)
+    usan blocking_client: un pool aparte sin timeout de lectura, porque con
+    REDIS_SOCKET_TIMEOUT cada espera ociosa terminaría en TimeoutError.
+    """
+
+    def __init__(self, url: Optional[str] = None):
+        self.url = url or settings.REDIS_URL
+        self.metrics = RedisMetrics()
+        self._pool: Optional[BlockingConnectionPool] = None
+        self._client: Optional[InstrumentedRedis] = None
+        self._blocking_pool: Optional[BlockingConnectionPool] = None
+        self._blocking_client: Optional[InstrumentedRedis] = None
+
+    def _build_pool(self, socket_timeout: Optional[float]) -> BlockingConnectionPool:
+        retry = Retry(
+            ExponentialBackoff(cap=1.0, base=0.05), settings.REDIS_RETRY_ATTEMPTS
+        )
+        return BlockingConnectionPool.from_url(
+            self.url,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            timeout=settings.REDIS_POOL_TIMEOUT,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+            socket_keepalive=True,
+            health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+            retry=retry,
+            retry_on_error=[ConnectionError, TimeoutError],
+            decode_responses=True,
+        )
+
+    def _build_client(self, pool: BlockingConnectionPool) -> InstrumentedRedis:
+        client = InstrumentedRedis(connection_pool=pool)
+        client.metrics = self.metrics
+        return client
+
+    @property
+    def client(self) -> InstrumentedRedis:
+        """Cliente compartido (se crea en el primer uso)"""
+        if self._client is None:
+            self._pool = self._build_pool(settings.REDIS_SOCKET_TIMEOUT)
+            self._client = self._build_client(self._pool)
+        return self._client
+
+    @property
+    def blocking_client(self) -> InstrumentedRedis:
+        """
+        Cliente para comandos bloqueantes y pub/sub: sin timeout de lectura
+        (la espera la limita el propio comando) y con keepalive TCP para
+        detectar conexiones caídas.
+        """
+        if self._blocking_client is None:
+            self._blocking_pool = self._build_pool(None)
+            self._blocking_client = self._build_client(self._blocking_pool)
+        return self._blocking_client
+
+    async def start(self) -> bool:
+        """
+        Inicializa el pool y verifica la conexión.
+
+        Returns:
+            bool: True si Redis respondió al PING
+        """
+        try:
+            await self.client.ping()
+            logger.info(
+                f"Redis conectado (pool máx. {settings.REDIS_MAX_CONNECTIONS} conexiones)"
+            )
+            return True
+        except Exception as e:
+            # La app arranca igual: cada servicio maneja la falta de Redis
+            logger.error(f"No se pudo conectar a Redis al iniciar: {e}")
+            return False
+
+    async def stop(self):
+        """Cierra los clientes y todas las conexiones de los pools"""
+        if self._client is None and self._blocking_client is None:
+            return
+        try:
+            for client, pool in (
+                (self._client, self._pool),
+                (self._blocking_client, self._blocking_pool),
+            ):
+                if client is not None:
+                    await client.aclose()
+                if pool is not None:
+                    await pool.disconnect()
+            logger.info("Conexiones a Redis cerradas")
+        except Exception as e:
+            logger.error(f"Error cerrando conexiones a Redis: {e}")
+        finally:
+            self._client = None
+            self._pool = None
+            self._blocking_client = None
+            self._blocking_pool = None
+
+    def pipeline(self, transaction: bool = False) -> InstrumentedPipeline:
+        """Pipeline sobre el cliente compartido (sin MULTI por defecto)"""
+        return self.client.pipeline(transaction=transaction)
+
+    async def execute_batch(
+        self, commands: Sequence[Tuple[Any, ...]], transaction: bool = False
+    ) -> List[Any]:
+        """
+        Ejecuta varios comandos en un solo round trip.
+
+        Args:
+            commands: Tuplas (método, *args), ej. [("get", "k1"), ("incr", "k2")]
+            transaction: Envolver el lote en MULTI/EXEC
+
+        Returns:
+            list: Resultados en el mismo orden que los comandos
+        """
+        if not commands:
+            return []
+        pipe = self.pipeline(transaction=transaction)
+        for method, *args in commands:
+            getattr(pipe, method)(*args)
+        return await pipe.execute()
+
+    def pool_stats(self) -> Dict[str, int]:
+        """Uso actual del pool de conexiones"""
+        if self._pool is None:
+            return {
+                "max_connections": settings.REDIS_MAX_CONNECTIONS,
+                "in_use": 0,
+                "idle": 0,
+            }
+        # BlockingConnectionPool guarda las conexiones libres como None hasta crearlas
+        idle = [
+            c
+            for c in getattr(self._pool, "_available_connections", [])
+            if c is not None
+        ]
+        return {
+            "max_connections": self._pool.max_connections,
+            "in_use": len(getattr(self._pool, "_in_use_connections", [])),
+            "idle": len(idle),
+        }
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Métricas de comandos y del pool"""
+        return {"pool": self.pool_stats(), "commands": self.metrics.snapshot()}
+
+    async def health(self) -> Dict[str, Any]:
+        """PING con latencia y métricas actuales"""
+        start = time.perf_counter()
+        try:
+            await self.client.ping()
+            status = "ok"
+        except Exception as e:
+            logger.error(f"Health check de Redis fallido: {e}")
+            status = "error"
+        return {
+            "status": status,
+            "latency_ms": round((time.perf_counter() - start) * 1000, 3),
+            **self.get_metrics(),
+        }
+
+
+# Instancia global
+redis_manager = RedisManager()
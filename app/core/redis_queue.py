@@ -0,0 +1,272 @@
+import json
+import time
+import uuid
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.core.redis_manager import redis_manager
+
+logger = logging.getLogger("hydrous")
+
+# Reserva atómica: cada mensaje pasa de pending a processing y recibe su fecha
+# límite en inflight en el mismo paso, así nunca queda uno en processing sin
+# fecha (recover_expired no lo vería)
+RESERVE_SCRIPT = """
+local reserved = {}
+for i = 1, tonumber(ARGV[1]) do
+    local raw = redis.call('LMOVE', KEYS[1], KEYS[2], 'RIGHT', 'LEFT')
+    if not raw then
+        break
+    end
+    redis.call('ZADD', KEYS[3], ARGV[2], raw)
+    reserved[#reserved + 1] = raw
+end
+return reserved
+"""
+
+# Saca un mensaje de inflight/processing y deja ARGV[2] en KEYS[3] (pending o
+# dead); ZREM decide qué worker se queda con la recuperación
+RECOVER_SCRIPT = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('LREM', KEYS[2], 1, ARGV[1])
+if ARGV[3] == 'dead' then
+    redis.call('LPUSH', KEYS[3], ARGV[2])
+else
+    redis.call('RPUSH', KEYS[3], ARGV[2])
+end
+return 1
+"""
+
+# Mueve un reintento vencido de delayed a pending
+PROMOTE_SCRIPT = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 1 then
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+
+class ReliableQueue:
+    """
+    Cola persistente en Redis con entrega "al menos una vez".
+
+    Claves (prefijo queue:{name}):
+    - pending: lista de mensajes listos (LPUSH / LMOVE desde la derecha)
+    - processing: mensajes reservados por algún worker
+    - inflight: sorted set mensaje -> fecha límite de procesamiento
+    - delayed: sorted set mensaje -> momento del siguiente reintento
+    - dead: mensajes que agotaron sus intentos
+
+    Si un worker muere con mensajes reservados, recover_expired() los devuelve
+    a pending cuando vence su fecha límite (cuenta como intento); por eso los
+    consumidores deben ser idempotentes. Todos los movimientos entre estados
+    son atómicos (MULTI o scripts Lua).
+    """
+
+    def __init__(self, name: str, max_attempts: int = 5, visibility_timeout: int = 300):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.visibility_timeout = visibility_timeout
+
+        prefix = f"queue:{name}"
+        self.PENDING_KEY = f"{prefix}:pending"
+        self.PROCESSING_KEY = f"{prefix}:processing"
+        self.INFLIGHT_KEY = f"{prefix}:inflight"
+        self.DELAYED_KEY = f"{prefix}:delayed"
+        self.DEAD_KEY = f"{prefix}:dead"
+
+    @property
+    def redis_client(self):
+        return redis_manager.client
+
+    def _script(self, source: str):
+        # register_script solo calcula el SHA; se ejecuta con EVALSHA
+        return self.redis_client.register_script(source)
+
+    async def enqueue(
+        self, payload: Dict[str, Any], message_id: Optional[str] = None
+    ) -> str:
+        """
+        Añade un mensaje a la cola.
+
+        Returns:
+            str: ID del mensaje
+        """
+        message_id = message_id or str(uuid.uuid4())
+        message = {
+            "id": message_id,
+            "attempts": 0,
+            "enqueued_at": time.time(),
+            "payload": payload,
+        }
+        await self.redis_client.lpush(self.PENDING_KEY, json.dumps(message))
+        return message_id
+
+    async def reserve(self, count: int = 1, timeout: float = 5) -> List[Dict[str, Any]]:
+        """
+        Reserva hasta `count` mensajes, esperando hasta `timeout` segundos por el primero.
+
+        Returns:
+            list: Mensajes decodificados; cada uno conserva el original en "_raw"
+        """
+        await self._promote_delayed()
+
+        raw_messages = await self._reserve(count)
+        if not raw_messages and timeout > 0:
+            # Espera bloqueante sin sacar nada de pending: BLMOVE de la lista
+            # sobre sí misma (RIGHT → RIGHT) no la modifica. Va por el cliente
+            # sin timeout de lectura; la reserva sigue siendo el script atómico
+            arrived = await redis_manager.blocking_client.blmove(
+                self.PENDING_KEY, self.PENDING_KEY, timeout, "RIGHT", "RIGHT"
+            )
+            if arrived is None:
+                return []
+            raw_messages = await self._reserve(count)
+
+        messages = []
+        for raw in raw_messages:
+            try:
+                message = json.loads(raw)
+            except ValueError:
+                logger.error(f"Mensaje ilegible en cola {self.name}, descartado")
+                await self._move_to_dead(raw)
+                continue
+            message["_raw"] = raw
+            messages.append(message)
+        return messages
+
+    async def _reserve(self, count: int) -> List[str]:
+        return await self._script(RESERVE_SCRIPT)(
+            keys=[self.PENDING_KEY, self.PROCESSING_KEY, self.INFLIGHT_KEY],
+            args=[count, time.time() + self.visibility_timeout],
+        )
+
+    async def ack(self, message: Dict[str, Any]):
+        """Confirma un mensaje procesado"""
+        raw = message["_raw"]
+        pipe = redis_manager.pipeline(transaction=True)
+        pipe.lrem(self.PROCESSING_KEY, 1, raw)
+        pipe.zrem(self.INFLIGHT_KEY, raw)
+        await pipe.execute()
+
+    async def retry(
+        self, message: Dict[str, Any], error: str, base_delay: float = 30
+    ) -> bool:
+        """
+        Programa un reintento con backoff exponencial o manda a dead-letter.
+
+        Returns:
+            bool: True si se reprogramó, False si se agotaron los intentos
+        """
+        raw = message["_raw"]
+        attempts = message.get("attempts", 0) + 1
+        updated = {k: v for k, v in message.items() if k != "_raw"}
+        updated.update({"attempts": attempts, "last_error": error})
+
+        pipe = redis_manager.pipeline(transaction=True)
+        pipe.lrem(self.PROCESSING_KEY, 1, raw)
+        pipe.zrem(self.INFLIGHT_KEY, raw)
+        if attempts >= self.max_attempts:
+            pipe.lpush(self.DEAD_KEY, json.dumps(updated))
+        else:
+            ready_at = time.time() + base_delay * (2 ** (attempts - 1))
+            pipe.zadd(self.DELAYED_KEY, {json.dumps(updated): ready_at})
+        await pipe.execute()
+
+        if attempts >= self.max_attempts:
+            logger.error(
+                f"Mensaje {message.get('id')} de cola {self.name} enviado a dead-letter "
+                f"tras {attempts} intentos: {error}"
+            )
+            return False
+        return True
+
+    async def recover_expired(
+        self,
+        on_dead: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+    ) -> int:
+        """
+        Devuelve a pending los mensajes reservados cuyo worker no respondió.
+        Cada recuperación cuenta como intento: un mensaje que tumba al worker
+        una y otra vez acaba en dead-letter y se notifica a `on_dead`.
+
+        Returns:
+            int: Mensajes recuperados (incluidos los enviados a dead-letter)
+        """
+        expired = await self.redis_client.zrangebyscore(
+            self.INFLIGHT_KEY, "-inf", time.time()
+        )
+        recovered = 0
+        for raw in expired:
+            try:
+                message = json.loads(raw)
+            except ValueError:
+                message = None
+
+            dead = message is None
+            updated = raw
+            if message is not None:
+                attempts = message.get("attempts", 0) + 1
+                message.update(
+                    {"attempts": attempts, "last_error": "Tiempo de procesamiento agotado"}
+                )
+                dead = attempts >= self.max_attempts
+                updated = json.dumps(message)
+
+            moved = await self._script(RECOVER_SCRIPT)(
+                keys=[
+                    self.INFLIGHT_KEY,
+                    self.PROCESSING_KEY,
+                    self.DEAD_KEY if dead else self.PENDING_KEY,
+                ],
+                args=[raw, updated, "dead" if dead else "pending"],
+            )
+            if not moved:
+                continue
+            recovered += 1
+            if dead:
+                logger.error(
+                    f"Mensaje {message.get('id') if message else '?'} de cola "
+                    f"{self.name} enviado a dead-letter tras expirar"
+                )
+                if on_dead is not None and message is not None:
+                    await on_dead(message)
+        if recovered:
+            logger.warning(
+                f"Recuperados {recovered} mensajes expirados en cola {self.name}"
+            )
+        return recovered
+
+    async def _promote_delayed(self, limit: int = 100):
+        """Mueve a pending los reintentos cuyo momento ya llegó"""
+        due = await self.redis_client.zrangebyscore(
+            self.DELAYED_KEY, "-inf", time.time(), start=0, num=limit
+        )
+        promote = self._script(PROMOTE_SCRIPT)
+        for raw in due:
+            await promote(keys=[self.DELAYED_KEY, self.PENDING_KEY], args=[raw])
+
+    async def _move_to_dead(self, raw: str):
+        pipe = redis_manager.pipeline(transaction=True)
+        pipe.lrem(self.PROCESSING_KEY, 1, raw)
+        pipe.zrem(self.INFLIGHT_KEY, raw)
+        pipe.lpush(self.DEAD_KEY, raw)
+        await pipe.execute()
+
+    async def stats(self) -> Dict[str, int]:
+        """Tamaño de cada estado de la cola"""
+        pipe = redis_manager.pipeline()
+        pipe.llen(self.PENDING_KEY)
+        pipe.llen(self.PROCESSING_KEY)
+        pipe.zcard(self.DELAYED_KEY)
+        pipe.llen(self.DEAD_KEY)
+        pending, processing, delayed, dead = await pipe.execute()
+        return {
+            "pending": pending,
+            "processing": processing,
+            "delayed": delayed,
+            "dead": dead,
+        }
@@ -0,0 +1,48 @@
+"""add_document_chunks
+
+Revision ID: 3c7e2a91d4f0
+Revises: bf31fbf3d576
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from pgvector.sqlalchemy import Vector
+
+# revision identifiers, used by Alembic.
+revision: str = '3c7e2a91d4f0'
+down_revision: Union[str, None] = 'bf31fbf3d576'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Debe coincidir con settings.EMBEDDING_DIM (se comprueba al arrancar la API).
+# Para cambiar de dimensión hace falta una migración nueva que altere la
+# columna y vuelva a indexar los documentos; no editar este valor.
+EMBEDDING_DIM = 384
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute('CREATE EXTENSION IF NOT EXISTS "vector"')
+    op.create_table('document_chunks',
+    sa.Column('document_id', sa.UUID(), nullable=False),
+    sa.Column('conversation_id', sa.UUID(), nullable=False),
+    sa.Column('chunk_index', sa.Integer(), nullable=False),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('embedding', Vector(EMBEDDING_DIM), nullable=False),
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_document_chunks_document_id'), 'document_chunks', ['document_id'], unique=False)
+    op.create_index(op.f('ix_document_chunks_conversation_id'), 'document_chunks', ['conversation_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_document_chunks_conversation_id'), table_name='document_chunks')
+    op.drop_index(op.f('ix_document_chunks_document_id'), table_name='document_chunks')
+    op.drop_table('document_chunks')
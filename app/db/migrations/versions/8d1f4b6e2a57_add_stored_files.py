@@ -0,0 +1,48 @@
+"""add_stored_files
+
+Revision ID: 8d1f4b6e2a57
+Revises: 3c7e2a91d4f0
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '8d1f4b6e2a57'
+down_revision: Union[str, None] = '3c7e2a91d4f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('stored_files',
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('content_type', sa.String(length=100), nullable=True),
+    sa.Column('blob_key', sa.String(length=255), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('blob_status', sa.String(length=20), nullable=False),
+    sa.Column('extraction_status', sa.String(length=20), nullable=True),
+    sa.Column('extraction_started_at', sa.DateTime(), nullable=True),
+    sa.Column('processed_text', sa.Text(), nullable=True),
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_stored_files_sha256'), 'stored_files', ['sha256'], unique=True)
+    op.add_column('documents', sa.Column('stored_file_id', sa.UUID(), nullable=True))
+    op.create_index(op.f('ix_documents_stored_file_id'), 'documents', ['stored_file_id'], unique=False)
+    op.create_foreign_key('fk_documents_stored_file_id', 'documents', 'stored_files', ['stored_file_id'], ['id'], ondelete='SET NULL')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('fk_documents_stored_file_id', 'documents', type_='foreignkey')
+    op.drop_index(op.f('ix_documents_stored_file_id'), table_name='documents')
+    op.drop_column('documents', 'stored_file_id')
+    op.drop_index(op.f('ix_stored_files_sha256'), table_name='stored_files')
+    op.drop_table('stored_files')
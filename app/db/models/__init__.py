@@ -4,7 +4,9 @@ from app.db.models.user import User
 from app.db.models.conversation import Conversation
 from app.db.models.message import Message
 from app.db.models.conversation_metadata import ConversationMetadata
+from app.db.models.stored_file import StoredFile
 from app.db.models.document import Document
+from app.db.models.document_chunk import DocumentChunk
 
 # Para facilitar importaciones y asegurar que Alembic detecte los modelos
 __all__ = [
@@ -14,5 +16,7 @@ __all__ = [
     "Message",
     "RoleEnum",
     "ConversationMetadata",
+    "StoredFile",
     "Document",
+    "DocumentChunk",
 ]
@@ -17,6 +17,21 @@ class Document(Base, BaseModel):
     file_path = Column(String(255), nullable=False)
     content_type = Column(String(100), nullable=True)
     processed_text = Column(Text, nullable=True)
+    # Archivo (único por contenido) del que sale file_path; NULL en documentos
+    # anteriores a la deduplicación
+    stored_file_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("stored_files.id", ondelete="SET NULL"),
+        nullable=True,
+        index=True,
+    )
 
     # Relaciones
     conversation = relationship("Conversation", back_populates="documents")
+    stored_file = relationship("StoredFile", back_populates="documents")
+    chunks = relationship(
+        "DocumentChunk",
+        back_populates="document",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
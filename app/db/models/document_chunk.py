@@ -0,0 +1,30 @@
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import Column, Integer, Text, ForeignKey
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import relationship
+
+from app.config import settings
+from app.db.models.declarations import Base, BaseModel
+
+
+class DocumentChunk(Base, BaseModel):
+    """Fragmento de texto de un documento con su embedding (pgvector)"""
+
+    __tablename__ = "document_chunks"
+
+    document_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("documents.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    # Copia del documento: la búsqueda filtra por conversación sin join.
+    # Sin índice vectorial: la búsqueda es exacta sobre los fragmentos de
+    # una conversación (pocos), que un índice HNSW global no acota
+    conversation_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    chunk_index = Column(Integer, nullable=False)
+    content = Column(Text, nullable=False)
+    embedding = Column(Vector(settings.EMBEDDING_DIM), nullable=False)
+
+    # Relaciones
+    document = relationship("Document", back_populates="chunks")
@@ -0,0 +1,31 @@
+from sqlalchemy import BigInteger, Column, DateTime, Integer, String, Text
+from sqlalchemy.orm import relationship
+
+from app.db.models.declarations import Base, BaseModel
+
+
+class StoredFile(Base, BaseModel):
+    """
+    Archivo subido, único por contenido (SHA-256). Varios documentos (de
+    distintas subidas o conversaciones) comparten el blob y el texto
+    extraído; ref_count cuenta los documentos que lo usan.
+    """
+
+    __tablename__ = "stored_files"
+
+    sha256 = Column(String(64), nullable=False, unique=True, index=True)
+    size = Column(BigInteger, nullable=False)
+    content_type = Column(String(100), nullable=True)
+    blob_key = Column(String(255), nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    # "uploading" hasta que el blob está subido, luego "stored"
+    blob_status = Column(String(20), nullable=False, default="uploading")
+    # "extracting" mientras la primera subida lo extrae (desde
+    # extraction_started_at), luego el resultado (completed/partial/failed);
+    # completed se reutiliza en los demás documentos
+    extraction_status = Column(String(20), nullable=True)
+    extraction_started_at = Column(DateTime, nullable=True)
+    processed_text = Column(Text, nullable=True)
+
+    # Relaciones
+    documents = relationship("Document", back_populates="stored_file")
@@ -4,8 +4,15 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
-from app.routes import chat, documents, feedback, auth
+from app.routes import chat, conversations, documents, feedback, auth
 from app.config import settings
+from app.core.redis_manager import redis_manager
+from app.core.process_pool import document_extraction_pool, pdf_render_pool
+from app.core.debug_artifacts import debug_recorder
+from app.services.direct_proposal_generator import direct_proposal_generator
+from app.services.document_retrieval import document_retrieval_service
+from app.services.questionnaire_flow import questionnaire_flow
+from app.services.questionnaire_versions import questionnaire_versions
 
 # Importar middlewares
 from app.middleware.auth_middleware import AuthMiddleware
@@ -48,6 +55,11 @@ app.add_middleware(
 
 # Incluir rutas
 app.include_router(chat.router, prefix=f"{settings.API_V1_STR}/chat", tags=["chat"])
+app.include_router(
+    conversations.router,
+    prefix=f"{settings.API_V1_STR}/conversations",
+    tags=["conversations"],
+)
 app.include_router(
     documents.router, prefix=f"{settings.API_V1_STR}/documents", tags=["documents"]
 )
@@ -57,11 +69,45 @@ app.include_router(
 app.include_router(auth.router, prefix=f"{settings.API_V1_STR}/auth", tags=["auth"])
 
 
+@app.on_event("startup")
+async def startup():
+    """
+    Abre el pool compartido de Redis, escucha versiones del cuestionario y
+    configura la expiración de los PDFs en el almacenamiento
+    """
+    await redis_manager.start()
+    questionnaire_versions.start()
+    await document_retrieval_service.check_schema()
+    await direct_proposal_generator.expire_stored_pdfs()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Cierra las conexiones compartidas y los pools de procesos"""
+    await questionnaire_versions.stop()
+    await redis_manager.stop()
+    pdf_render_pool.shutdown()
+    document_extraction_pool.shutdown()
+    debug_recorder.stop()
+
+
 @app.get(f"{settings.API_V1_STR}/health")
 async def health_check():
     """Endpoint para verificar que la API está funcionando"""
     return {"status": "ok", "version": app.version}
 
 
+@app.get(f"{settings.API_V1_STR}/health/redis")
+async def redis_health_check():
+    """Estado de Redis: latencia de PING, uso del pool y métricas por comando"""
+    return await redis_manager.health()
+
+
+@app.get(f"{settings.API_V1_STR}/health/questionnaire")
+async def questionnaire_health_check():
+    """Turnos del cuestionario y fracción resuelta por el camino rápido (sin LLM)"""
+    return await questionnaire_flow.turn_stats()
+
+
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=settings.DEBUG)
@@ -22,7 +22,6 @@ class Conversation(BaseModel):
             "collected_data": {},
             "selected_sector": None,
             "selected_subsector": None,
-            "questionnaire_path": [],  # Podemos seguir usando esto para referencia
             "is_complete": False,
             "has_proposal": False,
             "proposal_text": None,
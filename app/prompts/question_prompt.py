@@ -0,0 +1,84 @@
+# app/prompts/question_prompt.py
+
+QUESTION_SYSTEM_PROMPT = """
+You are the Hydrous AI Water Solution Designer, a friendly expert consultant in water and wastewater treatment.
+
+The server decides the questionnaire flow. Your only job is to phrase the ONE question you are given.
+
+## RESPONSE STRUCTURE
+1. Briefly acknowledge the user's last answer (vary the wording; skip it if there is none)
+2. One short educational insight relevant to the user's sector
+   > 💧 **Relevant fact:** [a specific figure: percentage, range or efficiency]
+3. The question, preceded by "**QUESTION:**" in bold
+   - If options are given, list them numbered (1, 2, 3…) exactly as provided and say they can reply with just the number
+4. *Why do we ask this?* followed by the explanation, in one sentence
+5. STOP
+
+## RULES
+* Ask ONLY the question given. Never add, skip or reorder questions
+* Use the "Known information" to personalise the message; only ask the question given
+* If "Excerpts from the user's documents" answer the question, mention the value found and ask the user to confirm it
+* Never say "welcome back" or reintroduce yourself
+* Reply in the user's language; translate the question and options if needed, keeping their meaning
+* Keep it under 180 words
+"""
+
+
+def get_question_prompt(
+    metadata: dict,
+    question_text: str,
+    options=(),
+    explanation: str = "",
+    sub_questions=(),
+    confirmation_text: str = "",
+    last_question: str = "",
+    last_answer: str = "",
+    repeated: bool = False,
+    document_context=(),
+) -> str:
+    """
+    Mensaje con la única pregunta a redactar y unas pocas líneas de contexto
+    (en lugar del cuestionario completo). document_context son los
+    fragmentos de documentos más relevantes para la pregunta, no los
+    documentos completos.
+    """
+    known = [
+        ("Name", metadata.get("user_name")),
+        ("Company", metadata.get("company_name")),
+        ("Location", metadata.get("user_location")),
+        ("Sector", metadata.get("selected_sector")),
+        ("Subsector", metadata.get("selected_subsector")),
+    ]
+    lines = ["## Known information"]
+    lines.extend(f"- {label}: {value}" for label, value in known if value)
+
+    if last_answer:
+        lines.append("\n## Last answer")
+        if last_question:
+            lines.append(f"- Question: {last_question}")
+        lines.append(f"- Answer: {last_answer}")
+    if repeated:
+        lines.append(
+            "\nThe last answer did not answer the question (it matched no option, or the user "
+            "asked something): if the user asked a question, answer it briefly first; then "
+            "kindly ask the same question again."
+        )
+
+    if document_context:
+        lines.append("\n## Excerpts from the user's documents")
+        lines.extend(f"- {excerpt}" for excerpt in document_context)
+
+    lines.append("\n## Question to ask")
+    lines.append(question_text)
+    if confirmation_text:
+        lines.append(f"(Information to share before asking: {confirmation_text})")
+    if options:
+        lines.append("Options:")
+        lines.extend(f"{i}. {option}" for i, option in enumerate(options, 1))
+    if sub_questions:
+        lines.append("Ask for each of these values:")
+        lines.extend(f"- {sub}" for sub in sub_questions)
+    if explanation:
+        lines.append(f"Why we ask: {explanation}")
+
+    return "\n".join(lines)
@@ -0,0 +1,152 @@
+from typing import List, Optional, Sequence, Tuple
+from uuid import UUID
+from sqlalchemy import text
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.exc import SQLAlchemyError
+import logging
+
+from app.db.models.document import Document
+from app.db.models.document_chunk import DocumentChunk
+from app.repositories.base import BaseRepository
+from app.schemas.database_schemas import DocumentChunkCreate, DocumentChunkUpdate
+
+logger = logging.getLogger("hydrous")
+
+
+class DocumentChunkRepository(
+    BaseRepository[DocumentChunk, DocumentChunkCreate, DocumentChunkUpdate]
+):
+    def replace_for_document(
+        self,
+        db: Session,
+        *,
+        document_id: UUID,
+        chunks: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+    ) -> int:
+        """Sustituye los fragmentos de un documento (reindexado idempotente)"""
+        try:
+            document = db.query(Document).filter(Document.id == document_id).first()
+            if document is None:
+                return 0
+            db.query(DocumentChunk).filter(
+                DocumentChunk.document_id == document_id
+            ).delete(synchronize_session=False)
+            db.add_all(
+                DocumentChunk(
+                    document_id=document_id,
+                    conversation_id=document.conversation_id,
+                    chunk_index=index,
+                    content=content,
+                    embedding=list(embedding),
+                )
+                for index, (content, embedding) in enumerate(zip(chunks, embeddings))
+            )
+            db.commit()
+            return len(chunks)
+        except SQLAlchemyError as e:
+            logger.error(f"Error en replace_for_document: {e}")
+            db.rollback()
+            return 0
+
+    def copy_from_stored_file(self, db: Session, *, document: Document) -> int:
+        """
+        Copia al documento los fragmentos (con sus embeddings) de otro
+        documento del mismo archivo, sin volver a calcularlos. No hace commit.
+        """
+        source_id = (
+            db.query(DocumentChunk.document_id)
+            .join(Document, Document.id == DocumentChunk.document_id)
+            .filter(Document.stored_file_id == document.stored_file_id)
+            .filter(Document.id != document.id)
+            .limit(1)
+            .scalar()
+        )
+        if source_id is None:
+            return 0
+        source_chunks = (
+            db.query(DocumentChunk)
+            .filter(DocumentChunk.document_id == source_id)
+            .order_by(DocumentChunk.chunk_index)
+            .all()
+        )
+        db.add_all(
+            DocumentChunk(
+                document_id=document.id,
+                conversation_id=document.conversation_id,
+                chunk_index=chunk.chunk_index,
+                content=chunk.content,
+                embedding=chunk.embedding,
+            )
+            for chunk in source_chunks
+        )
+        return len(source_chunks)
+
+    def has_chunks(self, db: Session, conversation_id: UUID) -> bool:
+        """Indica si la conversación tiene algún fragmento indexado"""
+        try:
+            return (
+                db.query(DocumentChunk.id)
+                .filter(DocumentChunk.conversation_id == conversation_id)
+                .first()
+                is not None
+            )
+        except SQLAlchemyError as e:
+            logger.error(f"Error en has_chunks: {e}")
+            return False
+
+    def search(
+        self,
+        db: Session,
+        *,
+        conversation_id: UUID,
+        embedding: Sequence[float],
+        limit: int,
+        max_distance: float,
+    ) -> List[Tuple[DocumentChunk, float]]:
+        """
+        Fragmentos más cercanos (distancia coseno) de una conversación.
+
+        Búsqueda exacta sobre los fragmentos de la conversación (índice por
+        conversation_id, CTE materializada). No hay índice vectorial: una
+        conversación tiene pocos fragmentos, y con un HNSW global el filtro
+        se aplicaría después de tomar solo ~ef_search candidatos de toda la
+        tabla y podría no devolver nada.
+        """
+        try:
+            candidates = (
+                db.query(DocumentChunk)
+                .filter(DocumentChunk.conversation_id == conversation_id)
+                .cte("conversation_chunks")
+                .prefix_with("MATERIALIZED")
+            )
+            chunk = aliased(DocumentChunk, candidates)
+            distance = chunk.embedding.cosine_distance(list(embedding))
+            return (
+                db.query(chunk, distance.label("distance"))
+                .filter(distance <= max_distance)
+                .order_by(distance)
+                .limit(limit)
+                .all()
+            )
+        except SQLAlchemyError as e:
+            logger.error(f"Error en search: {e}")
+            return []
+
+    def embedding_dim(self, db: Session) -> Optional[int]:
+        """Dimensión de la columna embedding en la base de datos (None si no existe)"""
+        try:
+            return db.execute(
+                text(
+                    "SELECT atttypmod FROM pg_attribute "
+                    "WHERE attrelid = to_regclass('document_chunks') "
+                    "AND attname = 'embedding'"
+                )
+            ).scalar()
+        except SQLAlchemyError as e:
+            logger.error(f"Error en embedding_dim: {e}")
+            return None
+
+
+# Instanciar repositorio
+document_chunk_repository = DocumentChunkRepository(DocumentChunk)
@@ -0,0 +1,187 @@
+from datetime import datetime, timezone
+from typing import Optional
+from uuid import UUID
+from sqlalchemy import and_, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
+import logging
+
+from app.db.models.document import Document
+from app.db.models.stored_file import StoredFile
+from app.repositories.base import BaseRepository
+from app.schemas.database_schemas import StoredFileCreate, StoredFileUpdate
+
+logger = logging.getLogger("hydrous")
+
+
+class StoredFileRepository(
+    BaseRepository[StoredFile, StoredFileCreate, StoredFileUpdate]
+):
+    def get_by_sha256(self, db: Session, sha256: str) -> Optional[StoredFile]:
+        """Obtener un archivo por el hash de su contenido"""
+        try:
+            return db.query(StoredFile).filter(StoredFile.sha256 == sha256).first()
+        except SQLAlchemyError as e:
+            logger.error(f"Error en get_by_sha256: {e}")
+            return None
+
+    def acquire(
+        self,
+        db: Session,
+        *,
+        sha256: str,
+        size: int,
+        content_type: Optional[str],
+        blob_key: str,
+    ) -> StoredFile:
+        """
+        Suma una referencia al archivo (lo crea con ref_count=1 y
+        blob_status="uploading" si no existe) con un único INSERT ... ON
+        CONFLICT, sin carreras entre subidas simultáneas. No hace commit: el
+        llamador debe hacerlo enseguida y subir el blob fuera de la
+        transacción (ver mark_blob_stored).
+        """
+        statement = (
+            insert(StoredFile)
+            .values(
+                sha256=sha256,
+                size=size,
+                content_type=content_type,
+                blob_key=blob_key,
+                ref_count=1,
+                blob_status="uploading",
+            )
+            .on_conflict_do_update(
+                index_elements=[StoredFile.sha256],
+                set_={"ref_count": StoredFile.ref_count + 1},
+            )
+            .returning(StoredFile.id)
+        )
+        stored_file_id = db.execute(statement).scalar_one()
+        return (
+            db.query(StoredFile)
+            .populate_existing()
+            .filter(StoredFile.id == stored_file_id)
+            .one()
+        )
+
+    def mark_blob_stored(self, db: Session, *, stored_file_id: UUID) -> None:
+        """Marca el blob como subido. No hace commit."""
+        db.query(StoredFile).filter(StoredFile.id == stored_file_id).update(
+            {"blob_status": "stored"}, synchronize_session=False
+        )
+
+    def release(
+        self, db: Session, *, stored_file_id: UUID, count: int = 1
+    ) -> Optional[str]:
+        """
+        Resta referencias al archivo; si no quedan, borra la fila y devuelve
+        la clave del blob para que el llamador lo elimine después del commit.
+        Una subida posterior del mismo contenido crea otra fila con otra
+        clave, así que ese borrado tardío no le afecta. No hace commit.
+        """
+        stored_file = (
+            db.query(StoredFile)
+            .filter(StoredFile.id == stored_file_id)
+            .with_for_update()
+            .first()
+        )
+        if stored_file is None:
+            return None
+        stored_file.ref_count = max(stored_file.ref_count - count, 0)
+        if stored_file.ref_count > 0:
+            return None
+        blob_key = stored_file.blob_key
+        db.delete(stored_file)
+        return blob_key
+
+    def get_by_document(self, db: Session, document_id: UUID) -> Optional[StoredFile]:
+        """Obtener el archivo de un documento"""
+        try:
+            return (
+                db.query(StoredFile)
+                .join(Document, Document.stored_file_id == StoredFile.id)
+                .filter(Document.id == document_id)
+                .first()
+            )
+        except SQLAlchemyError as e:
+            logger.error(f"Error en get_by_document: {e}")
+            return None
+
+    def claim_extraction(
+        self, db: Session, *, document_id: UUID, stale_before: datetime
+    ) -> bool:
+        """
+        Marca el archivo del documento como "extracting" si no tiene ya una
+        extracción completa ni otra en curso (o la marca es anterior a
+        stale_before: el proceso que la puso murió). Un único UPDATE
+        condicional, así solo una subida simultánea la obtiene. Un documento
+        sin archivo siempre se extrae. No hace commit.
+        """
+        stored_file_id = (
+            db.query(Document.stored_file_id)
+            .filter(Document.id == document_id)
+            .scalar()
+        )
+        if stored_file_id is None:
+            return True
+        claimed = (
+            db.query(StoredFile)
+            .filter(StoredFile.id == stored_file_id)
+            .filter(
+                or_(
+                    StoredFile.extraction_status.is_(None),
+                    StoredFile.extraction_status.notin_(("completed", "extracting")),
+                    and_(
+                        StoredFile.extraction_status == "extracting",
+                        StoredFile.extraction_started_at < stale_before,
+                    ),
+                )
+            )
+            .update(
+                {
+                    "extraction_status": "extracting",
+                    "extraction_started_at": datetime.now(timezone.utc).replace(
+                        tzinfo=None
+                    ),
+                },
+                synchronize_session=False,
+            )
+        )
+        return claimed == 1
+
+    def save_extraction(
+        self,
+        db: Session,
+        *,
+        document_id: UUID,
+        status: str,
+        processed_text: Optional[str],
+    ) -> Optional[StoredFile]:
+        """
+        Guarda en el archivo del documento el resultado de la extracción
+        (para reutilizarlo); también libera la marca "extracting".
+        """
+        try:
+            stored_file = (
+                db.query(StoredFile)
+                .join(Document, Document.stored_file_id == StoredFile.id)
+                .filter(Document.id == document_id)
+                .first()
+            )
+            if stored_file:
+                stored_file.extraction_status = status
+                stored_file.extraction_started_at = None
+                if processed_text is not None:
+                    stored_file.processed_text = processed_text
+                db.commit()
+            return stored_file
+        except SQLAlchemyError as e:
+            logger.error(f"Error en save_extraction: {e}")
+            db.rollback()
+            return None
+
+
+# Instanciar repositorio
+stored_file_repository = StoredFileRepository(StoredFile)
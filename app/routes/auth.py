@@ -23,8 +23,18 @@ class PasswordResetConfirm(BaseModel):
     token: str
     new_password: str
 
+def _get_device_info(request: Request) -> dict:
+    """Datos del cliente que se guardan con la sesión"""
+    return {
+        "user_agent": request.headers.get("user-agent"),
+        "ip": request.client.host if request.client else None,
+    }
+
+
 @router.post("/register", response_model=dict)
-async def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register_user(
+    user_data: UserCreate, request: Request, db: Session = Depends(get_db)
+):
     """Registra un nuevo usuario"""
     try:
         # Crear usuario
@@ -32,6 +42,9 @@ async def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
 
         # Generar token
         token_data = auth_service.create_access_token(user.id)
+        await auth_service.register_session(
+            token_data.access_token, user.id, _get_device_info(request)
+        )
 
         # Devolver datos de usuario y token
         return {
@@ -62,7 +75,9 @@ async def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
 
 
 @router.post("/login", response_model=dict)
-async def login_user(login_data: LoginRequest, db: Session = Depends(get_db)):
+async def login_user(
+    login_data: LoginRequest, request: Request, db: Session = Depends(get_db)
+):
     """Inicia sesión de usuario"""
     try:
         # Autenticar usuario
@@ -77,6 +92,9 @@ async def login_user(login_data: LoginRequest, db: Session = Depends(get_db)):
 
         # Generar token
         token_data = auth_service.create_access_token(user.id)
+        await auth_service.register_session(
+            token_data.access_token, user.id, _get_device_info(request)
+        )
 
         # Devolver datos de usuario y token
         return {
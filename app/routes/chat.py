@@ -1,12 +1,12 @@
 # app/routes/chat.py
 from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends, Header, Request
-from fastapi.responses import FileResponse
+from fastapi.responses import JSONResponse, RedirectResponse
 import logging
 import os
 import uuid
 import re
 from datetime import datetime
-from typing import Any, Optional, Dict, List
+from typing import Any, Optional, Dict
 from pydantic import BaseModel
 from uuid import UUID
 from sqlalchemy.orm import Session
@@ -21,9 +21,16 @@ from app.services.ai_service import ai_service
 from app.services.pdf_service import pdf_service
 from app.services.proposal_service import proposal_service
 from app.services.questionnaire_service import questionnaire_service
+from app.services.questionnaire_flow import questionnaire_flow
+from app.services.questionnaire_versions import questionnaire_versions
 from app.services.auth_service import auth_service
+from app.services.direct_proposal_generator import direct_proposal_generator
+from app.services.proposal_job_service import proposal_job_service
+from app.services.token_budget_service import token_budget_service
 from app.config import settings
+from app.core.blob_storage import blob_storage
 from app.db.base import get_db
+from app.utils.file_delivery import conditional_file_response
 
 # Importar repositorios
 from app.repositories.conversation_repository import conversation_repository
@@ -48,86 +55,81 @@ def get_current_user(request: Request):
     return request.state.user
 
 
-def _get_full_questionnaire_path(metadata: Dict[str, Any]) -> List[str]:
-    """Intenta construir la ruta completa del cuestionario."""
-    path = [
-        q["id"]
-        for q in questionnaire_service.structure.get("initial_questions", [])
-        if "id" in q
-    ]
-    sector = metadata.get("selected_sector")
-    subsector = metadata.get("selected_subsector")
-    if sector and subsector:
-        try:
-            sector_data = questionnaire_service.structure.get(
-                "sector_questionnaires", {}
-            ).get(sector, {})
-            subsector_questions = sector_data.get(subsector, [])
-            if not isinstance(subsector_questions, list):
-                subsector_questions = sector_data.get("Otro", [])
-            path.extend([q["id"] for q in subsector_questions if "id" in q])
-        except Exception as e:
-            logger.error(f"Error construyendo ruta en _get_full_path: {e}")
-            path = [
-                q["id"]
-                for q in questionnaire_service.structure.get("initial_questions", [])
-                if "id" in q
-            ]
-    return path
-
-
-def _is_last_question(
-    current_question_id: Optional[str], metadata: Dict[str, Any]
+async def _enforce_llm_budget(current_user: Dict[str, Any], estimated_tokens: int):
+    """
+    Cobra los tokens estimados de una llamada al LLM de los presupuestos del
+    usuario y de su empresa. Lanza 429 ANTES de llamar al modelo si se exceden.
+    """
+    allowed, retry_after, scope = await token_budget_service.consume(
+        user_id=current_user["id"],
+        tenant_id=current_user.get("company_name"),
+        tokens=estimated_tokens,
+    )
+    if not allowed:
+        raise HTTPException(
+            status_code=429,
+            detail={
+                "message": f"Presupuesto de uso de IA excedido. Espera {int(retry_after) + 1} segundos.",
+                "error_code": "LLM_BUDGET_EXCEEDED",
+                "budget": scope,
+                "retry_after": int(retry_after) + 1,
+            },
+            headers={"Retry-After": str(int(retry_after) + 1)},
+        )
+
+
+async def _reserve_proposal_budget(
+    current_user: Dict[str, Any], conversation: Conversation
 ) -> bool:
-    """Verifica si la pregunta actual es la última de la ruta completa."""
-    if not current_question_id:
-        logger.debug("_is_last_question: No hay pregunta actual, retornando False")
+    """
+    Cobra el presupuesto de una generación de propuesta si la conversación
+    no tiene ya un trabajo activo. Devuelve True si hay que encolar.
+    """
+    if await proposal_job_service.is_active(conversation.id):
         return False
+    await _enforce_llm_budget(
+        current_user,
+        direct_proposal_generator.estimate_generation_tokens(conversation),
+    )
+    return True
 
-    # Obtener la ruta completa del cuestionario
-    path = metadata.get("questionnaire_path", [])
-    if not path:
-        # Si no existe, construirla
-        logger.debug(f"_is_last_question: Construyendo ruta para {current_question_id}")
-        path = _get_full_questionnaire_path(metadata)
-        metadata["questionnaire_path"] = path
-        logger.debug(
-            f"_is_last_question: Ruta construida: {path} (total: {len(path)} preguntas)"
-        )
 
-    if not path:
-        logger.warning(
-            "_is_last_question: No se pudo obtener ruta de preguntas, retornando False"
-        )
-        return False
+async def _enqueue_proposal_job(
+    current_user: Dict[str, Any], conversation: Conversation
+) -> Dict[str, Any]:
+    """Encola la generación de la propuesta (idempotente por conversación)."""
+    await _reserve_proposal_budget(current_user, conversation)
+    return await proposal_job_service.enqueue(conversation.id, current_user["id"])
 
-    try:
-        # Verificar posición en la ruta
-        current_index = path.index(current_question_id)
-        total_questions = len(path)
-        is_last = current_index == total_questions - 1
 
-        logger.debug(
-            f"_is_last_question: Pregunta {current_question_id} es la #{current_index+1} de {total_questions}"
-        )
+def _pdf_download_filename(conversation: Conversation, conversation_id: str) -> str:
+    """Nombre del archivo PDF que ve el usuario al descargar"""
+    client_name = conversation.metadata.get("client_name", "Cliente")
+    if client_name == "Cliente" and "[" not in client_name:
+        client_name = "Industrias_Agua_Pura"
 
-        if is_last:
-            logger.info(
-                f"¡ÚLTIMA PREGUNTA DETECTADA! ({current_question_id}) - Posición {current_index+1} de {total_questions}"
-            )
-        return is_last
-    except ValueError:
-        logger.warning(
-            f"_is_last_question: ID '{current_question_id}' no encontrado en ruta {path}"
-        )
-        # Si la pregunta no está en la ruta, podríamos estar ante un caso especial
-        # Verificar si es una pregunta final según alguna otra lógica
-        if current_question_id and current_question_id.startswith("FINAL_"):
-            logger.info(
-                f"Detectada pregunta especial de finalización: {current_question_id}"
-            )
-            return True
-        return False
+    # Limpiar el nombre para asegurar que sea válido como nombre de archivo
+    client_name = "".join(
+        c if c.isalnum() or c in "_- " else "_" for c in client_name
+    ).replace(" ", "_")
+
+    return f"Propuesta_Hydrous_{client_name}_{conversation_id[:8]}.pdf"
+
+
+async def _proposal_pdf_available(conversation: Conversation) -> bool:
+    """
+    True si el PDF de la propuesta está en disco o, generado en otro nodo,
+    en el almacenamiento de blobs (metadata["pdf_key"]).
+    """
+    pdf_path = conversation.metadata.get("pdf_path")
+    if pdf_path and os.path.exists(pdf_path):
+        return True
+    pdf_key = conversation.metadata.get("pdf_key")
+    return bool(pdf_key) and await blob_storage.exists(pdf_key)
+
+
+def _proposal_status_url(conversation_id: str) -> str:
+    return f"{settings.BACKEND_URL}{settings.API_V1_STR}/chat/{conversation_id}/proposal/status"
 
 
 def _is_pdf_request(message_content: str) -> bool:
@@ -197,6 +199,8 @@ async def start_conversation(
             "user_email": current_user.get("email"),
             "is_new_conversation": True,  # Indicador de nueva conversación
             "first_interaction": True,  # Para mensaje inicial personalizado
+            # La conversación sigue con esta versión aunque se publique otra
+            "questionnaire_version": questionnaire_service.active_version,
         }
 
         # Log de depuración para verificar metadata
@@ -321,6 +325,7 @@ async def send_message(
             "created_at": conversation.created_at,
         }
     assistant_response_data = None
+    enqueue_proposal = False
 
     try:
         # Get authenticated user
@@ -369,11 +374,12 @@ async def send_message(
             await storage_service.add_message_to_conversation(
                 conversation.id, user_message_obj, db
             )
+            pdf_available = await _proposal_pdf_available(conversation)
 
             # Inteligencia para manejar diferentes estados de la propuesta
 
             # CASO 1: Si la propuesta está lista pero metadatos inconsistentes, arreglar
-            if pdf_path and os.path.exists(pdf_path) and not proposal_ready:
+            if pdf_available and not proposal_ready:
                 logger.info(
                     f"PDF existe pero metadatos inconsistentes. Corrigiendo para {conversation_id}..."
                 )
@@ -383,79 +389,34 @@ async def send_message(
                 db.commit()
                 proposal_ready = True
 
-            # CASO 2: Si tiene señal de "ready_for_proposal" pero no tiene PDF, generar
-            elif (ready_for_proposal and not pdf_path) or (
-                ready_for_proposal and pdf_path and not os.path.exists(pdf_path)
-            ):
+            # CASO 2: Listo para propuesta o completo, pero sin PDF: encolar generación
+            elif (ready_for_proposal or is_complete) and not pdf_available:
                 logger.info(
-                    f"Marcado como listo para propuesta. Generando PDF para {conversation_id}..."
-                )
-                from app.services.direct_proposal_generator import (
-                    direct_proposal_generator,
+                    f"Propuesta pendiente para {conversation_id}. Estado: is_complete={is_complete}, ready_for_proposal={ready_for_proposal}, pdf_path={pdf_path}"
                 )
+                job = await _enqueue_proposal_job(current_user, conversation)
 
-                pdf_path = await direct_proposal_generator.generate_complete_proposal(
-                    conversation
-                )
-                if pdf_path and os.path.exists(pdf_path):
-                    logger.info(f"PDF generado exitosamente: {pdf_path}")
-                    conversation.metadata["pdf_path"] = pdf_path
-                    conversation.metadata["is_complete"] = True
-                    conversation.metadata["has_proposal"] = True
-                    await storage_service.save_conversation(conversation, db)
-                    db.commit()
-                    proposal_ready = True
-
-                    # Recargar conversación para verificar
-                    conversation = await storage_service.get_conversation(
-                        conversation_id, db
-                    )
-                    logger.info(
-                        f"Metadatos después de generar: {conversation.metadata}"
-                    )
-
-            # CASO 3: Si está marcado como completo pero sin PDF, intentar regenerar
-            elif (
-                (is_complete and not proposal_ready)
-                or (is_complete and not pdf_path)
-                or (is_complete and pdf_path and not os.path.exists(pdf_path))
-            ):
-                logger.info(
-                    f"Necesita generar o regenerar PDF para {conversation_id}. Estado: is_complete={is_complete}, proposal_ready={proposal_ready}, pdf_path={pdf_path}"
-                )
-                from app.services.direct_proposal_generator import (
-                    direct_proposal_generator,
-                )
+                response_text = "⏳ Estoy generando tu propuesta. Te avisaré cuando esté lista para descargar."
+                assistant_message = Message.assistant(response_text)
 
-                # Regenerar PDF
-                pdf_path = await direct_proposal_generator.generate_complete_proposal(
-                    conversation
+                await storage_service.add_message_to_conversation(
+                    conversation.id, assistant_message, db
                 )
 
-                if pdf_path and os.path.exists(pdf_path):
-                    logger.info(f"PDF generado exitosamente: {pdf_path}")
-                    # Actualizar metadata explícitamente
-                    conversation.metadata["pdf_path"] = pdf_path
-                    conversation.metadata["is_complete"] = True
-                    conversation.metadata["has_proposal"] = True
-                    await storage_service.save_conversation(conversation, db)
-                    db.commit()
-                    proposal_ready = True
-
-                    # Recargar conversación para verificar
-                    conversation = await storage_service.get_conversation(
-                        conversation_id, db
-                    )
-                    logger.info(
-                        f"Metadatos después de regenerar: {conversation.metadata}"
-                    )
-                else:
-                    logger.error(f"Falló la generación del PDF para {conversation_id}")
+                return {
+                    "id": assistant_message.id,
+                    "message": assistant_message.content,
+                    "conversation_id": conversation_id,
+                    "created_at": assistant_message.created_at,
+                    "action": "proposal_generating",
+                    "job_status": job.get("status"),
+                    "status_url": _proposal_status_url(conversation.id),
+                }
 
             # Verificar nuevamente si tenemos propuesta lista
-            if proposal_ready or (pdf_path and os.path.exists(pdf_path)):
+            if proposal_ready or pdf_available:
                 # Asegurar que todos los metadatos estén consistentes
-                if pdf_path and os.path.exists(pdf_path) and not proposal_ready:
+                if pdf_available and not proposal_ready:
                     conversation.metadata["has_proposal"] = True
                     conversation.metadata["is_complete"] = True
                     await storage_service.save_conversation(conversation, db)
@@ -503,6 +464,12 @@ async def send_message(
             # --- Normal Flow: Continue with questionnaire ---
             logger.info(f"Normal flow for conversation {conversation_id}")
 
+            # Conversaciones anteriores al versionado quedan fijadas a la activa
+            conversation.metadata.setdefault(
+                "questionnaire_version", questionnaire_service.active_version
+            )
+            await questionnaire_versions.pin(conversation.metadata)
+
             # Add user message to history
             await storage_service.add_message_to_conversation(
                 conversation_id, user_message_obj, db
@@ -517,17 +484,35 @@ async def send_message(
                 # Mantenemos is_new_conversation=True para que el asistente sepa que
                 # sigue siendo una conversación nueva aunque ya no sea la primera interacción
 
-            # Save user response immediately
+            # Save user response against the question that was asked
             current_question_id = conversation.metadata.get("current_question_id")
+            # Camino rápido: opción ("2", etiqueta) o sí/no resueltos sin LLM
+            resolved_answer = None
+            use_template = False
+            reask = False
 
             if current_question_id:
-                # Update metadata with the response
-                if "collected_data" not in conversation.metadata:
-                    conversation.metadata["collected_data"] = {}
-
-                conversation.metadata["collected_data"][
-                    current_question_id
-                ] = user_input.strip()
+                resolved_answer = questionnaire_flow.resolve_answer(
+                    current_question_id, user_input, conversation.metadata
+                )
+                reask = not questionnaire_flow.accepts_answer(
+                    current_question_id,
+                    user_input,
+                    conversation.metadata,
+                    resolved_answer,
+                )
+            if reask:
+                # Duda del usuario u opción no reconocida: no se registra y se
+                # vuelve a hacer la misma pregunta
+                logger.info(
+                    f"Respuesta no registrada para {current_question_id}: '{user_input[:100]}'"
+                )
+            elif current_question_id:
+                answer = questionnaire_flow.record_answer(
+                    conversation.metadata,
+                    current_question_id,
+                    resolved_answer or user_input,
+                )
 
                 # Save response summary
                 if "response_summaries" not in conversation.metadata:
@@ -537,7 +522,7 @@ async def send_message(
                     "question": conversation.metadata.get(
                         "current_question_asked_summary", ""
                     ),
-                    "answer": user_input.strip(),
+                    "answer": answer,
                     "timestamp": datetime.utcnow().isoformat(),
                 }
 
@@ -548,28 +533,56 @@ async def send_message(
                 await storage_service.save_conversation(conversation, db)
                 db.commit()  # Force immediate commit
 
-                logger.info(
-                    f"Response saved for {current_question_id}: '{user_input.strip()}'"
-                )
+                logger.info(f"Response saved for {current_question_id}: '{answer}'")
 
             # Reload conversation to ensure latest state
             conversation = await storage_service.get_conversation(conversation_id, db)
 
-            # Check if final answer
-            is_final_answer = _is_last_question(
-                current_question_id, conversation.metadata
+            # El servidor decide la siguiente pregunta (ruta + depends_on)
+            next_question_id = (
+                current_question_id
+                if reask
+                else questionnaire_flow.next_question_id(conversation.metadata)
             )
 
-            if is_final_answer:
-                # Generate proposal
-                logger.info(f"Generando proposal para {conversation_id}")
-                from app.services.direct_proposal_generator import (
-                    direct_proposal_generator,
+            if next_question_id is None and is_complete:
+                # Ya estaba completo ("gracias", "ok"): no se vuelve a encolar
+                # ni a cobrar la propuesta; solo se indica su estado
+                assistant_response_data = {
+                    "conversation_id": conversation_id,
+                }
+                if await _proposal_pdf_available(conversation):
+                    response_text = "Tu propuesta ya está lista. Haz clic para descargarla cuando quieras."
+                    assistant_response_data["action"] = "download_proposal_pdf"
+                    assistant_response_data["download_url"] = (
+                        f"{settings.BACKEND_URL}{settings.API_V1_STR}/chat/{conversation.id}/download-pdf"
+                    )
+                elif await proposal_job_service.is_active(conversation.id):
+                    response_text = "⏳ Sigo generando tu propuesta, te avisaré cuando esté lista para descargar."
+                    assistant_response_data["action"] = "proposal_generating"
+                    assistant_response_data["status_url"] = _proposal_status_url(
+                        conversation.id
+                    )
+                else:
+                    response_text = "El cuestionario está completo. Escribe 'descargar pdf' para generar tu propuesta."
+                assistant_message = Message.assistant(response_text)
+                await storage_service.add_message_to_conversation(
+                    conversation.id, assistant_message, db
+                )
+                assistant_response_data.update(
+                    id=assistant_message.id,
+                    message=assistant_message.content,
+                    created_at=assistant_message.created_at,
                 )
+            elif next_question_id is None:
+                # Generate proposal (solo al pasar a completo)
+                logger.info(f"Generando proposal para {conversation_id}")
 
-                # Intentar generar la propuesta
-                pdf_path = await direct_proposal_generator.generate_complete_proposal(
-                    conversation
+                # Cobrar el presupuesto antes de responder; el trabajo se encola
+                # al final, después de persistir el estado (salvo si ya hay uno
+                # activo)
+                enqueue_proposal = await _reserve_proposal_budget(
+                    current_user, conversation
                 )
 
                 # Actualizar metadata de la conversación
@@ -579,160 +592,62 @@ async def send_message(
                     "Questionnaire Completed"
                 )
 
-                # Verificar que el PDF se generó correctamente
-                if pdf_path and os.path.exists(pdf_path):
-                    logger.info(f"Propuesta generada exitosamente: {pdf_path}")
-                    # Establecer explícitamente que hay una propuesta disponible
-                    conversation.metadata["pdf_path"] = pdf_path
-                    conversation.metadata["has_proposal"] = True
-                    # Guardar inmediatamente para persistir estos cambios
-                    await storage_service.save_conversation(conversation, db)
-                    db.commit()
-
-                    # Generar URL de descarga y respuesta
-                    download_url = f"{settings.BACKEND_URL}{settings.API_V1_STR}/chat/{conversation.id}/download-pdf"
-                    assistant_response_data = {
-                        "id": "proposal-complete-" + str(uuid.uuid4())[:8],
-                        "message": "✅ ¡Propuesta Lista! Escribe 'descargar pdf' para obtener tu documento.",
-                        "conversation_id": conversation_id,
-                        "created_at": datetime.utcnow(),
-                        "action": "proposal_complete",
-                        "download_url": download_url,
-                    }
-
-                    # Añadir mensaje al historial
-                    msg_to_add = Message.assistant(assistant_response_data["message"])
-                    await storage_service.add_message_to_conversation(
-                        conversation.id, msg_to_add, db
-                    )
-                else:
-                    # Manejo de error si no se pudo generar el PDF
-                    logger.error(
-                        f"Error generando PDF para {conversation_id}. Path: {pdf_path}"
-                    )
-                    error_message = "Lo siento, hubo un problema generando la propuesta. Por favor intenta de nuevo."
-                    error_msg = Message.assistant(error_message)
-                    await storage_service.add_message_to_conversation(
-                        conversation.id, error_msg, db
-                    )
-                    assistant_response_data = {
-                        "id": error_msg.id,
-                        "message": error_message,
-                        "conversation_id": conversation_id,
-                        "created_at": error_msg.created_at,
-                    }
+                response_text = "⏳ ¡Cuestionario completo! Estoy generando tu propuesta, te avisaré cuando esté lista para descargar."
+                assistant_message = Message.assistant(response_text)
+                await storage_service.add_message_to_conversation(
+                    conversation.id, assistant_message, db
+                )
+                assistant_response_data = {
+                    "id": assistant_message.id,
+                    "message": assistant_message.content,
+                    "conversation_id": conversation_id,
+                    "created_at": assistant_message.created_at,
+                    "action": "proposal_generating",
+                    "status_url": _proposal_status_url(conversation.id),
+                }
             else:
-                # Continue with questionnaire
-                ai_response_content = await ai_service.handle_conversation(conversation)
-
-                # Detectar si es una propuesta completa que necesita generación de PDF
-                if "[HYDROUS_INTERNAL_MARKER:GENERATE_PROPOSAL]" in ai_response_content:
-                    logger.info(
-                        f"Detectada propuesta completa que requiere generación de PDF para {conversation_id}"
-                    )
-                    # Extraer el texto de la propuesta (ya guardado en metadata)
-                    proposal_text = conversation.metadata.get("proposal_text")
-                    if not proposal_text and len(ai_response_content) > 40:
-                        # Si no está en metadata, extraerlo del marcador
-                        proposal_text = ai_response_content.replace(
-                            "[HYDROUS_INTERNAL_MARKER:GENERATE_PROPOSAL]", ""
+                use_template = (
+                    resolved_answer is not None
+                    and settings.QUESTIONNAIRE_TEMPLATE_FAST_PATH
+                )
+                if use_template:
+                    # Sin llamada al LLM: confirmar y mostrar la pregunta base
+                    ai_response_content = (
+                        f"✅ Anotado: **{resolved_answer}**\n\n"
+                        + questionnaire_flow.format_question(
+                            next_question_id, conversation.metadata
                         )
-                        conversation.metadata["proposal_text"] = proposal_text
-
-                    # Debugging: registrar estado de metadata antes de cambios
-                    logger.info(
-                        f"METADATA ANTES DE GENERAR PDF: is_complete={conversation.metadata.get('is_complete')}, has_proposal={conversation.metadata.get('has_proposal')}, pdf_path={conversation.metadata.get('pdf_path')}"
                     )
-
-                    # Guardar los cambios iniciales a la metadata
-                    await storage_service.save_conversation(conversation, db)
-                    db.commit()
-
-                    # Generar el PDF
-                    from app.services.direct_proposal_generator import (
-                        direct_proposal_generator,
+                else:
+                    # Continue with questionnaire: el LLM solo redacta esta
+                    # pregunta, con los fragmentos de documentos relevantes
+                    document_context = await ai_service.document_context(
+                        conversation, next_question_id
                     )
-
-                    logger.info(
-                        f"Generando PDF para propuesta de conversación {conversation_id}..."
+                    repeated = reask or next_question_id == current_question_id
+                    await _enforce_llm_budget(
+                        current_user,
+                        ai_service.estimate_question_tokens(
+                            conversation, next_question_id, document_context, repeated
+                        ),
                     )
-
-                    pdf_path = (
-                        await direct_proposal_generator.generate_complete_proposal(
-                            conversation
-                        )
+                    ai_response_content = await ai_service.phrase_question(
+                        conversation,
+                        next_question_id,
+                        repeated=repeated,
+                        document_context=document_context,
                     )
 
-                    if pdf_path and os.path.exists(pdf_path):
-                        logger.info(f"PDF generado exitosamente en: {pdf_path}")
-                        # Actualizar metadata explícitamente
-                        conversation.metadata["pdf_path"] = pdf_path
-                        conversation.metadata["is_complete"] = True
-                        conversation.metadata["has_proposal"] = True
-
-                        # Verificar permisos del archivo
-                        try:
-                            os.chmod(pdf_path, 0o644)  # rw-r--r--
-                            logger.info(f"Permisos del PDF establecidos correctamente")
-                        except Exception as perm_err:
-                            logger.warning(
-                                f"No se pudieron establecer permisos en {pdf_path}: {perm_err}"
-                            )
-
-                        # Guardar inmediatamente los cambios
-                        await storage_service.save_conversation(conversation, db)
-                        db.commit()
-
-                        # Volver a cargar la conversación para asegurar que los cambios se guardaron
-                        conversation = await storage_service.get_conversation(
-                            conversation_id, db
-                        )
-
-                        # Verificar que los cambios se guardaron correctamente
-                        logger.info(
-                            f"METADATA DESPUÉS DE GENERAR PDF: is_complete={conversation.metadata.get('is_complete')}, has_proposal={conversation.metadata.get('has_proposal')}, pdf_path={conversation.metadata.get('pdf_path')}"
-                        )
-
-                        # Preparar respuesta para el usuario
-                        download_url = f"{settings.BACKEND_URL}{settings.API_V1_STR}/chat/{conversation.id}/download-pdf"
-                        ai_response_content = "✅ ¡Propuesta Lista! Escribe 'descargar pdf' para obtener tu documento."
-
-                        # Log detallado para seguimiento
-                        logger.info(
-                            f"Propuesta lista para {conversation_id}. URL de descarga: {download_url}"
-                        )
-                    else:
-                        logger.error(
-                            f"❌ Error generando PDF para {conversation_id}. Ruta: {pdf_path}"
-                        )
-                        logger.error(
-                            f"Detalles: proposal_text existe: {bool(proposal_text)}, longitud: {len(proposal_text) if proposal_text else 0}"
-                        )
-                        ai_response_content = "Lo siento, hubo un problema generando la propuesta. Por favor intenta de nuevo."
-
-                # Anti-repetition check
-                new_question_id = None
-                lines = ai_response_content.split("\n")
-                for i, line in enumerate(lines):
-                    if "**QUESTION:**" in line or "**PREGUNTA:**" in line:
-                        new_question_id = f"q_{i}"
-                        break
-
-                # Check if AI is repeating a question
-                if new_question_id and new_question_id in conversation.metadata.get(
-                    "collected_data", {}
-                ):
-                    logger.warning(
-                        f"AI attempted to repeat answered question: {new_question_id}"
-                    )
-                    ai_response_content = (
-                        "I already have your answer to that question. Let me continue with the next one:\n\n"
-                        "**QUESTION:** [Next relevant question from questionnaire]"
-                    )
-
-                # Update current question ID if new
-                if new_question_id and new_question_id != current_question_id:
-                    conversation.metadata["current_question_id"] = new_question_id
+                conversation.metadata["current_question_id"] = next_question_id
+                conversation.metadata["current_question_asked_summary"] = (
+                    questionnaire_service.get_question_text(next_question_id) or ""
+                )[:100]
+                conversation.metadata["is_complete"] = False
+                answered, total = questionnaire_flow.progress(conversation.metadata)
+                conversation.metadata["questionnaire_progress"] = {
+                    "answered": answered,
+                    "total": total,
+                }
 
                 assistant_message = Message.assistant(ai_response_content)
                 await storage_service.add_message_to_conversation(
@@ -744,11 +659,23 @@ async def send_message(
                     "message": assistant_message.content,
                     "conversation_id": conversation_id,
                     "created_at": assistant_message.created_at,
+                    "question_id": next_question_id,
                 }
 
+            if current_question_id:
+                await questionnaire_flow.record_turn(
+                    fast_path=resolved_answer is not None,
+                    llm_skipped=next_question_id is None or use_template,
+                )
+
         # Save final state
         await storage_service.save_conversation(conversation, db)
         db.commit()
+
+        # Encolar la propuesta después de persistir: el worker lee el estado final
+        if enqueue_proposal:
+            await proposal_job_service.enqueue(conversation.id, current_user["id"])
+
         background_tasks.add_task(storage_service.cleanup_old_conversations)
 
         return assistant_response_data
@@ -840,12 +767,43 @@ async def download_pdf(
             f"Estado PDF para descarga: has_proposal={has_proposal}, is_complete={is_complete}, ready_for_proposal={ready_for_proposal}, pdf_path={pdf_path}, proposal_text_len={len(proposal_text) if proposal_text else 0}"
         )
 
+        # PDF eliminado (p. ej. eviction) pero el mismo texto sigue en la caché
+        if (not pdf_path or not os.path.exists(pdf_path)) and proposal_text:
+            cached_pdf_path = direct_proposal_generator.get_cached_pdf(proposal_text)
+            if cached_pdf_path:
+                pdf_path = cached_pdf_path
+                has_proposal = True
+                conversation.metadata["pdf_path"] = pdf_path
+                conversation.metadata["has_proposal"] = True
+                conversation.metadata["is_complete"] = True
+                await storage_service.save_conversation(conversation, db)
+                db.commit()
+
+        # PDF generado en otro nodo: servirlo desde el almacenamiento en lugar
+        # de volver a generarlo
+        pdf_key = conversation.metadata.get("pdf_key")
+        if (not pdf_path or not os.path.exists(pdf_path)) and pdf_key:
+            blob_path = blob_storage.local_path(pdf_key)
+            if blob_path and os.path.exists(blob_path):
+                # Backend local: el blob es el propio archivo
+                pdf_path = blob_path
+                has_proposal = True
+            elif blob_storage.supports_presigned_urls and await blob_storage.exists(
+                pdf_key
+            ):
+                presigned_url = await blob_storage.presigned_url(
+                    pdf_key,
+                    filename=_pdf_download_filename(conversation, conversation_id),
+                    content_type="application/pdf",
+                )
+                logger.info(f"Redirigiendo descarga de {conversation_id} a {pdf_key}")
+                return RedirectResponse(presigned_url, status_code=307)
+
         # Si no existe o metadata inconsistente, intentar regenerarlo
         if not pdf_path or not os.path.exists(pdf_path) or not has_proposal:
             logger.info(
                 f"PDF no existe o metadata inconsistente, regenerando para descarga directa"
             )
-            from app.services.direct_proposal_generator import direct_proposal_generator
 
             # Si ya tenemos texto de propuesta, mejor asegurarnos que esté en la metadata
             if not proposal_text and is_complete:
@@ -859,97 +817,28 @@ async def download_pdf(
                 await storage_service.save_conversation(conversation, db)
                 db.commit()
 
-            logger.info(f"Regenerando PDF bajo demanda para descarga directa...")
-            pdf_path = await direct_proposal_generator.generate_complete_proposal(
-                conversation
+            # La generación corre en el worker: responder 202 con el estado
+            job = await _enqueue_proposal_job(current_user, conversation)
+            return JSONResponse(
+                status_code=202,
+                content={
+                    "status": job.get("status"),
+                    "job_id": job.get("job_id"),
+                    "message": "La propuesta se está generando. Consulta el estado e intenta la descarga de nuevo.",
+                    "status_url": _proposal_status_url(conversation_id),
+                },
             )
 
-            if pdf_path and os.path.exists(pdf_path):
-                logger.info(f"PDF regenerado exitosamente para descarga: {pdf_path}")
-                # Asegurar permisos de archivo correctos
-                try:
-                    os.chmod(pdf_path, 0o644)  # rw-r--r--
-                    logger.info(
-                        f"Permisos del PDF establecidos: {oct(os.stat(pdf_path).st_mode)[-3:]}"
-                    )
-                except Exception as e:
-                    logger.warning(
-                        f"No se pudieron establecer permisos en {pdf_path}: {e}"
-                    )
-
-                # Actualizar la metadata de la conversación con la nueva ruta
-                conversation.metadata["pdf_path"] = pdf_path
-                conversation.metadata["has_proposal"] = True
-                conversation.metadata["is_complete"] = True
-                await storage_service.save_conversation(conversation, db)
-                db.commit()
-
-                # Verificar que se actualizó correctamente
-                updated_conv = await storage_service.get_conversation(
-                    conversation_id, db
-                )
-                logger.info(
-                    f"Metadatos actualizados después de regenerar PDF: has_proposal={updated_conv.metadata.get('has_proposal')}, pdf_path={updated_conv.metadata.get('pdf_path')}"
-                )
-            else:
-                logger.error(
-                    f"Regeneración de PDF falló para descarga directa de {conversation_id}"
-                )
-                raise HTTPException(
-                    status_code=500,
-                    detail="No se pudo generar el PDF. Intente nuevamente.",
-                )
-
-        # Verificar si el archivo existe después de todo
-        if not os.path.exists(pdf_path):
-            logger.error(f"PDF no encontrado en el sistema de archivos: {pdf_path}")
-            raise HTTPException(
-                status_code=404,
-                detail="El archivo PDF no fue encontrado en el servidor",
-            )
-
-        # Verificar permisos de lectura
-        if not os.access(pdf_path, os.R_OK):
-            logger.error(f"Permisos insuficientes para leer el PDF: {pdf_path}")
-            try:
-                logger.warning(f"Intentando corregir permisos de archivo para lectura")
-                os.chmod(pdf_path, 0o644)  # rw-r--r--
-            except Exception as e:
-                logger.error(f"No se pudieron corregir permisos: {e}")
-                raise HTTPException(
-                    status_code=500,
-                    detail="Error de permisos al acceder al archivo PDF",
-                )
-
-        # Preparar nombre personalizado
-        client_name = conversation.metadata.get("client_name", "Cliente")
-        if client_name == "Cliente" and "[" not in client_name:
-            client_name = "Industrias_Agua_Pura"
-
-        # Limpiar el nombre para asegurar que sea válido como nombre de archivo
-        client_name = "".join(
-            c if c.isalnum() or c in "_- " else "_" for c in client_name
-        ).replace(" ", "_")
-
-        # Generar nombre de archivo
-        filename = f"Propuesta_Hydrous_{client_name}_{conversation_id[:8]}.pdf"
+        filename = _pdf_download_filename(conversation, conversation_id)
         logger.info(f"Enviando archivo PDF: {filename} desde {pdf_path}")
 
-        # Verificar tamaño del archivo antes de enviarlo
-        try:
-            file_size = os.path.getsize(pdf_path)
-            logger.info(f"Tamaño del archivo PDF: {file_size} bytes")
-            if file_size == 0:
-                logger.error(f"PDF tiene tamaño cero: {pdf_path}")
-                raise HTTPException(status_code=500, detail="El archivo PDF está vacío")
-        except OSError as e:
-            logger.error(f"Error al obtener tamaño del archivo: {e}")
-
-        return FileResponse(
-            path=pdf_path,
-            filename=filename,
+        # ETag del contenido, 304 si el cliente ya lo tiene y 206 para Range
+        return await conditional_file_response(
+            request,
+            pdf_path,
+            filename,
             media_type="application/pdf",
-            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+            max_age=settings.PDF_DOWNLOAD_MAX_AGE,
         )
     except HTTPException as http_exc:
         logger.error(f"Error HTTP en descarga PDF: {http_exc.detail}")
@@ -1009,6 +898,7 @@ async def diagnose_conversation(
 
         # Intentar reparar inconsistencias
         reparaciones = []
+        enqueue_proposal = False
 
         # Si está marcada como completa pero no tiene propuesta
         if conversation.metadata.get(
@@ -1018,19 +908,12 @@ async def diagnose_conversation(
                 "Conversación marcada como completa sin propuesta generada"
             )
 
-            # Intentar generar propuesta
-            from app.services.direct_proposal_generator import direct_proposal_generator
-
-            pdf_path = await direct_proposal_generator.generate_complete_proposal(
-                conversation
-            )
-
-            if pdf_path and os.path.exists(pdf_path):
-                conversation.metadata["pdf_path"] = pdf_path
-                conversation.metadata["has_proposal"] = True
-                reparaciones.append(f"Propuesta generada correctamente en {pdf_path}")
+            # Encolar la generación (después de guardar los cambios)
+            if await _reserve_proposal_budget(current_user, conversation):
+                enqueue_proposal = True
+                reparaciones.append("Generación de propuesta encolada")
             else:
-                reparaciones.append("No se pudo generar la propuesta automáticamente")
+                reparaciones.append("Ya hay una generación de propuesta en curso")
 
         # Si tiene ruta de PDF pero no está marcada como lista
         elif conversation.metadata.get("pdf_path") and not conversation.metadata.get(
@@ -1052,6 +935,9 @@ async def diagnose_conversation(
             await storage_service.save_conversation(conversation, db)
             db.commit()
 
+        if enqueue_proposal:
+            await proposal_job_service.enqueue(conversation.id, current_user["id"])
+
         # Recopilar estado final
         estado_final = {
             "is_complete": conversation.metadata.get("is_complete", False),
@@ -1083,3 +969,59 @@ async def diagnose_conversation(
         raise HTTPException(
             status_code=500, detail=f"Error en diagnóstico: {str(e)[:100]}"
         )
+
+
+@router.get("/{conversation_id}/proposal/status")
+async def get_proposal_status(
+    request: Request,
+    conversation_id: str,
+    db: Session = Depends(get_db),
+):
+    """Estado de la generación de la propuesta de una conversación."""
+    current_user = get_current_user(request)
+
+    try:
+        conversation_uuid = UUID(conversation_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Conversación no encontrada")
+
+    # Verificar propiedad
+    db_conversation = conversation_repository.get(db, conversation_uuid)
+    if not db_conversation or str(db_conversation.user_id) != current_user["id"]:
+        raise HTTPException(
+            status_code=403,
+            detail="No tienes permisos para consultar esta conversación",
+        )
+
+    job = await proposal_job_service.get_status(conversation_id)
+    # Disco local o, generado en otro nodo, almacenamiento de blobs (como
+    # download_pdf), aunque el estado del trabajo ya haya expirado
+    conversation = await storage_service.get_conversation(conversation_id, db)
+    pdf_ready = bool(
+        db_conversation.has_proposal
+        and conversation is not None
+        and await _proposal_pdf_available(conversation)
+    )
+
+    if job and job.get("status") in proposal_job_service.ACTIVE_STATUSES:
+        status = job["status"]
+    elif pdf_ready:
+        status = "completed"
+    elif job:
+        status = job.get("status")
+    else:
+        status = "not_started"
+
+    response = {
+        "conversation_id": conversation_id,
+        "status": status,
+        "job_id": job.get("job_id") if job else None,
+        "attempts": job.get("attempts", 0) if job else 0,
+        "error": (job.get("error") or None) if job else None,
+        "has_proposal": pdf_ready,
+    }
+    if status == "completed":
+        response["download_url"] = (
+            f"{settings.BACKEND_URL}{settings.API_V1_STR}/chat/{conversation_id}/download-pdf"
+        )
+    return response
@@ -9,6 +9,7 @@ from datetime import datetime
 from app.db.base import get_db
 from app.repositories.conversation_repository import conversation_repository
 from app.routes.chat import get_current_user
+from app.services.document_service import document_service
 
 router = APIRouter()
 
@@ -86,6 +87,12 @@ async def delete_conversation(
             detail="No tienes permisos para eliminar esta conversación"
         )
     
+    # Archivos de sus documentos (compartidos por contenido con otras subidas)
+    stored_file_ids = [
+        doc.stored_file_id for doc in db_conversation.documents if doc.stored_file_id
+    ]
+
     # Eliminar conversación
-    conversation_repository.remove(db, id=UUID(conversation_id))
+    if conversation_repository.remove(db, id=UUID(conversation_id)):
+        await document_service.release_stored_files(stored_file_ids)
     return {"status": "success"}
\ No newline at end of file
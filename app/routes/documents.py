@@ -1,56 +1,163 @@
 # app/routes/documents.py
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    UploadFile,
+    File,
+    Form,
+    HTTPException,
+    Depends,
+)
 import logging
-from typing import Optional
+from typing import Any, Dict, Optional
+from sqlalchemy.orm import Session
 
+from app.db.base import get_db
 from app.models.message import Message
-from app.services.document_service import document_service
+from app.routes.chat import _enforce_llm_budget, get_current_user
+from app.services.document_extraction import document_extraction_service
+from app.services.document_service import DocumentUploadError, document_service
+from app.services.lab_analysis import lab_analysis_service
 from app.services.storage_service import storage_service
 from app.services.ai_service import ai_service
+from app.services.questionnaire_flow import questionnaire_flow
+from app.services.questionnaire_service import questionnaire_service
+from app.services.questionnaire_versions import questionnaire_versions
 
 router = APIRouter()
 
 
 @router.post("/upload")
 async def upload_document(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     conversation_id: str = Form(...),
     message: Optional[str] = Form(None),
+    db: Session = Depends(get_db),
+    current_user: Dict[str, Any] = Depends(get_current_user),
 ):
     """Sube un documento y lo procesa"""
     try:
         # Verificar que la conversación existe
-        conversation = await storage_service.get_conversation(conversation_id)
+        conversation = await storage_service.get_conversation(conversation_id, db)
         if not conversation:
             raise HTTPException(status_code=404, detail="Conversación no encontrada")
 
         # Procesar el documento
         doc_info = await document_service.process_document(file, conversation_id)
 
+        # La extracción de texto corre en segundo plano (pool de procesos) y
+        # rellena processed_text poco a poco; la conversación no la espera.
+        # Si el mismo archivo ya se subió y extrajo, se reutiliza; si otra
+        # subida lo está extrayendo, se espera su resultado y se copia
+        if doc_info["extraction_reused"]:
+            extraction_status = "reused"
+            await document_extraction_service.mark_reused(doc_info["id"])
+        elif document_extraction_service.can_extract(doc_info["content_type"]):
+            extraction_status = "queued"
+            await document_extraction_service.mark_queued(doc_info["id"])
+            extract = (
+                document_extraction_service.extract_document
+                if await document_extraction_service.claim_extraction(doc_info["id"])
+                else document_extraction_service.reuse_extraction
+            )
+            background_tasks.add_task(
+                extract,
+                doc_info["id"],
+                doc_info["file_path"],
+                doc_info["content_type"],
+                doc_info["filename"],
+            )
+        else:
+            extraction_status = "skipped"
+
+        await questionnaire_versions.pin(conversation.metadata)
+
+        # Análisis de laboratorio (XLSX/CSV): los parámetros van directo a
+        # collected_data y el cuestionario ya no los pregunta
+        lab_results = await lab_analysis_service.analyze(
+            doc_info["file_path"], doc_info["content_type"]
+        )
+        lab_answered = lab_analysis_service.apply(
+            conversation.metadata, lab_results, file.filename
+        )
+        lab_summary = lab_analysis_service.summary(lab_results)
+
         # Crear mensaje del usuario con referencia al documento
         user_message_content = message or f"[He subido un documento: {file.filename}]"
         user_message = Message.user(user_message_content)
-        await storage_service.add_message_to_conversation(conversation_id, user_message)
+        await storage_service.add_message_to_conversation(
+            conversation_id, user_message, db
+        )
 
         # Generar respuesta basada en el documento
         doc_summary = document_service.format_document_info_for_prompt(doc_info)
+        if lab_summary:
+            doc_summary += f"\nParámetros del análisis de laboratorio:\n{lab_summary}"
         system_message = Message.system(
             f"El usuario ha subido un documento. Aquí está la información extraída:\n{doc_summary}\n"
             "Por favor, reconoce el documento subido y continúa con el cuestionario."
         )
         await storage_service.add_message_to_conversation(
-            conversation_id, system_message
+            conversation_id, system_message, db
         )
 
-        # Obtener respuesta del LLM
-        ai_response = await ai_service.handle_conversation(
-            conversation, f"He subido un documento: {file.filename}. {message or ''}"
+        # El documento responde a la pregunta de subida de análisis en curso
+        current_question_id = conversation.metadata.get("current_question_id")
+        question = (
+            questionnaire_service.get_question_details(current_question_id)
+            if current_question_id
+            else None
         )
+        if question is not None and question.type == "document_upload":
+            questionnaire_flow.record_answer(
+                conversation.metadata,
+                current_question_id,
+                f"[Documento: {file.filename}] {message or ''}",
+            )
+            conversation.metadata["last_answered_question_id"] = current_question_id
+
+        # Siguiente pregunta elegida por el servidor; el LLM solo la redacta
+        next_question_id = questionnaire_flow.next_question_id(conversation.metadata)
+        if next_question_id:
+            document_context = await ai_service.document_context(
+                conversation, next_question_id
+            )
+            try:
+                await _enforce_llm_budget(
+                    current_user,
+                    ai_service.estimate_question_tokens(
+                        conversation, next_question_id, document_context
+                    ),
+                )
+                ai_response = await ai_service.phrase_question(
+                    conversation, next_question_id, document_context=document_context
+                )
+            except HTTPException as e:
+                if e.status_code != 429:
+                    raise
+                # Sin presupuesto de IA: el documento ya se guardó, la
+                # siguiente pregunta se muestra sin LLM
+                ai_response = questionnaire_flow.format_question(
+                    next_question_id, conversation.metadata
+                )
+            conversation.metadata["current_question_id"] = next_question_id
+            conversation.metadata["current_question_asked_summary"] = (
+                questionnaire_service.get_question_text(next_question_id) or ""
+            )[:100]
+        else:
+            ai_response = "Documento recibido. El cuestionario está completo: escribe 'continuar' para generar tu propuesta."
+        if lab_summary:
+            ai_response = (
+                f"📊 **Valores tomados de tu análisis ({file.filename}):**\n{lab_summary}\n\n"
+                + ai_response
+            )
+        await storage_service.save_conversation(conversation, db)
 
         # Añadir respuesta del asistente
         assistant_message = Message.assistant(ai_response)
         await storage_service.add_message_to_conversation(
-            conversation_id, assistant_message
+            conversation_id, assistant_message, db
         )
 
         return {
@@ -58,8 +165,26 @@ async def upload_document(
             "conversation_id": conversation_id,
             "message": ai_response,
             "document_id": doc_info["id"],
+            "extraction_status": extraction_status,
+            "lab_parameters": sorted(lab_results),
+            "answered_question_ids": lab_answered,
             "created_at": assistant_message.created_at,
         }
+    except HTTPException:
+        raise
+    except DocumentUploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         logging.error(f"Error al subir documento: {str(e)}")
         raise HTTPException(status_code=500, detail="Error al procesar el documento")
+
+
+@router.get("/{document_id}/extraction")
+async def get_extraction_progress(document_id: str):
+    """Progreso de la extracción de texto de un documento"""
+    progress = await document_extraction_service.get_progress(document_id)
+    if progress is None:
+        raise HTTPException(
+            status_code=404, detail="Extracción no encontrada para el documento"
+        )
+    return {"document_id": document_id, **progress}
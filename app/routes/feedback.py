@@ -1,12 +1,13 @@
 # app/routes/feedback.py
 from fastapi import APIRouter, HTTPException
 import logging
-import os
 import json
 from datetime import datetime
 from pydantic import BaseModel
 from typing import Optional
 
+from app.core.blob_storage import blob_storage
+
 router = APIRouter()
 logger = logging.getLogger("hydrous")
 
@@ -20,9 +21,8 @@ class FeedbackModel(BaseModel):
     comment: Optional[str] = None
 
 
-# Directorio para almacenar retroalimentación
-FEEDBACK_DIR = os.path.join("uploads", "feedback")
-os.makedirs(FEEDBACK_DIR, exist_ok=True)
+# Prefijo de la retroalimentación en el almacenamiento de blobs
+FEEDBACK_PREFIX = "feedback"
 
 
 @router.post("/submit")
@@ -44,10 +44,12 @@ async def submit_feedback(feedback: FeedbackModel):
             "timestamp": datetime.now().isoformat(),
         }
 
-        # Guardar en archivo JSON
-        feedback_file = os.path.join(FEEDBACK_DIR, f"{feedback_id}.json")
-        with open(feedback_file, "w", encoding="utf-8") as f:
-            json.dump(feedback_data, f, ensure_ascii=False, indent=2)
+        # Guardar como JSON
+        await blob_storage.put_bytes(
+            f"{FEEDBACK_PREFIX}/{feedback_id}.json",
+            json.dumps(feedback_data, ensure_ascii=False, indent=2).encode("utf-8"),
+            "application/json",
+        )
 
         return {
             "status": "success",
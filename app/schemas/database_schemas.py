@@ -130,3 +130,38 @@ class DocumentDB(DocumentBase):
 
     class Config:
         from_attributes = True
+
+
+# Esquemas para StoredFile
+class StoredFileBase(BaseModel):
+    sha256: str
+    size: int
+    content_type: Optional[str] = None
+    blob_key: str
+
+
+class StoredFileCreate(StoredFileBase):
+    pass
+
+
+class StoredFileUpdate(BaseModel):
+    blob_status: Optional[str] = None
+    extraction_status: Optional[str] = None
+    extraction_started_at: Optional[datetime] = None
+    processed_text: Optional[str] = None
+
+
+# Esquemas para DocumentChunk
+class DocumentChunkBase(BaseModel):
+    chunk_index: int
+    content: str
+
+
+class DocumentChunkCreate(DocumentChunkBase):
+    document_id: UUID
+    conversation_id: UUID
+    embedding: List[float]
+
+
+class DocumentChunkUpdate(DocumentChunkBase):
+    pass
@@ -209,6 +209,11 @@ class AuthService:
             # Añadir token a blacklist
             await blacklist_service.add_to_blacklist(token)
 
+            # Quitar la sesión del índice del usuario
+            jti = self._get_token_jti(token)
+            if jti:
+                await blacklist_service.remove_user_session(user_id, jti)
+
             logger.info(f"Logout exitoso para usuario {user_id}")
             return True
 
@@ -241,6 +246,35 @@ class AuthService:
             logger.error(f"Error en logout masivo: {e}")
             return False
     
+    async def register_session(
+        self, token: str, user_id: str, device_info: Optional[Dict[str, Any]] = None
+    ) -> Optional[str]:
+        """
+        Registra el token como sesión activa del usuario (login/registro).
+
+        Sin este registro, logout_all_devices no tiene sesiones que invalidar.
+
+        Args:
+            token: JWT recién emitido
+            user_id: ID del usuario
+            device_info: Datos del cliente (user agent, IP)
+
+        Returns:
+            str: ID de la sesión (jti) o None si falla
+        """
+        try:
+            decoded = jwt.decode(token, options={"verify_signature": False})
+            session_id = await blacklist_service.add_user_session(
+                str(user_id),
+                {"jti": decoded.get("jti"), "exp": decoded.get("exp")},
+                device_info or {},
+            )
+            return session_id or None
+        except Exception as e:
+            # Un fallo aquí no debe impedir el login
+            logger.error(f"Error registrando sesión: {e}")
+            return None
+
     def _get_token_jti(self, token: str) -> Optional[str]:
         """Extrae el jti de un token sin verificar la firma"""
         try:
@@ -1,11 +1,11 @@
-import redis.asyncio as redis
 import json
+import time
 import logging
 from datetime import datetime, timedelta
 from typing import Optional
 import jwt
 
-from app.config import settings
+from app.core.redis_manager import redis_manager
 
 logger = logging.getLogger("hydrous")
 
@@ -26,17 +26,16 @@ class TokenBlacklistService:
     """
 
     def __init__(self):
-        # Configuración de Redis
-        redis_url = (
-            settings.REDIS_URL
-            if hasattr(settings, "REDIS_URL")
-            else "redis://localhost:6379"
-        )
-        self.redis_client = redis.Redis.from_url(redis_url, decode_responses=True)
-
         # Prefijos para diferentes tipos de claves
         self.BLACKLIST_PREFIX = "blacklist:"
         self.USER_SESSIONS_PREFIX = "user_sessions:"
+        # Índice por usuario: sorted set de jti con score = expiración
+        self.USER_SESSIONS_INDEX_PREFIX = "user_sessions_index:"
+
+    @property
+    def redis_client(self):
+        """Cliente Redis compartido (pool del RedisManager)"""
+        return redis_manager.client
 
     async def add_to_blacklist(self, token: str) -> bool:
         """
@@ -132,6 +131,9 @@ class TokenBlacklistService:
         """
         Registra una sesión activa de usuario.
 
+        Además de la clave de la sesión, se añade su jti al índice del usuario
+        (sorted set con score = expiración) para no tener que hacer SCAN.
+
         Args:
             user_id: ID del usuario
             token_data: Información del token (jti, exp, etc.)
@@ -147,6 +149,7 @@ class TokenBlacklistService:
             )
 
             session_key = f"{self.USER_SESSIONS_PREFIX}{user_id}:{session_id}"
+            index_key = f"{self.USER_SESSIONS_INDEX_PREFIX}{user_id}"
 
             session_data = {
                 "session_id": session_id,
@@ -161,10 +164,19 @@ class TokenBlacklistService:
             }
 
             # TTL basado en la expiración del token
-            ttl = token_data.get("exp", 0) - datetime.utcnow().timestamp()
-            ttl = max(0, int(ttl)) if ttl > 0 else 86400  # 1 día por defecto
-
-            await self.redis_client.setex(session_key, ttl, json.dumps(session_data))
+            # (exp es epoch UTC: comparar con time.time(), no con utcnow())
+            ttl = token_data.get("exp", 0) - time.time()
+            ttl = max(1, int(ttl)) if ttl > 0 else 86400  # 1 día por defecto
+            expires_at_ts = int(time.time()) + ttl
+
+            # Sesión + índice en un solo round trip
+            pipe = self.redis_client.pipeline(transaction=True)
+            pipe.setex(session_key, ttl, json.dumps(session_data))
+            pipe.zadd(index_key, {session_id: expires_at_ts})
+            # El índice vive tanto como su sesión más larga
+            pipe.expire(index_key, ttl, nx=True)
+            pipe.expire(index_key, ttl, gt=True)
+            await pipe.execute()
 
             return session_id
 
@@ -172,12 +184,60 @@ class TokenBlacklistService:
             logger.error(f"Error añadiendo sesión de usuario: {e}")
             return ""
 
+    async def remove_user_session(self, user_id: str, session_id: str) -> bool:
+        """
+        Elimina una sesión del usuario (logout de un solo dispositivo).
+
+        Args:
+            user_id: ID del usuario
+            session_id: ID de la sesión (jti del token)
+
+        Returns:
+            bool: True si se eliminó
+        """
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.delete(f"{self.USER_SESSIONS_PREFIX}{user_id}:{session_id}")
+            pipe.zrem(f"{self.USER_SESSIONS_INDEX_PREFIX}{user_id}", session_id)
+            await pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error eliminando sesión de usuario: {e}")
+            return False
+
+    async def _get_indexed_sessions(self, user_id: str) -> list:
+        """
+        Lee el índice de sesiones del usuario.
+
+        Las entradas expiradas se eliminan aquí mismo (GC perezoso) en el
+        mismo round trip que la lectura.
+
+        Returns:
+            list: [(session_id, expires_at_ts), ...] de sesiones no expiradas
+        """
+        index_key = f"{self.USER_SESSIONS_INDEX_PREFIX}{user_id}"
+        now = int(time.time())
+
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.zremrangebyscore(index_key, "-inf", now)
+        pipe.zrange(index_key, 0, -1, withscores=True)
+        removed, entries = await pipe.execute()
+
+        if removed:
+            logger.debug(
+                f"GC de índice de sesiones: {removed} entradas expiradas para usuario {user_id}"
+            )
+        return [(session_id, int(score)) for session_id, score in entries]
+
     async def invalidate_user_sessions(
         self, user_id: str, exclude_session: Optional[str] = None
     ) -> int:
         """
         Invalida todas las sesiones de un usuario (logout masivo).
 
+        Cada jti indexado se añade a la blacklist con el TTL restante de su
+        token, y se borran sesión e índice, todo en un único pipeline.
+
         Args:
             user_id: ID del usuario
             exclude_session: ID de sesión a excluir (para logout de otros dispositivos)
@@ -186,25 +246,37 @@ class TokenBlacklistService:
             int: Número de sesiones invalidadas
         """
         try:
-            # Buscar todas las sesiones del usuario
-            pattern = f"{self.USER_SESSIONS_PREFIX}{user_id}:*"
-            sessions = []
-
-            async for key in self.redis_client.scan_iter(pattern):
-                if exclude_session and key.endswith(f":{exclude_session}"):
-                    continue
-                sessions.append(key)
-
-            # Obtener datos de sesiones para añadir tokens a blacklist
-            invalidated = 0
-            for session_key in sessions:
-                session_data = await self.redis_client.get(session_key)
-                if session_data:
-                    session_info = json.loads(session_data)
-                    # Aquí añadiríamos el token a blacklist si lo tuviéramos almacenado
-                    await self.redis_client.delete(session_key)
-                    invalidated += 1
-
+            sessions = [
+                (session_id, expires_at)
+                for session_id, expires_at in await self._get_indexed_sessions(user_id)
+                if session_id != exclude_session
+            ]
+            if not sessions:
+                logger.info(f"Sin sesiones que invalidar para usuario {user_id}")
+                return 0
+
+            now = int(time.time())
+            invalidated_at = datetime.utcnow().isoformat()
+            index_key = f"{self.USER_SESSIONS_INDEX_PREFIX}{user_id}"
+
+            pipe = self.redis_client.pipeline(transaction=False)
+            for session_id, expires_at in sessions:
+                pipe.setex(
+                    f"{self.BLACKLIST_PREFIX}{session_id}",
+                    max(1, expires_at - now),
+                    json.dumps(
+                        {
+                            "invalidated_at": invalidated_at,
+                            "user_id": user_id,
+                            "reason": "logout_all",
+                        }
+                    ),
+                )
+                pipe.delete(f"{self.USER_SESSIONS_PREFIX}{user_id}:{session_id}")
+            pipe.zrem(index_key, *[session_id for session_id, _ in sessions])
+            await pipe.execute()
+
+            invalidated = len(sessions)
             logger.info(f"Invalidadas {invalidated} sesiones para usuario {user_id}")
             return invalidated
 
@@ -223,13 +295,29 @@ class TokenBlacklistService:
             list: Lista de sesiones activas
         """
         try:
-            pattern = f"{self.USER_SESSIONS_PREFIX}{user_id}:*"
-            sessions = []
+            indexed = await self._get_indexed_sessions(user_id)
+            if not indexed:
+                return []
 
-            async for key in self.redis_client.scan_iter(pattern):
-                session_data = await self.redis_client.get(key)
+            session_keys = [
+                f"{self.USER_SESSIONS_PREFIX}{user_id}:{session_id}"
+                for session_id, _ in indexed
+            ]
+            values = await self.redis_client.mget(session_keys)
+
+            sessions = []
+            stale = []
+            for (session_id, _), session_data in zip(indexed, values):
                 if session_data:
                     sessions.append(json.loads(session_data))
+                else:
+                    stale.append(session_id)
+
+            # Entradas cuyo dato de sesión ya no existe: limpiar perezosamente
+            if stale:
+                await self.redis_client.zrem(
+                    f"{self.USER_SESSIONS_INDEX_PREFIX}{user_id}", *stale
+                )
 
             return sessions
 
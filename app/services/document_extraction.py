@@ -0,0 +1,433 @@
+"""
+Extracción de texto de documentos subidos (PDF, DOCX, XLSX, CSV/TXT).
+
+- Corre en un pool de procesos (document_extraction_pool): PyPDF2/openpyxl
+  son CPU-bound y no deben bloquear el event loop
+- Los PDF se reparten en lotes de páginas y los XLSX por hoja; los lotes se
+  extraen en paralelo (como mucho DOCUMENT_EXTRACTION_WORKERS a la vez) y
+  se guardan en orden en Document.processed_text a medida que terminan, así
+  el texto parcial está disponible enseguida
+- Límite de tiempo por lote (timeout del pool) y por archivo
+  (DOCUMENT_EXTRACTION_TIMEOUT): si se agota se conserva lo extraído
+- El progreso se publica en Redis (document_extraction:{id}); la subida
+  responde de inmediato y el chat continúa mientras tanto
+- Al terminar, el texto se indexa en fragmentos con embeddings
+  (document_retrieval_service) para el contexto de los prompts y se guarda
+  en el archivo (StoredFile) para reutilizarlo si se vuelve a subir
+- Solo una subida de cada archivo lo extrae (StoredFile "extracting"); las
+  que llegan mientras tanto esperan su resultado y lo copian
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.config import settings
+from app.core.blob_storage import blob_storage
+from app.core.process_pool import document_extraction_pool
+from app.core.redis_manager import redis_manager
+from app.repositories.document_chunk_repository import document_chunk_repository
+from app.repositories.document_repository import document_repository
+from app.repositories.stored_file_repository import stored_file_repository
+from app.repositories.unit_of_work import unit_of_work
+from app.services.document_retrieval import document_retrieval_service
+
+logger = logging.getLogger("hydrous")
+
+# content-type → extractor
+EXTRACTABLE_TYPES = {
+    "application/pdf": "pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": "xlsx",
+    "text/csv": "text",
+    "text/plain": "text",
+}
+
+# Páginas de PDF por tarea del pool
+PDF_PAGES_PER_TASK = 10
+
+# Extracciones que otros documentos del mismo archivo pueden reutilizar
+REUSABLE_STATUSES = ("completed",)
+
+# Segundos entre consultas al esperar la extracción de otra subida
+EXTRACTION_POLL_INTERVAL = 2
+
+
+def document_text(filename: str, text: str) -> str:
+    """processed_text de un documento a partir del texto extraído"""
+    return f"Contenido extraído de {filename}:\n\n{text}"
+
+
+# --- Funciones que corren en los procesos del pool (picklables) ---
+
+
+def count_units(path: str, kind: str) -> int:
+    """Páginas (PDF) u hojas (XLSX) del documento; 1 para el resto"""
+    if kind == "pdf":
+        from PyPDF2 import PdfReader
+
+        return len(PdfReader(path).pages)
+    if kind == "xlsx":
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            return len(workbook.sheetnames)
+        finally:
+            workbook.close()
+    return 1
+
+
+def extract_units(path: str, kind: str, start: int, stop: int, max_chars: int) -> str:
+    """Texto de las páginas/hojas [start, stop) (como mucho max_chars)"""
+    parts: List[str] = []
+    if kind == "pdf":
+        from PyPDF2 import PdfReader
+
+        pages = PdfReader(path).pages
+        for number in range(start, min(stop, len(pages))):
+            text = (pages[number].extract_text() or "").strip()
+            if text:
+                parts.append(f"[Página {number + 1}]\n{text}")
+    elif kind == "xlsx":
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            for name in workbook.sheetnames[start:stop]:
+                rows = []
+                size = 0
+                for row in workbook[name].iter_rows(values_only=True):
+                    cells = ["" if value is None else str(value) for value in row]
+                    if any(cells):
+                        line = "\t".join(cells).rstrip()
+                        rows.append(line)
+                        size += len(line)
+                        if size >= max_chars:
+                            break
+                parts.append(f"[Hoja: {name}]\n" + "\n".join(rows))
+        finally:
+            workbook.close()
+    elif kind == "docx":
+        import docx
+
+        document = docx.Document(path)
+        parts.extend(p.text for p in document.paragraphs if p.text.strip())
+        for table in document.tables:
+            for row in table.rows:
+                parts.append("\t".join(cell.text.strip() for cell in row.cells))
+    else:
+        with open(path, "rb") as f:
+            data = f.read(max_chars * 4)
+        try:
+            parts.append(data.decode("utf-8"))
+        except UnicodeDecodeError:
+            parts.append(data.decode("latin-1"))
+
+    return "\n\n".join(parts)[:max_chars]
+
+
+class DocumentExtractionService:
+    """Extrae el texto de los documentos en segundo plano"""
+
+    def __init__(self):
+        self.PROGRESS_PREFIX = "document_extraction:"
+        self.PROGRESS_TTL = 24 * 3600
+        self.max_chars = settings.DOCUMENT_TEXT_MAX_CHARS
+        self.timeout = settings.DOCUMENT_EXTRACTION_TIMEOUT
+        # Una marca "extracting" más antigua es de un proceso que murió
+        # (extracción más indexación con margen)
+        self.claim_ttl = self.timeout + 600
+
+    def can_extract(self, content_type: Optional[str]) -> bool:
+        return self._kind(content_type) is not None
+
+    def _kind(self, content_type: Optional[str]) -> Optional[str]:
+        return EXTRACTABLE_TYPES.get((content_type or "").split(";")[0].strip())
+
+    async def _set_progress(self, document_id: str, **fields: Any):
+        key = f"{self.PROGRESS_PREFIX}{document_id}"
+        fields["updated_at"] = time.time()
+        try:
+            pipe = redis_manager.pipeline()
+            pipe.hset(key, mapping={k: str(v) for k, v in fields.items()})
+            pipe.expire(key, self.PROGRESS_TTL)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"No se pudo guardar el progreso de {document_id}: {e}")
+
+    async def mark_queued(self, document_id: str):
+        """Registra la extracción como pendiente (antes de la tarea de fondo)"""
+        await self._set_progress(document_id, status="queued", done=0, total=0)
+
+    async def mark_reused(self, document_id: str):
+        """Registra la extracción reutilizada de otra subida del mismo archivo"""
+        await self._set_progress(document_id, status="completed", reused=1)
+
+    async def get_progress(self, document_id: str) -> Optional[Dict[str, Any]]:
+        """Estado de la extracción (status, done, total), None si no existe"""
+        try:
+            progress = await redis_manager.client.hgetall(
+                f"{self.PROGRESS_PREFIX}{document_id}"
+            )
+        except Exception as e:
+            logger.error(f"Error leyendo progreso de extracción {document_id}: {e}")
+            return None
+        if not progress:
+            return None
+        for field in ("done", "total", "chars", "chunks", "reused"):
+            if field in progress:
+                progress[field] = int(progress[field])
+        return progress
+
+    def _save_text(self, document_id: str, processed_text: str):
+        with unit_of_work() as db:
+            document_repository.update_processed_text(
+                db, document_id=uuid.UUID(document_id), processed_text=processed_text
+            )
+
+    def _save_stored_file(
+        self, document_id: str, status: str, text: Optional[str]
+    ):
+        with unit_of_work() as db:
+            stored_file_repository.save_extraction(
+                db,
+                document_id=uuid.UUID(document_id),
+                status=status,
+                processed_text=text,
+            )
+
+    def _claim(self, document_id: str) -> bool:
+        with unit_of_work() as db:
+            return stored_file_repository.claim_extraction(
+                db,
+                document_id=uuid.UUID(document_id),
+                stale_before=datetime.now(timezone.utc).replace(tzinfo=None)
+                - timedelta(seconds=self.claim_ttl),
+            )
+
+    def _copy_extraction(self, document_id: str, filename: str) -> Optional[int]:
+        """
+        Copia al documento el texto y los fragmentos de la extracción del
+        archivo; None si todavía no hay una reutilizable.
+        """
+        with unit_of_work() as db:
+            stored_file = stored_file_repository.get_by_document(
+                db, uuid.UUID(document_id)
+            )
+            if (
+                stored_file is None
+                or stored_file.extraction_status not in REUSABLE_STATUSES
+            ):
+                return None
+            document = document_repository.get(db, uuid.UUID(document_id))
+            if document is None:
+                return None
+            document.processed_text = document_text(
+                filename, stored_file.processed_text or ""
+            )
+            return document_chunk_repository.copy_from_stored_file(
+                db, document=document
+            )
+
+    async def claim_extraction(self, document_id: str) -> bool:
+        """
+        Reserva la extracción del archivo del documento. False si otra subida
+        del mismo archivo ya lo está extrayendo: hay que esperar su resultado
+        con reuse_extraction en vez de extraerlo otra vez.
+        """
+        try:
+            return await asyncio.to_thread(self._claim, document_id)
+        except Exception as e:
+            logger.error(f"No se pudo reservar la extracción de {document_id}: {e}")
+            return True
+
+    async def reuse_extraction(
+        self,
+        document_id: str,
+        file_path: str,
+        content_type: Optional[str],
+        filename: str,
+    ):
+        """
+        Espera a la extracción en curso del mismo archivo y copia su texto y
+        sus fragmentos. Si termina sin extracción completa (o su marca
+        caduca), la reserva y extrae este documento. Pensado para
+        BackgroundTasks: nunca lanza excepciones.
+        """
+        await self._set_progress(document_id, status="waiting", done=0, total=0)
+        try:
+            while True:
+                chunks = await asyncio.to_thread(
+                    self._copy_extraction, document_id, filename
+                )
+                if chunks is not None:
+                    await self._set_progress(
+                        document_id, status="completed", reused=1, chunks=chunks
+                    )
+                    logger.info(
+                        f"Extracción de {filename} ({document_id}) reutilizada"
+                    )
+                    return
+                if await self.claim_extraction(document_id):
+                    break
+                await asyncio.sleep(EXTRACTION_POLL_INTERVAL)
+        except Exception as e:
+            logger.error(
+                f"Error esperando la extracción de {filename} ({document_id}): {e}"
+            )
+        await self.extract_document(document_id, file_path, content_type, filename)
+
+    @asynccontextmanager
+    async def local_file(self, file_path: str) -> AsyncIterator[str]:
+        """
+        Ruta local del blob para leerlo desde los procesos del pool; con S3
+        se descarga a un archivo temporal que se borra al salir.
+        """
+        local_path = blob_storage.local_path(file_path)
+        if local_path is not None:
+            yield local_path
+            return
+
+        temp_dir = os.path.join(settings.UPLOAD_DIR, "tmp")
+        os.makedirs(temp_dir, exist_ok=True)
+        temp_path = os.path.join(
+            temp_dir, f"{uuid.uuid4()}{os.path.splitext(file_path)[1]}"
+        )
+        try:
+            if not await blob_storage.download_to(file_path, temp_path):
+                raise FileNotFoundError(file_path)
+            yield temp_path
+        finally:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    async def extract_document(
+        self,
+        document_id: str,
+        file_path: str,
+        content_type: Optional[str],
+        filename: str,
+    ):
+        """
+        Extrae el texto y lo va guardando en processed_text. Pensado para
+        BackgroundTasks: nunca lanza excepciones, el resultado queda en el
+        progreso (completed, partial, failed o skipped) junto con el número
+        de fragmentos indexados.
+        """
+        kind = self._kind(content_type)
+        if kind is None:
+            await self._set_progress(document_id, status="skipped", done=0, total=0)
+            return
+
+        deadline = time.monotonic() + self.timeout
+        parts: List[str] = []
+        tasks: List[asyncio.Future] = []
+        status = "failed"
+        await self._set_progress(document_id, status="running", done=0, total=0)
+
+        try:
+            async with self.local_file(file_path) as local_path:
+                total = await document_extraction_pool.run(
+                    count_units, local_path, kind
+                )
+                step = PDF_PAGES_PER_TASK if kind == "pdf" else 1
+                batches = [
+                    (start, min(start + step, total)) for start in range(0, total, step)
+                ]
+                await self._set_progress(
+                    document_id, status="running", done=0, total=total
+                )
+
+                # Ventana deslizante: como mucho DOCUMENT_EXTRACTION_WORKERS
+                # lotes en el pool a la vez (un PDF grande no acapara el pool
+                # de otras extracciones); se recogen en orden
+                window = max(1, settings.DOCUMENT_EXTRACTION_WORKERS)
+
+                def submit(index: int):
+                    if index < len(batches):
+                        start, stop = batches[index]
+                        tasks.append(
+                            asyncio.ensure_future(
+                                document_extraction_pool.run(
+                                    extract_units,
+                                    local_path,
+                                    kind,
+                                    start,
+                                    stop,
+                                    self.max_chars,
+                                )
+                            )
+                        )
+
+                for index in range(window):
+                    submit(index)
+
+                size = 0
+                for index, (start, stop) in enumerate(batches):
+                    text = await asyncio.wait_for(
+                        tasks[index], max(deadline - time.monotonic(), 0)
+                    )
+                    submit(index + window)
+                    if text:
+                        parts.append(text)
+                        size += len(text)
+                        await asyncio.to_thread(
+                            self._save_text,
+                            document_id,
+                            document_text(filename, "\n\n".join(parts))[
+                                : self.max_chars
+                            ],
+                        )
+                    await self._set_progress(
+                        document_id,
+                        status="running",
+                        done=stop,
+                        total=total,
+                        chars=size,
+                    )
+                    if size >= self.max_chars:
+                        break
+                status = "completed"
+
+        except Exception as e:
+            # Timeout por lote (ProcessPoolTimeout) o por archivo: se conserva
+            # el texto ya guardado
+            status = "partial" if parts else "failed"
+            logger.error(
+                f"Extracción de {filename} ({document_id}) incompleta: {type(e).__name__} {e}"
+            )
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        chunks = 0
+        if parts:
+            await self._set_progress(document_id, status="indexing")
+            text = "\n\n".join(parts)[: self.max_chars]
+            chunks = await document_retrieval_service.index_document(document_id, text)
+            await asyncio.to_thread(self._save_stored_file, document_id, status, text)
+        else:
+            await asyncio.to_thread(
+                self._save_text,
+                document_id,
+                f"Documento {filename} subido (no se pudo extraer texto)",
+            )
+            # Libera la marca "extracting" para que otra subida lo reintente
+            await asyncio.to_thread(self._save_stored_file, document_id, status, None)
+        await self._set_progress(document_id, status=status, chunks=chunks)
+        logger.info(
+            f"Extracción de {filename} ({document_id}): {status}, "
+            f"{sum(len(p) for p in parts)} caracteres"
+        )
+
+
+# Instancia global
+document_extraction_service = DocumentExtractionService()
@@ -0,0 +1,164 @@
+"""
+Recuperación de fragmentos de documentos para el contexto de los prompts.
+
+- Al terminar la extracción, el texto del documento se divide en fragmentos
+  (DOCUMENT_CHUNK_SIZE caracteres con DOCUMENT_CHUNK_OVERLAP de solape,
+  cortando en párrafos cuando se puede), se calculan sus embeddings y se
+  guardan en document_chunks (pgvector, distancia coseno)
+- Al redactar una pregunta solo se añaden los DOCUMENT_CONTEXT_TOP_K
+  fragmentos más cercanos a la pregunta y la última respuesta, no el
+  documento completo
+"""
+
+import uuid
+import asyncio
+import logging
+from typing import List, Sequence
+
+from app.config import settings
+from app.repositories.document_chunk_repository import document_chunk_repository
+from app.repositories.unit_of_work import unit_of_work
+from app.services.embedding_service import embedder
+
+logger = logging.getLogger("hydrous")
+
+
+def chunk_text(text: str, size: int, overlap: int) -> List[str]:
+    """Divide el texto en fragmentos de hasta size caracteres con solape"""
+    text = text.strip()
+    if not text:
+        return []
+
+    chunks: List[str] = []
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            # Preferir cortar en un párrafo, luego en una línea o un espacio,
+            # siempre en la segunda mitad del fragmento
+            for separator in ("\n\n", "\n", " "):
+                cut = text.rfind(separator, start + size // 2, end)
+                if cut != -1:
+                    end = cut
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        # El siguiente fragmento repite el final de este, empezando en palabra
+        next_start = max(end - overlap, start + 1)
+        space = text.find(" ", next_start, end)
+        start = space + 1 if space != -1 else next_start
+    return chunks
+
+
+class DocumentRetrievalService:
+    """Indexa documentos en fragmentos y recupera los más relevantes"""
+
+    def __init__(self):
+        self.chunk_size = settings.DOCUMENT_CHUNK_SIZE
+        self.chunk_overlap = settings.DOCUMENT_CHUNK_OVERLAP
+        self.top_k = settings.DOCUMENT_CONTEXT_TOP_K
+        self.max_distance = settings.DOCUMENT_CONTEXT_MAX_DISTANCE
+        # Se desactiva si EMBEDDING_DIM no coincide con la columna (check_schema)
+        self.enabled = True
+
+    def _column_dim(self):
+        with unit_of_work() as db:
+            return document_chunk_repository.embedding_dim(db)
+
+    async def check_schema(self) -> bool:
+        """
+        Comprueba al arrancar que EMBEDDING_DIM coincide con la columna
+        document_chunks.embedding. Si no, indexar y buscar fallarían en cada
+        documento: se desactiva la recuperación hasta migrar la columna.
+        """
+        try:
+            column_dim = await asyncio.to_thread(self._column_dim)
+        except Exception as e:
+            logger.warning(f"No se pudo comprobar la dimensión de los embeddings: {e}")
+            return self.enabled
+        if column_dim is not None and column_dim != settings.EMBEDDING_DIM:
+            logger.error(
+                f"EMBEDDING_DIM={settings.EMBEDDING_DIM} no coincide con la columna "
+                f"document_chunks.embedding ({column_dim}): recuperación de "
+                "fragmentos desactivada; cambiar la dimensión requiere una migración"
+            )
+            self.enabled = False
+        return self.enabled
+
+    def _save_chunks(
+        self,
+        document_id: str,
+        chunks: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+    ) -> int:
+        with unit_of_work() as db:
+            return document_chunk_repository.replace_for_document(
+                db,
+                document_id=uuid.UUID(document_id),
+                chunks=chunks,
+                embeddings=embeddings,
+            )
+
+    async def index_document(self, document_id: str, text: str) -> int:
+        """
+        Fragmenta e indexa el texto de un documento (sustituye lo anterior).
+
+        Returns:
+            Número de fragmentos guardados (0 si falla)
+        """
+        chunks = chunk_text(text, self.chunk_size, self.chunk_overlap)
+        if not chunks or not self.enabled:
+            return 0
+        try:
+            embeddings = await embedder.embed(chunks)
+            saved = await asyncio.to_thread(
+                self._save_chunks, document_id, chunks, embeddings
+            )
+        except Exception as e:
+            logger.error(f"Error indexando el documento {document_id}: {e}")
+            return 0
+        logger.info(
+            f"Documento {document_id} indexado: {saved} fragmentos ({embedder.name})"
+        )
+        return saved
+
+    def _has_chunks(self, conversation_id: str) -> bool:
+        with unit_of_work() as db:
+            return document_chunk_repository.has_chunks(db, uuid.UUID(conversation_id))
+
+    def _search(self, conversation_id: str, embedding: Sequence[float]) -> List[str]:
+        with unit_of_work() as db:
+            results = document_chunk_repository.search(
+                db,
+                conversation_id=uuid.UUID(conversation_id),
+                embedding=embedding,
+                limit=self.top_k,
+                max_distance=self.max_distance,
+            )
+            return [
+                f"({chunk.document.filename}) {chunk.content}"
+                for chunk, _distance in results
+            ]
+
+    async def relevant_chunks(self, conversation_id: str, query: str) -> List[str]:
+        """Los top-k fragmentos de la conversación más cercanos a la consulta"""
+        if not self.enabled or self.top_k <= 0 or not query.strip():
+            return []
+        try:
+            # Sin documentos no se calcula el embedding de la consulta
+            if not await asyncio.to_thread(self._has_chunks, conversation_id):
+                return []
+            (embedding,) = await embedder.embed([query])
+            return await asyncio.to_thread(self._search, conversation_id, embedding)
+        except Exception as e:
+            logger.error(
+                f"Error recuperando fragmentos de la conversación {conversation_id}: {e}"
+            )
+            return []
+
+
+# Instancia global
+document_retrieval_service = DocumentRetrievalService()
@@ -1,71 +1,337 @@
 import os
 import uuid
+import asyncio
+import hashlib
 import logging
-from typing import Dict, Any, Optional, List
+from collections import Counter
+from typing import AsyncIterator, Dict, Any, NamedTuple, Optional, List
 from fastapi import UploadFile
 
 from app.config import settings
-from app.repositories import document_repository, unit_of_work
+from app.core.blob_storage import blob_storage
+from app.repositories.document_chunk_repository import document_chunk_repository
+from app.repositories.document_repository import document_repository
+from app.repositories.stored_file_repository import stored_file_repository
 from app.db.models.document import Document as DBDocument
 from app.models.document import Document
 from app.repositories.unit_of_work import unit_of_work
-
+from app.services.document_extraction import REUSABLE_STATUSES, document_text
 
 logger = logging.getLogger("hydrous")
 
 
+# Firmas (magic bytes) de los tipos binarios permitidos: el content-type lo
+# declara el cliente, el contenido del primer bloque debe coincidir
+UPLOAD_SIGNATURES = {
+    "application/pdf": (b"%PDF-",),
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": (
+        b"PK\x03\x04",
+    ),
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": (
+        b"PK\x03\x04",
+    ),
+    "application/vnd.ms-excel": (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1",),
+    "image/png": (b"\x89PNG\r\n\x1a\n",),
+    "image/jpeg": (b"\xff\xd8\xff",),
+}
+
+
+class DocumentUploadError(ValueError):
+    """Subida rechazada por tamaño o tipo (status_code para la respuesta HTTP)"""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class AcquiredFile(NamedTuple):
+    """StoredFile leído dentro de la transacción corta de acquire"""
+
+    id: uuid.UUID
+    blob_key: str
+    blob_status: str
+    extraction_status: Optional[str]
+    processed_text: Optional[str]
+
+
+class UploadStream:
+    """
+    Lee un UploadFile en bloques de tamaño fijo y, sobre la marcha, aplica
+    el límite de tamaño, verifica la firma del tipo declarado en el primer
+    bloque y calcula el SHA-256 (en un hilo: hashlib libera el GIL).
+    """
+
+    def __init__(self, file: UploadFile, max_size: int, chunk_size: int):
+        self.file = file
+        self.content_type = (file.content_type or "").split(";")[0].strip().lower()
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+    def _check_first_chunk(self, chunk: bytes):
+        signatures = UPLOAD_SIGNATURES.get(self.content_type)
+        if signatures is not None:
+            valid = chunk.startswith(signatures)
+        else:
+            # Tipos de texto (csv, txt): sin bytes nulos
+            valid = b"\x00" not in chunk
+        if not valid:
+            raise DocumentUploadError(
+                f"El contenido de {self.file.filename} no corresponde a {self.content_type}",
+                415,
+            )
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        while True:
+            chunk = await self.file.read(self.chunk_size)
+            if not chunk:
+                break
+            if self.size == 0:
+                self._check_first_chunk(chunk)
+            self.size += len(chunk)
+            if self.size > self.max_size:
+                # Cortar la subida: el archivo temporal se descarta
+                raise DocumentUploadError(
+                    f"El archivo supera el tamaño máximo de {self.max_size} bytes",
+                    413,
+                )
+            await asyncio.to_thread(self._sha256.update, chunk)
+            yield chunk
+
+
 class DocumentService:
     """Servicio para manejo de documentos subidos"""
 
+    # Bloque de lectura del archivo subido
+    UPLOAD_READ_SIZE = 1024 * 1024
+
+    def __init__(self):
+        self.allowed_types = {
+            content_type.strip().lower()
+            for content_type in settings.ALLOWED_UPLOAD_TYPES.split(",")
+            if content_type.strip()
+        }
+
+    def _validate_upload(self, file: UploadFile):
+        """Rechaza antes de leer lo que ya se sabe inválido (tipo, tamaño)."""
+        content_type = (file.content_type or "").split(";")[0].strip().lower()
+        if content_type not in self.allowed_types:
+            raise DocumentUploadError(
+                f"Tipo de archivo no permitido: {file.content_type or 'desconocido'}",
+                415,
+            )
+        # Starlette ya conoce el tamaño del archivo recibido
+        size = getattr(file, "size", None)
+        if size is not None and size > settings.MAX_UPLOAD_SIZE:
+            raise DocumentUploadError(
+                f"El archivo supera el tamaño máximo de {settings.MAX_UPLOAD_SIZE} bytes",
+                413,
+            )
+
+    async def _spool_upload(self, file: UploadFile, path: str) -> UploadStream:
+        """
+        Copia la subida a un archivo temporal aplicando los límites y
+        calculando el hash: hasta conocerlo no se sabe si el blob ya existe.
+        """
+        upload = UploadStream(file, settings.MAX_UPLOAD_SIZE, self.UPLOAD_READ_SIZE)
+        spool = await asyncio.to_thread(self._open_spool, path)
+        try:
+            async for chunk in upload.chunks():
+                await asyncio.to_thread(spool.write, chunk)
+        finally:
+            await asyncio.to_thread(spool.close)
+        return upload
+
+    @staticmethod
+    def _open_spool(path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return open(path, "wb")
+
+    @staticmethod
+    def _remove_spool(path: str):
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _acquire_stored_file(
+        self, upload: UploadStream, file_extension: str
+    ) -> AcquiredFile:
+        """Suma la referencia al archivo en una transacción corta (en un hilo)"""
+        with unit_of_work() as db:
+            stored_file = stored_file_repository.acquire(
+                db,
+                sha256=upload.sha256,
+                size=upload.size,
+                content_type=upload.content_type,
+                # Clave nueva por fila: si el archivo se libera y se vuelve a
+                # subir, el borrado tardío del blob anterior no afecta al nuevo
+                blob_key=f"documents/{upload.sha256}-{uuid.uuid4().hex[:12]}{file_extension}",
+            )
+            return AcquiredFile(
+                id=stored_file.id,
+                blob_key=stored_file.blob_key,
+                blob_status=stored_file.blob_status,
+                extraction_status=stored_file.extraction_status,
+                processed_text=stored_file.processed_text,
+            )
+
+    def _mark_blob_stored(self, stored_file_id: uuid.UUID):
+        with unit_of_work() as db:
+            stored_file_repository.mark_blob_stored(db, stored_file_id=stored_file_id)
+
+    def _create_document(
+        self,
+        conversation_id: str,
+        file: UploadFile,
+        stored_file: AcquiredFile,
+        processed_text: str,
+        extraction_reused: bool,
+    ) -> Dict[str, Any]:
+        """Crea el documento (y copia los fragmentos reutilizados) en un hilo"""
+        with unit_of_work() as db:
+            db_document = DBDocument(
+                conversation_id=uuid.UUID(conversation_id),
+                filename=file.filename,
+                file_path=stored_file.blob_key,
+                content_type=file.content_type,
+                processed_text=processed_text,
+                stored_file_id=stored_file.id,
+            )
+
+            db.add(db_document)
+            db.flush()
+            if extraction_reused:
+                # Fragmentos y embeddings de la subida anterior
+                document_chunk_repository.copy_from_stored_file(
+                    db, document=db_document
+                )
+            db.commit()
+            db.refresh(db_document)
+
+            # Convertir a diccionario
+            return {
+                "id": str(db_document.id),
+                "conversation_id": conversation_id,
+                "filename": db_document.filename,
+                "file_path": db_document.file_path,
+                "content_type": db_document.content_type,
+                "processed_text": db_document.processed_text,
+                "created_at": db_document.created_at.isoformat(),
+            }
+
     async def process_document(
         self, file: UploadFile, conversation_id: str
     ) -> Dict[str, Any]:
-        """Procesa un documento subido"""
+        """
+        Procesa un documento subido. Los archivos se guardan una sola vez por
+        contenido (StoredFile, SHA-256): si ya se subió antes se reutilizan el
+        blob y, si terminó, la extracción de texto.
+
+        Los pasos de base de datos son transacciones cortas en hilos; el blob
+        se sube fuera de cualquier transacción (nunca se espera con una fila
+        bloqueada).
+        """
+        spool_path = None
         try:
-            # Generar nombre único y guardar archivo
-            file_extension = os.path.splitext(file.filename)[1]
-            unique_filename = f"{uuid.uuid4()}{file_extension}"
-            file_path = os.path.join(settings.UPLOAD_DIR, unique_filename)
+            self._validate_upload(file)
+
+            file_extension = os.path.splitext(file.filename)[1].lower()
+            spool_path = os.path.join(
+                settings.UPLOAD_DIR, "tmp", f"{uuid.uuid4()}{file_extension}"
+            )
+            upload = await self._spool_upload(file, spool_path)
 
-            # Guardar archivo físicamente
-            content = await file.read()
-            with open(file_path, "wb") as f:
-                f.write(content)
+            stored_file = await asyncio.to_thread(
+                self._acquire_stored_file, upload, file_extension
+            )
+            try:
+                reused = stored_file.blob_status == "stored" and (
+                    await blob_storage.exists(stored_file.blob_key)
+                )
+                if not reused:
+                    # Si otra subida del mismo archivo está en curso, ambas
+                    # escriben el mismo contenido en la misma clave
+                    await blob_storage.put_file(
+                        stored_file.blob_key, spool_path, upload.content_type
+                    )
+                    await asyncio.to_thread(self._mark_blob_stored, stored_file.id)
 
-            # Extraer texto o información básica
-            processed_text = f"Documento {file.filename} subido correctamente"
+                extraction_reused = (
+                    reused and stored_file.extraction_status in REUSABLE_STATUSES
+                )
+                if extraction_reused:
+                    processed_text = document_text(
+                        file.filename, stored_file.processed_text or ""
+                    )
+                else:
+                    # El texto lo completa la extracción en segundo plano
+                    # (document_extraction_service) a medida que avanza
+                    processed_text = (
+                        f"Documento {file.filename} subido; extracción de texto en curso"
+                    )
 
-            # Guardar información en la base de datos
-            with unit_of_work() as db:
-                db_document = DBDocument(
-                    conversation_id=uuid.UUID(conversation_id),
-                    filename=file.filename,
-                    file_path=file_path,
-                    content_type=file.content_type,
-                    processed_text=processed_text,
+                document_info = await asyncio.to_thread(
+                    self._create_document,
+                    conversation_id,
+                    file,
+                    stored_file,
+                    processed_text,
+                    extraction_reused,
                 )
+            except Exception:
+                # Sin documento no hay referencia: devolverla
+                await self.release_stored_files([stored_file.id])
+                raise
 
-                db.add(db_document)
-                db.commit()
-                db.refresh(db_document)
-
-                # Convertir a diccionario
-                document_info = {
-                    "id": str(db_document.id),
-                    "conversation_id": conversation_id,
-                    "filename": db_document.filename,
-                    "file_path": db_document.file_path,
-                    "content_type": db_document.content_type,
-                    "processed_text": db_document.processed_text,
-                    "created_at": db_document.created_at.isoformat(),
-                }
-
-            logger.info(f"Documento procesado y guardado: {file.filename}")
+            document_info.update(
+                size=upload.size,
+                sha256=upload.sha256,
+                reused=reused,
+                extraction_reused=extraction_reused,
+            )
+            logger.info(
+                f"Documento procesado y guardado: {file.filename} ({upload.size} bytes, "
+                f"sha256 {upload.sha256}, {'reutilizado' if reused else 'nuevo'})"
+            )
             return document_info
 
+        except DocumentUploadError:
+            raise
         except Exception as e:
             logger.error(f"Error procesando documento: {e}", exc_info=True)
             raise ValueError(f"Error procesando documento: {str(e)}")
+        finally:
+            if spool_path is not None:
+                await asyncio.to_thread(self._remove_spool, spool_path)
+
+    def _release_stored_file(
+        self, stored_file_id: uuid.UUID, count: int
+    ) -> Optional[str]:
+        with unit_of_work() as db:
+            return stored_file_repository.release(
+                db, stored_file_id=stored_file_id, count=count
+            )
+
+    async def release_stored_files(self, stored_file_ids: List[uuid.UUID]):
+        """
+        Resta las referencias de documentos eliminados (una por documento) y
+        borra los blobs que ya no usa ningún documento. El blob se borra
+        después del commit, sin la fila bloqueada.
+        """
+        for stored_file_id, count in Counter(stored_file_ids).items():
+            try:
+                blob_key = await asyncio.to_thread(
+                    self._release_stored_file, stored_file_id, count
+                )
+                if blob_key:
+                    await blob_storage.delete(blob_key)
+                    logger.info(f"Blob {blob_key} eliminado (sin referencias)")
+            except Exception as e:
+                logger.error(f"Error liberando el archivo {stored_file_id}: {e}")
 
     def get_document(self, document_id: str) -> Optional[Document]:
         """Obtiene información de un documento por ID"""
@@ -93,7 +359,7 @@ class DocumentService:
         """Obtiene todos los documentos de una conversación"""
         try:
             with unit_of_work() as db:
-                db_documents = document_repository.get_by_conversation(
+                db_documents = document_repository.get_by_conversation_id(
                     db, uuid.UUID(conversation_id)
                 )
 
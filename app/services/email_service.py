@@ -0,0 +1,125 @@
+import time
+import smtplib
+import logging
+from typing import Dict, List, Optional
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+from app.config import settings
+from app.core.redis_queue import ReliableQueue
+
+logger = logging.getLogger("hydrous")
+
+
+class SMTPSender:
+    """
+    Envío SMTP con conexión reutilizable (bloqueante: usar desde un hilo).
+
+    La conexión se mantiene abierta entre lotes y se cierra tras
+    SMTP_IDLE_TIMEOUT segundos sin uso o ante cualquier error.
+    """
+
+    def __init__(self):
+        self._connection: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+
+    def _connect(self) -> smtplib.SMTP:
+        connection = smtplib.SMTP(
+            settings.SMTP_SERVER, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT
+        )
+        if settings.SMTP_USE_TLS:
+            connection.starttls()
+        if settings.SMTP_USER and settings.SMTP_PASSWORD:
+            connection.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
+        return connection
+
+    def _get_connection(self) -> smtplib.SMTP:
+        if self._connection is not None:
+            idle = time.monotonic() - self._last_used
+            if idle > settings.SMTP_IDLE_TIMEOUT:
+                self.close()
+            else:
+                try:
+                    # El servidor pudo cerrar la conexión
+                    if self._connection.noop()[0] != 250:
+                        self.close()
+                except (smtplib.SMTPException, OSError):
+                    self.close()
+        if self._connection is None:
+            self._connection = self._connect()
+        return self._connection
+
+    def send_batch(self, messages: List[Dict[str, str]]) -> List[Optional[str]]:
+        """
+        Envía varios emails por la misma conexión.
+
+        Args:
+            messages: Dicts con to, subject y body
+
+        Returns:
+            list: None por cada email enviado o el mensaje de error
+        """
+        results: List[Optional[str]] = []
+        for message in messages:
+            try:
+                connection = self._get_connection()
+                connection.send_message(self._build_mime(message))
+                self._last_used = time.monotonic()
+                results.append(None)
+            except (smtplib.SMTPException, OSError) as e:
+                # Conexión en estado desconocido: se abre otra para el siguiente
+                self.close()
+                results.append(str(e) or e.__class__.__name__)
+        return results
+
+    def close(self):
+        if self._connection is None:
+            return
+        try:
+            self._connection.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        finally:
+            self._connection = None
+
+    def _build_mime(self, message: Dict[str, str]) -> MIMEMultipart:
+        mime = MIMEMultipart()
+        mime["From"] = settings.FROM_EMAIL
+        mime["To"] = message["to"]
+        mime["Subject"] = message["subject"]
+        mime.attach(MIMEText(message["body"], "plain"))
+        return mime
+
+
+class EmailService:
+    """
+    Bandeja de salida de emails.
+
+    Las peticiones HTTP solo encolan el mensaje en Redis; el worker
+    (python -m app.workers.email_worker) lo entrega por SMTP con reintentos,
+    así la latencia del servidor SMTP nunca bloquea el event loop de la API.
+    """
+
+    def __init__(self):
+        self.outbox = ReliableQueue(
+            "email_outbox",
+            max_attempts=settings.EMAIL_MAX_ATTEMPTS,
+            visibility_timeout=settings.SMTP_TIMEOUT * settings.EMAIL_BATCH_SIZE * 2,
+        )
+
+    async def enqueue(self, to_email: str, subject: str, body: str) -> str:
+        """
+        Encola un email para su envío.
+
+        Returns:
+            str: ID del mensaje en la bandeja de salida
+        """
+        message_id = await self.outbox.enqueue(
+            {"to": to_email, "subject": subject, "body": body}
+        )
+        logger.info(f"Email {message_id} encolado para: {to_email}")
+        return message_id
+
+
+# Instancia global
+email_service = EmailService()
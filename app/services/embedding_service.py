@@ -0,0 +1,143 @@
+"""
+Embeddings de texto para la búsqueda de fragmentos de documentos.
+
+- EMBEDDING_BACKEND=hash (por defecto): hashing de palabras y trigramas de
+  caracteres, local y determinista; no necesita red ni modelo (útil sin
+  conexión y en pruebas) y recupera por coincidencia léxica
+- EMBEDDING_BACKEND=openai: API de embeddings compatible con OpenAI
+  (EMBEDDING_MODEL), reducida a EMBEDDING_DIM dimensiones
+
+Todos los vectores se devuelven normalizados (norma 1) y con EMBEDDING_DIM
+dimensiones: la columna vector(EMBEDDING_DIM) de document_chunks no cambia
+al cambiar de backend, pero los fragmentos ya indexados hay que reindexarlos.
+"""
+
+import re
+import asyncio
+import hashlib
+import logging
+import unicodedata
+from abc import ABC, abstractmethod
+from typing import List
+
+import httpx
+import numpy as np
+
+from app.config import settings
+
+logger = logging.getLogger("hydrous")
+
+
+class Embedder(ABC):
+    """Interfaz de los backends de embeddings"""
+
+    name = "base"
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    @abstractmethod
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Un vector normalizado de self.dim dimensiones por texto"""
+        pass
+
+
+class HashEmbedder(Embedder):
+    """Feature hashing (palabras + trigramas) con signo, sin dependencias"""
+
+    name = "hash"
+    _WORD = re.compile(r"\w+", re.UNICODE)
+    # Palabras vacías frecuentes (es/en): sin ellas dos textos no relacionados
+    # apenas comparten rasgos
+    STOPWORDS = frozenset(
+        "a al con de del el en es la las lo los o para por que se su sus un una y "
+        "and are for in is of on or the to with".split()
+    )
+
+    def _features(self, text: str) -> List[str]:
+        # Sin acentos ni mayúsculas: "Análisis" y "analisis" coinciden
+        text = unicodedata.normalize("NFKD", text.lower())
+        text = "".join(c for c in text if not unicodedata.combining(c))
+        features = []
+        for word in self._WORD.findall(text):
+            if word in self.STOPWORDS:
+                continue
+            features.append(f"w:{word}")
+            padded = f" {word} "
+            features.extend(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+        return features
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            # Las palabras pesan más que cada trigrama
+            weight = 2.0 if feature.startswith("w:") else 1.0
+            vector[value % self.dim] += weight if value >> 63 else -weight
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_sync(self, texts: List[str]) -> List[List[float]]:
+        return [self._vector(text) for text in texts]
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self.embed_sync, texts)
+
+
+class OpenAIEmbedder(Embedder):
+    """Endpoint /embeddings compatible con OpenAI"""
+
+    name = "openai"
+    # Textos por petición
+    BATCH_SIZE = 64
+
+    def __init__(self, dim: int, model: str, api_key: str, api_url: str):
+        super().__init__(dim)
+        self.model = model
+        self.api_key = api_key
+        self.api_url = api_url
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        vectors: List[List[float]] = []
+        async with httpx.AsyncClient(timeout=60.0) as client:
+            for start in range(0, len(texts), self.BATCH_SIZE):
+                response = await client.post(
+                    self.api_url,
+                    headers={"Authorization": f"Bearer {self.api_key}"},
+                    json={
+                        "model": self.model,
+                        "input": texts[start : start + self.BATCH_SIZE],
+                        "dimensions": self.dim,
+                    },
+                )
+                response.raise_for_status()
+                data = sorted(response.json()["data"], key=lambda d: d["index"])
+                for item in data:
+                    vector = np.asarray(item["embedding"], dtype=np.float32)
+                    norm = np.linalg.norm(vector)
+                    vectors.append((vector / norm if norm > 0 else vector).tolist())
+        return vectors
+
+
+def create_embedder() -> Embedder:
+    """Backend configurado en EMBEDDING_BACKEND (hash si no se reconoce)"""
+    backend = settings.EMBEDDING_BACKEND.lower()
+    if backend == "openai":
+        if settings.OPENAI_API_KEY:
+            return OpenAIEmbedder(
+                settings.EMBEDDING_DIM,
+                settings.EMBEDDING_MODEL,
+                settings.OPENAI_API_KEY,
+                settings.EMBEDDING_API_URL,
+            )
+        logger.warning("EMBEDDING_BACKEND=openai sin OPENAI_API_KEY; se usa hash")
+    elif backend != "hash":
+        logger.warning(f"EMBEDDING_BACKEND desconocido '{backend}'; se usa hash")
+    return HashEmbedder(settings.EMBEDDING_DIM)
+
+
+# Instancia global
+embedder = create_embedder()
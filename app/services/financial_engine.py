@@ -0,0 +1,555 @@
+"""
+Cálculo determinista de dimensionamiento, CAPEX, OPEX y ROI.
+
+Las cifras financieras ya no se piden al LLM: se calculan a partir de las
+respuestas del cuestionario (collected_data) y de los valores típicos del
+sector (ProposalService._load_typical_values) con curvas de costo por sector.
+
+Todo el cálculo es una sola pasada vectorizada con NumPy sobre una rejilla
+de escenarios (margen de caudal de diseño × fracción de reúso): las etapas
+del tren son columnas, los escenarios son ejes y el resultado se obtiene por
+broadcasting, sin bucles por escenario. Mismas respuestas → mismas cifras.
+"""
+
+import re
+import logging
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("hydrous")
+
+# Tarifa eléctrica y tipo de cambio de referencia para las estimaciones
+ENERGY_COST_USD_KWH = 0.12
+MXN_PER_USD = 17.0
+DAYS_PER_MONTH = 30.0
+
+# Escenarios: margen del caudal de diseño sobre el promedio y nivel de reúso
+FLOW_FACTORS = np.array([1.0, 1.2, 1.4])
+REUSE_LEVELS = ("Conservative", "Base", "Optimistic")
+REUSE_SPREAD = np.array([0.75, 1.0, 1.25])
+BASE = (1, 1)  # Índices del escenario base en la rejilla
+# Por encima de este plazo la inversión no se considera recuperable
+MAX_PAYBACK_YEARS = 25.0
+
+# Fracciones de CAPEX sobre el costo de equipos
+INSTALLATION_FRACTION = 0.25
+ENGINEERING_FRACTION = 0.12
+# Mantenimiento anual como fracción del costo de equipos
+MAINTENANCE_FRACTION = 0.03
+
+
+class TreatmentStage(NamedTuple):
+    """
+    Etapa del tren con su criterio de dimensionamiento y curva de costo.
+
+    El costo de equipo es cost_a * Q^cost_b (Q de diseño en m³/día): el
+    exponente < 1 refleja la economía de escala.
+    """
+
+    name: str
+    hrt_hours: float  # Tiempo de retención (dimensiona volumen); 0 si no aplica
+    surface_rate: float  # Carga superficial m³/m²·h (dimensiona área); 0 si no aplica
+    cost_a: float
+    cost_b: float
+    kwh_per_m3: float
+    chemicals_usd_m3: float
+
+
+class SectorProfile(NamedTuple):
+    """Curva de costos y supuestos de un sector"""
+
+    stages: Tuple[TreatmentStage, ...]
+    default_flow_m3_day: float
+    default_water_cost_usd_m3: float
+    reuse_fraction: float  # Fracción del agua residual que se reúsa (escenario base)
+    labor_usd_month: float  # Operación a 100 m³/día; escala con Q^0.5
+
+
+SECTOR_PROFILES: Dict[str, SectorProfile] = {
+    "Industrial": SectorProfile(
+        stages=(
+            TreatmentStage("Equalization Tank", 8.0, 0.0, 900.0, 0.60, 0.02, 0.00),
+            TreatmentStage("DAF System", 0.0, 6.0, 2600.0, 0.62, 0.08, 0.05),
+            TreatmentStage("MBBR Bioreactor", 10.0, 0.0, 3200.0, 0.65, 0.45, 0.02),
+            TreatmentStage("Multimedia Filter", 0.0, 10.0, 800.0, 0.60, 0.05, 0.01),
+            TreatmentStage("UV Disinfection", 0.0, 0.0, 450.0, 0.55, 0.03, 0.00),
+        ),
+        default_flow_m3_day=200.0,
+        default_water_cost_usd_m3=2.0,
+        reuse_fraction=0.55,
+        labor_usd_month=1600.0,
+    ),
+    "Comercial": SectorProfile(
+        stages=(
+            TreatmentStage(
+                "Screening & Grease Trap", 0.0, 0.0, 350.0, 0.55, 0.01, 0.00
+            ),
+            TreatmentStage("Equalization Tank", 6.0, 0.0, 850.0, 0.60, 0.02, 0.00),
+            TreatmentStage("MBR System", 8.0, 0.0, 4200.0, 0.66, 0.60, 0.03),
+            TreatmentStage("UV Disinfection", 0.0, 0.0, 450.0, 0.55, 0.03, 0.00),
+        ),
+        default_flow_m3_day=100.0,
+        default_water_cost_usd_m3=2.0,
+        reuse_fraction=0.60,
+        labor_usd_month=1800.0,
+    ),
+    "Municipal": SectorProfile(
+        stages=(
+            TreatmentStage(
+                "Screening & Grit Removal", 0.0, 0.0, 300.0, 0.58, 0.01, 0.00
+            ),
+            TreatmentStage("Primary Clarifier", 0.0, 1.5, 1100.0, 0.62, 0.01, 0.00),
+            TreatmentStage(
+                "Activated Sludge Reactor", 12.0, 0.0, 2100.0, 0.68, 0.35, 0.01
+            ),
+            TreatmentStage("Tertiary Sand Filter", 0.0, 8.0, 700.0, 0.60, 0.04, 0.01),
+            TreatmentStage("Chlorination", 0.0, 0.0, 250.0, 0.55, 0.01, 0.02),
+        ),
+        default_flow_m3_day=2000.0,
+        default_water_cost_usd_m3=0.8,
+        reuse_fraction=0.35,
+        labor_usd_month=3500.0,
+    ),
+    "Residencial": SectorProfile(
+        stages=(
+            TreatmentStage("Equalization Tank", 6.0, 0.0, 800.0, 0.60, 0.02, 0.00),
+            TreatmentStage("Compact MBBR Unit", 10.0, 0.0, 3000.0, 0.65, 0.40, 0.02),
+            TreatmentStage("Multimedia Filter", 0.0, 10.0, 800.0, 0.60, 0.05, 0.01),
+            TreatmentStage("UV Disinfection", 0.0, 0.0, 450.0, 0.55, 0.03, 0.00),
+        ),
+        default_flow_m3_day=50.0,
+        default_water_cost_usd_m3=1.2,
+        reuse_fraction=0.50,
+        labor_usd_month=1200.0,
+    ),
+}
+SECTOR_PROFILES["_default"] = SECTOR_PROFILES["Industrial"]
+
+# Profundidad útil de tanques para pasar de volumen a dimensiones
+TANK_DEPTH_M = 4.0
+
+# Preguntas de cada cuestionario (prefijo de sus IDs) con los datos del
+# cálculo: no todos preguntan lo mismo en la misma posición (en los
+# municipales XXX_3 es el caudal de diseño y XXX_4 el caudal tratado)
+_GENERAL_FIELDS = {"water_cost": 2, "consumption": 3, "wastewater": 4}
+_MUNICIPAL_FIELDS = {"water_cost": 2, "design_flow": 3, "wastewater": 4}
+FLOW_FIELDS: Dict[str, Dict[str, int]] = {
+    **{
+        prefix: _GENERAL_FIELDS
+        for prefix in (
+            "IAB", "ITX", "IPQ", "IFM", "IMN", "IOG", "IMA", "ICM",
+            "CHT", "CEO", "CCC", "CRS", "RVU", "REM",
+        )
+    },
+    **{prefix: _MUNICIPAL_FIELDS for prefix in ("MGC", "MPA", "MAS")},
+}
+
+# Unidad de caudal cuando ni la respuesta ni la pregunta la indican
+DEFAULT_FLOW_UNIT = "m³/día"
+
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+# Periodo en un texto de caudal ("/mes", "L/s", "por día"...)
+_FLOW_PERIOD = re.compile(
+    r"l/s|lps|gpm|gpd|l/d|/\s*h\b|hora|hour|d[ií]a|day|diari|"
+    r"\bmes|month|año|year|anual"
+)
+# Unidad de caudal en el texto de una pregunta ("Consumo (m³/mes):")
+_QUESTION_FLOW_UNIT = re.compile(r"m[³3]\s*/\s*(?:d[ií]a|mes|h)|l/s", re.IGNORECASE)
+
+
+def parse_quantity(value: Any) -> Optional[float]:
+    """Primer número de una respuesta libre ("1,200 m³/mes" → 1200.0)"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER.search(str(value))
+    if not match:
+        return None
+    number = match.group(0)
+    # "1,200" y "1.200" son miles; "2,5" y "2.5" son decimales
+    if re.fullmatch(r"\d{1,3}([.,]\d{3})+", number):
+        number = re.sub(r"[.,]", "", number)
+    else:
+        number = number.replace(",", ".")
+        if number.count(".") > 1:
+            return None
+    return float(number)
+
+
+def question_flow_unit(question_text: Optional[str]) -> Optional[str]:
+    """Primera unidad de caudal que menciona una pregunta ("m³/mes"), si hay"""
+    match = _QUESTION_FLOW_UNIT.search(question_text or "")
+    return match.group(0) if match else None
+
+
+def parse_flow_m3_day(
+    value: Any, default_unit: str = DEFAULT_FLOW_UNIT
+) -> Optional[float]:
+    """
+    Caudal en m³/día a partir de una respuesta con unidad y periodo. Si la
+    respuesta no indica periodo ("1200", "1200 m³") se lee en default_unit,
+    la unidad que pide la pregunta.
+    """
+    quantity = parse_quantity(value)
+    if quantity is None:
+        return None
+    text = str(value).lower().replace("³", "3")
+    if not _FLOW_PERIOD.search(text):
+        text = f"{text} {default_unit}".lower().replace("³", "3")
+    if "l/s" in text or "lps" in text:
+        return quantity * 86.4
+    if "gpm" in text:
+        return quantity * 5.451
+    if "gal" in text or "gpd" in text:
+        quantity /= 264.17
+    elif re.search(r"\blitros?\b|\bl/d", text):
+        quantity /= 1000.0
+    if re.search(r"/\s*h\b|hora|hour", text):
+        return quantity * 24
+    if re.search(r"mes|month", text):
+        return quantity / DAYS_PER_MONTH
+    if re.search(r"año|year|anual", text):
+        return quantity / 365.0
+    return quantity
+
+
+def parse_water_cost_usd_m3(value: Any) -> Optional[float]:
+    """Costo del agua en USD/m³ (acepta MXN y precios por galón)"""
+    quantity = parse_quantity(value)
+    if quantity is None:
+        return None
+    text = str(value).lower()
+    if "mxn" in text or "peso" in text:
+        quantity /= MXN_PER_USD
+    if "gal" in text:
+        quantity *= 264.17
+    return quantity
+
+
+def _range_midpoint(value: Any) -> Optional[float]:
+    """Punto medio de un valor típico ("400-800" → 600, "<100" → 100)"""
+    numbers = [float(n) for n in re.findall(r"\d+(?:\.\d+)?", str(value or ""))]
+    if not numbers:
+        return None
+    return sum(numbers[:2]) / len(numbers[:2])
+
+
+def _answer(collected_data: Dict[str, Any], suffix: str) -> Optional[Any]:
+    """Respuesta por sufijo del ID de pregunta en cualquier cuestionario"""
+    for question_id, answer in collected_data.items():
+        if re.fullmatch(rf"[A-Z]{{3}}_{suffix}", str(question_id)) and answer:
+            return answer
+    return None
+
+
+def _questionnaire_prefix(collected_data: Dict[str, Any]) -> Optional[str]:
+    """Prefijo del cuestionario del giro respondido (IAB, RVU, MGC...)"""
+    for question_id in collected_data:
+        prefix = str(question_id).split("_")[0]
+        if prefix in FLOW_FIELDS:
+            return prefix
+    return None
+
+
+class _FlowAnswer(NamedTuple):
+    value: Any
+    unit: Optional[str]  # Unidad de caudal que pide la pregunta, si la indica
+
+
+def _flow_answers(collected_data: Dict[str, Any]) -> Dict[str, _FlowAnswer]:
+    """Respuestas de costo y caudales del cuestionario, con la unidad de su pregunta"""
+    from app.services.questionnaire_service import questionnaire_service
+
+    prefix = _questionnaire_prefix(collected_data)
+    if prefix is None:
+        return {}
+    answers = {}
+    for field, number in FLOW_FIELDS[prefix].items():
+        question_id = f"{prefix}_{number}"
+        if collected_data.get(question_id):
+            answers[field] = _FlowAnswer(
+                collected_data[question_id],
+                question_flow_unit(questionnaire_service.get_question_text(question_id)),
+            )
+    return answers
+
+
+class FinancialModel(NamedTuple):
+    """Resultado del cálculo: escenario base y rejilla completa"""
+
+    sector: str
+    stages: Tuple[TreatmentStage, ...]
+    flow_m3_day: float
+    design_flow_m3_day: float
+    water_cost_usd_m3: float
+    assumptions: Tuple[str, ...]  # Datos que no vinieron de la conversación
+    load_factor: float
+    stage_volume_m3: np.ndarray  # (etapas,) escenario base
+    stage_area_m2: np.ndarray
+    stage_cost_usd: np.ndarray
+    capex: Dict[str, float]
+    opex_month: Dict[str, float]
+    roi: Dict[str, float]
+    payback_grid: np.ndarray  # (caudal de diseño, reúso) en años
+    reuse_grid: np.ndarray  # (reúso,) fracción de reúso de cada columna
+
+
+class FinancialEngine:
+    """Calcula el modelo financiero y lo da como tablas markdown de la propuesta"""
+
+    def calculate(self, metadata: Dict[str, Any]) -> FinancialModel:
+        """Dimensionamiento, CAPEX, OPEX y ROI para una conversación"""
+        from app.services.proposal_service import proposal_service
+
+        collected_data = metadata.get("collected_data") or {}
+        sector = metadata.get("selected_sector") or "_default"
+        subsector = metadata.get("selected_subsector")
+        profile = SECTOR_PROFILES.get(sector, SECTOR_PROFILES["_default"])
+        assumptions = []
+
+        answers = _flow_answers(collected_data)
+        # Sin unidad en la pregunta de agua residual vale la del consumo
+        # ("Generación estimada de AR (80-90% consumo)" tras "... (m³/mes)")
+        consumption_unit = (
+            answers["consumption"].unit if "consumption" in answers else None
+        ) or DEFAULT_FLOW_UNIT
+
+        def flow_answer(field: str, fallback_unit: str) -> Optional[float]:
+            answer = answers.get(field)
+            if answer is None:
+                return None
+            return parse_flow_m3_day(answer.value, answer.unit or fallback_unit)
+
+        consumption = flow_answer("consumption", DEFAULT_FLOW_UNIT)
+        flow = flow_answer("wastewater", consumption_unit)
+        design_flow = flow_answer("design_flow", DEFAULT_FLOW_UNIT)
+        if not flow and consumption:
+            flow = consumption * 0.85
+            assumptions.append("wastewater estimated as 85% of consumption")
+        if not flow and design_flow:
+            flow = design_flow / FLOW_FACTORS[BASE[0]]
+            assumptions.append("average flow estimated from the design flow")
+        if not flow:
+            flow = profile.default_flow_m3_day
+            assumptions.append(f"typical sector flow of {flow:,.0f} m³/day")
+        consumption = consumption or flow / 0.85
+
+        water_cost = parse_water_cost_usd_m3(
+            answers["water_cost"].value if "water_cost" in answers else None
+        )
+        if not water_cost:
+            water_cost = profile.default_water_cost_usd_m3
+            assumptions.append(f"water cost of ${water_cost:.2f} USD/m³")
+
+        # Carga orgánica relativa: DQO medida frente a la típica del sector
+        cod_typical = _range_midpoint(
+            proposal_service._get_typical_value(sector, subsector, "COD_STANDARD")
+        )
+        cod_measured = parse_quantity(_answer(collected_data, "8_COD"))
+        load_factor = 1.0
+        if cod_typical and cod_measured:
+            load_factor = float(np.clip(cod_measured / cod_typical, 0.5, 3.0))
+
+        return self._evaluate(
+            sector,
+            profile,
+            flow,
+            consumption,
+            water_cost,
+            load_factor,
+            tuple(assumptions),
+        )
+
+    def _evaluate(
+        self,
+        sector: str,
+        profile: SectorProfile,
+        flow: float,
+        consumption: float,
+        water_cost: float,
+        load_factor: float,
+        assumptions: Tuple[str, ...],
+    ) -> FinancialModel:
+        stages = profile.stages
+        hrt = np.array([s.hrt_hours for s in stages])
+        surface_rate = np.array([s.surface_rate for s in stages])
+        cost_a = np.array([s.cost_a for s in stages])
+        cost_b = np.array([s.cost_b for s in stages])
+        kwh = np.array([s.kwh_per_m3 for s in stages])
+        chemicals = np.array([s.chemicals_usd_m3 for s in stages])
+
+        # Ejes: caudal de diseño (F, 1) × etapas (1, S); reúso (1, R)
+        design_flow = (flow * FLOW_FACTORS)[:, None]
+        # Las etapas biológicas crecen con la carga orgánica
+        biological = hrt >= 10
+        volume = design_flow * hrt / 24.0 * np.where(biological, load_factor, 1.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            area = np.where(surface_rate > 0, design_flow / 24.0 / surface_rate, 0.0)
+        equipment = (
+            cost_a * design_flow**cost_b * np.where(biological, load_factor**0.5, 1.0)
+        )
+
+        equipment_total = equipment.sum(axis=1, keepdims=True)  # (F, 1)
+        installation = equipment_total * INSTALLATION_FRACTION
+        engineering = equipment_total * ENGINEERING_FRACTION
+        capex = equipment_total + installation + engineering
+
+        treated_month = flow * DAYS_PER_MONTH
+        energy = kwh.sum() * treated_month * ENERGY_COST_USD_KWH
+        chemicals_month = chemicals.sum() * treated_month * load_factor
+        labor = profile.labor_usd_month * (flow / 100.0) ** 0.5
+        maintenance = equipment_total * MAINTENANCE_FRACTION / 12.0
+        opex = energy + chemicals_month + labor + maintenance  # (F, 1)
+
+        reuse = np.clip(profile.reuse_fraction * REUSE_SPREAD, 0.0, 0.95)
+        current_cost = consumption * DAYS_PER_MONTH * water_cost
+        savings = flow * DAYS_PER_MONTH * reuse * water_cost  # (R,)
+        net = savings[None, :] - opex  # (F, R)
+        with np.errstate(divide="ignore"):
+            payback = np.where(net > 0, capex / (net * 12.0), np.inf)
+        payback = np.where(payback > MAX_PAYBACK_YEARS, np.inf, payback)
+
+        f, r = BASE
+        return FinancialModel(
+            sector=sector,
+            stages=stages,
+            flow_m3_day=flow,
+            design_flow_m3_day=float(design_flow[f, 0]),
+            water_cost_usd_m3=water_cost,
+            assumptions=assumptions,
+            load_factor=load_factor,
+            stage_volume_m3=volume[f],
+            stage_area_m2=area[f],
+            stage_cost_usd=equipment[f],
+            capex={
+                "equipment": float(equipment_total[f, 0]),
+                "installation": float(installation[f, 0]),
+                "engineering": float(engineering[f, 0]),
+                "total": float(capex[f, 0]),
+            },
+            opex_month={
+                "chemicals": float(chemicals_month),
+                "energy": float(energy),
+                "labor": float(labor),
+                "maintenance": float(maintenance[f, 0]),
+                "total": float(opex[f, 0]),
+            },
+            roi={
+                "current_cost": float(current_cost),
+                "projected_cost": float(max(current_cost - savings[r], 0.0)),
+                "savings": float(savings[r]),
+                "net_savings": float(net[f, r]),
+                "payback_years": float(payback[f, r]),
+            },
+            payback_grid=payback,
+            reuse_grid=reuse,
+        )
+
+    @staticmethod
+    def _dimensions(volume: float, area: float) -> str:
+        if volume > 0:
+            side = (volume / TANK_DEPTH_M) ** 0.5
+            return f"{side:.1f} × {side:.1f} × {TANK_DEPTH_M:.1f} m"
+        if area > 0:
+            diameter = (4 * area / np.pi) ** 0.5
+            return f"Ø {diameter:.1f} m"
+        return "Skid-mounted"
+
+    def design_basis(self, model: FinancialModel) -> str:
+        """Cifras base del cálculo para los prompts de las secciones LLM"""
+        lines = [
+            f"- Caudal promedio: {model.flow_m3_day:,.0f} m³/día",
+            f"- Caudal de diseño: {model.design_flow_m3_day:,.0f} m³/día",
+            f"- Costo actual del agua: ${model.water_cost_usd_m3:.2f} USD/m³",
+            f"- Tren de tratamiento: {', '.join(stage.name for stage in model.stages)}",
+            f"- CAPEX total: ${model.capex['total']:,.0f} USD; "
+            f"OPEX mensual: ${model.opex_month['total']:,.0f} USD",
+        ]
+        if model.assumptions:
+            lines.append(
+                "- Supuestos (no vienen de la conversación): "
+                + "; ".join(model.assumptions)
+            )
+        return "\n".join(lines)
+
+    def equipment_markdown(self, model: FinancialModel) -> str:
+        """Tabla de equipos dimensionados para el escenario base"""
+        flow_h = model.design_flow_m3_day / 24.0
+        lines = [
+            "| **Equipment** | **Capacity** | **Dimensions** | **Est. Cost (USD)** |",
+            "| ------------- | ------------ | -------------- | ------------------- |",
+        ]
+        for stage, volume, area, cost in zip(
+            model.stages,
+            model.stage_volume_m3,
+            model.stage_area_m2,
+            model.stage_cost_usd,
+        ):
+            capacity = f"{volume:,.0f} m³" if volume > 0 else f"{flow_h:,.1f} m³/h"
+            lines.append(
+                f"| {stage.name} | {capacity} | {self._dimensions(volume, area)} | ${cost:,.0f} |"
+            )
+        lines.append("")
+        lines.append(
+            f"Sized for a design flow of {model.design_flow_m3_day:,.0f} m³/day "
+            f"(average {model.flow_m3_day:,.0f} m³/day)."
+        )
+        return "\n".join(lines)
+
+    def financial_markdown(self, model: FinancialModel) -> str:
+        """CAPEX, OPEX, ROI y tabla de sensibilidad (secciones 7 y 8)"""
+        capex, opex, roi = model.capex, model.opex_month, model.roi
+        payback = roi["payback_years"]
+        payback_text = (
+            f"{payback:.1f} years"
+            if np.isfinite(payback)
+            else f"Not reached within {MAX_PAYBACK_YEARS:.0f} years"
+        )
+
+        lines = [
+            f"**CAPEX: ${capex['total']:,.0f} USD**",
+            f"- Equipment: ${capex['equipment']:,.0f} USD",
+            f"- Installation: ${capex['installation']:,.0f} USD",
+            f"- Engineering: ${capex['engineering']:,.0f} USD",
+            "",
+            f"**Monthly OPEX: ${opex['total']:,.0f} USD**",
+            f"- Chemicals: ${opex['chemicals']:,.0f} USD",
+            f"- Energy: ${opex['energy']:,.0f} USD",
+            f"- Labor: ${opex['labor']:,.0f} USD",
+            f"- Maintenance: ${opex['maintenance']:,.0f} USD",
+            "",
+            "**8. Return on Investment Analysis**",
+            f"- Current water cost: ${roi['current_cost']:,.0f} USD/month",
+            f"- Projected water cost: ${roi['projected_cost']:,.0f} USD/month",
+            f"- Monthly savings: ${roi['savings']:,.0f} USD",
+            f"- ROI period: {payback_text}",
+            "",
+            "| **Design Flow** | "
+            + " | ".join(
+                f"**{level} Reuse ({share:.0%})**"
+                for level, share in zip(REUSE_LEVELS, model.reuse_grid)
+            )
+            + " |",
+            "| --------------- | " + " | ".join("---" for _ in REUSE_LEVELS) + " |",
+        ]
+        for factor, row in zip(FLOW_FACTORS, model.payback_grid):
+            cells = " | ".join(
+                (
+                    f"{years:.1f} yrs"
+                    if np.isfinite(years)
+                    else f"> {MAX_PAYBACK_YEARS:.0f} yrs"
+                )
+                for years in row
+            )
+            lines.append(f"| {model.flow_m3_day * factor:,.0f} m³/day | {cells} |")
+
+        if model.assumptions:
+            lines.append("")
+            lines.append("_Assumptions: " + "; ".join(model.assumptions) + "._")
+        return "\n".join(lines)
+
+
+# Instancia global
+financial_engine = FinancialEngine()
@@ -0,0 +1,365 @@
+"""
+Análisis de laboratorio en hojas de cálculo (XLSX, CSV).
+
+- Detecta las columnas de parámetros (DQO, DBO, SST, SDT, pH, GyA) y su
+  unidad (en el encabezado o en una fila de unidades), convierte a mg/L y
+  calcula mínimo, media y p95 sobre todas las muestras con pandas, sin
+  recorrer las filas en Python
+- También reconoce el formato "largo" de los informes (una fila por
+  parámetro, una columna por muestra)
+- Corre en document_extraction_pool y, al subir el archivo, escribe los
+  resultados en collected_data bajo las sub-preguntas de parámetros de la
+  ruta (p. ej. IAB_8_COD): el cuestionario ya no pregunta esos valores.
+  Si el archivo llega antes de elegir sector/subsector, questionnaire_flow
+  los vuelve a aplicar cuando la ruta se completa
+"""
+
+import re
+import logging
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from app.core.process_pool import document_extraction_pool
+from app.services.document_extraction import (
+    EXTRACTABLE_TYPES,
+    document_extraction_service,
+)
+from app.services.questionnaire_service import questionnaire_service
+
+logger = logging.getLogger("hydrous")
+
+# Parámetro (sufijo de las sub-preguntas) → nombres habituales (es/en)
+PARAMETER_PATTERNS = {
+    "COD": r"\b(?:dqo|cod)\b|demanda\s+qu[ií]mica|chemical\s+oxygen",
+    "BOD": r"\b(?:dbo|bod)[5₅]?\b|demanda\s+bioqu[ií]mica|biochemical\s+oxygen",
+    "TSS": r"\b(?:sst|tss)\b|s[óo]lidos\s+suspendidos|suspended\s+solids",
+    "TDS": r"\b(?:sdt|tds)\b|s[óo]lidos\s+disueltos|dissolved\s+solids",
+    "PH": r"\bph\b",
+    "FOG": r"\b(?:gya|fog|o&g)\b|grasas\s+y\s+aceites|aceites\s+y\s+grasas|oil\s+(?:and|&)\s+grease",
+}
+
+PARAMETER_LABELS = {
+    "COD": "DQO",
+    "BOD": "DBO",
+    "TSS": "SST",
+    "TDS": "SDT",
+    "PH": "pH",
+    "FOG": "GyA",
+}
+
+# Unidad → factor a mg/L, en orden: "mg/l" antes que "g/l", "kg/m3" antes que "g/m3"
+UNIT_FACTORS = (
+    (r"[µμu]g\s*/\s*l\b|\bppb\b", 0.001),
+    (r"kg\s*/\s*m\s*[3³]", 1000.0),
+    (r"mg\s*/\s*l\b|\bppm\b|g\s*/\s*m\s*[3³]", 1.0),
+    (r"\bg\s*/\s*l\b", 1000.0),
+)
+
+# Filas donde se busca el encabezado (los informes suelen tener título)
+HEADER_SEARCH_ROWS = 20
+
+# Columnas que, en formato largo, contienen la unidad
+_UNIT_HEADER = re.compile(r"unidad|unit", re.IGNORECASE)
+# Columnas que no son muestras del agua residual cruda: agua tratada, límites
+# normativos, métodos
+_EXCLUDED_HEADER = re.compile(
+    r"salida|outlet|tratad|treated|l[íi]mite|limit|norma|\blmp\b|detecci|detection|"
+    r"m[ée]todo|method",
+    re.IGNORECASE,
+)
+_ANY_PARAMETER = "|".join(f"(?:{p})" for p in PARAMETER_PATTERNS.values())
+_ANY_UNIT = "|".join(f"(?:{p})" for p, _factor in UNIT_FACTORS)
+# Celda con un resultado: número, quizá con "<" (límite de detección) y unidad
+_RESULT_CELL = rf"^\s*[<>≤≥~]?\s*(-?\d[\d.,]*)\s*(?:{_ANY_UNIT})?\s*$"
+
+_NO_SAMPLES = pd.DataFrame(columns=["parameter", "value"])
+
+
+def _parameter_of(text: Any) -> Optional[str]:
+    text = str(text).lower()
+    for parameter, pattern in PARAMETER_PATTERNS.items():
+        if re.search(pattern, text):
+            return parameter
+    return None
+
+
+def _unit_factor(text: Any) -> Optional[float]:
+    text = str(text).lower()
+    for pattern, factor in UNIT_FACTORS:
+        if re.search(pattern, text):
+            return factor
+    return None
+
+
+def _numeric(values: pd.Series) -> pd.Series:
+    """Resultados de celdas con texto ("<5", "1,234.5", "12,5 mg/L") → float"""
+    number = values.astype(str).str.extract(_RESULT_CELL, flags=re.IGNORECASE)[0]
+    both = number.str.contains(",", na=False) & number.str.contains(
+        ".", regex=False, na=False
+    )
+    # "1,234.5": la coma es de miles; si no, es decimal ("12,5")
+    number = number.where(~both, number.str.replace(",", "", regex=False))
+    number = number.str.replace(",", ".", regex=False)
+    return pd.to_numeric(number, errors="coerce")
+
+
+def _header_row(frame: pd.DataFrame) -> int:
+    """Fila (de las primeras) con más nombres de parámetros"""
+    head = frame.head(HEADER_SEARCH_ROWS).astype(str)
+    matches = head.apply(
+        lambda column: column.str.lower().str.contains(_ANY_PARAMETER, regex=True)
+    ).sum(axis=1)
+    return int(matches.idxmax()) if len(matches) and matches.max() > 0 else -1
+
+
+def _wide_samples(frame: pd.DataFrame, header: int) -> pd.DataFrame:
+    """Una columna por parámetro y una fila por muestra"""
+    names = frame.iloc[header].astype(str)
+    parameters = names.map(_parameter_of)
+    columns = parameters[
+        parameters.notna() & ~names.str.contains(_EXCLUDED_HEADER)
+    ].index
+    body = frame.iloc[header + 1 :]
+
+    factors = names[columns].map(_unit_factor)
+    # Fila de unidades bajo el encabezado
+    if len(body) and (
+        body.iloc[0][columns]
+        .astype(str)
+        .str.lower()
+        .str.contains(_ANY_UNIT, regex=True)
+        .any()
+    ):
+        factors = factors.fillna(body.iloc[0][columns].map(_unit_factor))
+        body = body.iloc[1:]
+
+    values = body[columns].apply(_numeric).mul(factors.fillna(1.0), axis=1)
+    samples = values.melt(var_name="column", value_name="value")
+    samples["parameter"] = samples["column"].map(parameters)
+    return samples[["parameter", "value"]]
+
+
+def _long_samples(frame: pd.DataFrame) -> pd.DataFrame:
+    """Una fila por parámetro y una o varias columnas de resultados"""
+    parameters = frame.apply(lambda column: column.map(_parameter_of))
+    name_column = parameters.notna().sum().idxmax()
+    rows = parameters[name_column].notna()
+    if rows.sum() < 2:
+        return _NO_SAMPLES
+
+    block = frame[rows]
+    # Encabezados: lo que hay sobre la primera fila de parámetros
+    headers = (
+        frame.loc[: rows.idxmax() - 1]
+        .astype(str)
+        .agg(" ".join)
+        .reindex(frame.columns, fill_value="")
+    )
+    others = [column for column in frame.columns if column != name_column]
+    unit_columns = [c for c in others if _UNIT_HEADER.search(headers[c])]
+    numbers = block[others].apply(_numeric)
+    result_columns = [
+        c
+        for c in others
+        if c not in unit_columns
+        and not _EXCLUDED_HEADER.search(headers[c])
+        and numbers[c].notna().any()
+    ]
+    if not result_columns:
+        return _NO_SAMPLES
+
+    units = block[unit_columns[0]] if unit_columns else block[name_column]
+    factors = units.map(_unit_factor).fillna(1.0)
+    values = numbers[result_columns].mul(factors, axis=0)
+    values.insert(0, "parameter", parameters.loc[rows, name_column])
+    return values.melt(id_vars="parameter", value_name="value")[["parameter", "value"]]
+
+
+def _sheet_samples(frame: pd.DataFrame) -> pd.DataFrame:
+    frame = frame.dropna(how="all").dropna(axis=1, how="all").reset_index(drop=True)
+    frame.columns = range(frame.shape[1])
+    if frame.empty:
+        return _NO_SAMPLES
+    header = _header_row(frame)
+    if header >= 0 and frame.iloc[header].map(_parameter_of).notna().sum() >= 2:
+        return _wide_samples(frame, header)
+    return _long_samples(frame)
+
+
+def analyze_lab_file(path: str, kind: str) -> Dict[str, Dict[str, float]]:
+    """
+    Estadísticas por parámetro en mg/L (pH sin unidad). Corre en el pool de
+    procesos.
+
+    Returns:
+        {"COD": {"min": .., "mean": .., "p95": .., "samples": n}, ...}
+    """
+    if kind == "xlsx":
+        sheets = pd.read_excel(
+            path, sheet_name=None, header=None, dtype=object, engine="openpyxl"
+        ).values()
+    else:
+        try:
+            sheets = [
+                pd.read_csv(path, header=None, dtype=str, sep=None, engine="python")
+            ]
+        except UnicodeDecodeError:
+            sheets = [
+                pd.read_csv(
+                    path,
+                    header=None,
+                    dtype=str,
+                    sep=None,
+                    engine="python",
+                    encoding="latin-1",
+                )
+            ]
+
+    samples = pd.concat([_sheet_samples(sheet) for sheet in sheets], ignore_index=True)
+    samples["value"] = pd.to_numeric(samples["value"], errors="coerce")
+    valid = samples["value"].ge(0) & (
+        samples["parameter"].ne("PH") | samples["value"].le(14)
+    )
+    samples = samples[valid]
+    if samples.empty:
+        return {}
+
+    grouped = samples.groupby("parameter")["value"]
+    stats = grouped.agg(["min", "mean", "count"])
+    stats["p95"] = grouped.quantile(0.95)
+    return {
+        parameter: {
+            "min": float(row["min"]),
+            "mean": float(row["mean"]),
+            "p95": float(row["p95"]),
+            "samples": int(row["count"]),
+        }
+        for parameter, row in stats.iterrows()
+    }
+
+
+def _format_number(value: float) -> str:
+    # Dos decimales como máximo: "1.234" se leería como miles
+    return f"{value:.2f}".rstrip("0").rstrip(".")
+
+
+def format_parameter(parameter: str, stats: Dict[str, float]) -> str:
+    """ "450 mg/L (mín 300, p95 610; 12 muestras)": el primer número es la media"""
+    unit = "" if parameter == "PH" else " mg/L"
+    return (
+        f"{_format_number(stats['mean'])}{unit} (mín {_format_number(stats['min'])}, "
+        f"p95 {_format_number(stats['p95'])}; {stats['samples']} muestras)"
+    )
+
+
+class LabAnalysisService:
+    """Lleva los análisis de laboratorio subidos al cuestionario"""
+
+    LAB_KINDS = ("xlsx", "text")
+
+    def can_analyze(self, content_type: Optional[str]) -> bool:
+        return self._kind(content_type) is not None
+
+    def _kind(self, content_type: Optional[str]) -> Optional[str]:
+        kind = EXTRACTABLE_TYPES.get((content_type or "").split(";")[0].strip())
+        return kind if kind in self.LAB_KINDS else None
+
+    async def analyze(
+        self, file_path: str, content_type: Optional[str]
+    ) -> Dict[str, Dict[str, float]]:
+        """Estadísticas de los parámetros del archivo; {} si no es un análisis"""
+        kind = self._kind(content_type)
+        if kind is None:
+            return {}
+        try:
+            async with document_extraction_service.local_file(file_path) as local_path:
+                return await document_extraction_pool.run(
+                    analyze_lab_file, local_path, kind
+                )
+        except Exception as e:
+            logger.warning(
+                f"No se pudo analizar {file_path} como análisis de laboratorio: {e}"
+            )
+            return {}
+
+    def apply(
+        self,
+        metadata: Dict[str, Any],
+        results: Dict[str, Dict[str, float]],
+        filename: str,
+    ) -> List[str]:
+        """
+        Guarda los resultados en metadata["lab_analysis"] y los escribe en
+        collected_data bajo las sub-preguntas de parámetros de la ruta actual
+        (ver reapply).
+
+        Returns:
+            IDs escritos
+        """
+        if not results:
+            return []
+        metadata["lab_analysis"] = {"filename": filename, "parameters": results}
+        return self.reapply(metadata)
+
+    def reapply(self, metadata: Dict[str, Any]) -> List[str]:
+        """
+        Escribe los resultados guardados en metadata["lab_analysis"] bajo las
+        sub-preguntas de parámetros de la ruta actual (sin pisar respuestas
+        del usuario). Si todas las sub-preguntas de una pregunta quedan
+        respondidas, la pregunta también se da por respondida.
+
+        Se vuelve a llamar al elegir sector/subsector: si el archivo se subió
+        antes, la ruta solo tenía las preguntas iniciales.
+
+        Returns:
+            IDs escritos
+        """
+        stored = metadata.get("lab_analysis") or {}
+        results = stored.get("parameters")
+        filename = stored.get("filename", "")
+        if not results:
+            return []
+
+        collected_data = metadata.setdefault("collected_data", {})
+        index = questionnaire_service.get_path_index(
+            metadata.get("selected_sector"), metadata.get("selected_subsector")
+        )
+        written = []
+        for question_id in index.ids:
+            question = questionnaire_service.all_questions_base.get(question_id)
+            if question is None or not question.sub_questions:
+                continue
+            for sub in question.sub_questions:
+                # IAB_8_COD, CHT_8_TDS_HVAC → parámetro tras el número
+                parameter = next(
+                    (part for part in sub.id.split("_")[2:] if part in results), None
+                )
+                if parameter and sub.id not in collected_data:
+                    collected_data[sub.id] = format_parameter(
+                        parameter, results[parameter]
+                    )
+                    written.append(sub.id)
+            if question_id not in collected_data and all(
+                sub.id in collected_data for sub in question.sub_questions
+            ):
+                collected_data[question_id] = (
+                    f"Valores del análisis de laboratorio ({filename})"
+                )
+                written.append(question_id)
+
+        logger.info(
+            f"Análisis de laboratorio {filename}: {', '.join(results)} → {written or 'sin preguntas'}"
+        )
+        return written
+
+    def summary(self, results: Dict[str, Dict[str, float]]) -> str:
+        """Resultados en markdown para los mensajes de la conversación"""
+        return "\n".join(
+            f"- {PARAMETER_LABELS[parameter]}: {format_parameter(parameter, stats)}"
+            for parameter, stats in results.items()
+        )
+
+
+# Instancia global
+lab_analysis_service = LabAnalysisService()
@@ -1,14 +1,13 @@
+import json
 import secrets
-import smtplib
 from datetime import datetime, timedelta
 from typing import Optional, Dict
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import logging
-import redis.asyncio as redis
 
 from app.config import settings
+from app.core.redis_manager import redis_manager
 from app.services.auth_service import auth_service
+from app.services.email_service import email_service
 from app.repositories.user_repository import user_repository
 
 logger = logging.getLogger("hydrous")
@@ -28,36 +27,18 @@ class PasswordResetService:
     """
 
     def __init__(self):
-        # Cliente Redis para almacenar tokens temporales
-        redis_url = (
-            settings.REDIS_URL
-            if hasattr(settings, "REDIS_URL")
-            else "redis://localhost:6379"
-        )
-        self.redis_client = redis.Redis.from_url(redis_url, decode_responses=True)
-
         # Prefijo para keys de reset
         self.RESET_TOKEN_PREFIX = "password_reset:"
 
-        # Configuración de email
-        self.smtp_server = (
-            settings.SMTP_SERVER if hasattr(settings, "SMTP_SERVER") else "localhost"
-        )
-        self.smtp_port = settings.SMTP_PORT if hasattr(settings, "SMTP_PORT") else 587
-        self.smtp_user = settings.SMTP_USER if hasattr(settings, "SMTP_USER") else ""
-        self.smtp_password = (
-            settings.SMTP_PASSWORD if hasattr(settings, "SMTP_PASSWORD") else ""
-        )
-        self.from_email = (
-            settings.FROM_EMAIL
-            if hasattr(settings, "FROM_EMAIL")
-            else "noreply@hydrous.com"
-        )
-
         # Configuración de tokens
         self.token_expiration_hours = 1  # Tokens expiran en 1 hora
         self.max_attempts_per_hour = 3  # Máximo 3 intentos por hora por email
 
+    @property
+    def redis_client(self):
+        """Cliente Redis compartido (pool del RedisManager)"""
+        return redis_manager.client
+
     async def request_password_reset(self, email: str) -> Dict[str, any]:
         """
         Inicia el proceso de recuperación de contraseña.
@@ -96,7 +77,7 @@ class PasswordResetService:
                 email=email, token=reset_token, user_id=str(user.id)
             )
 
-            # 5. Enviar email
+            # 5. Encolar email (lo envía el worker)
             await self._send_reset_email(
                 to_email=email, reset_token=reset_token, user_name=user.first_name
             )
@@ -227,16 +208,17 @@ class PasswordResetService:
                 "token": token,
             }
 
-            # Almacenar con expiración
+            # Almacenar con expiración y, por email, el contador para rate limiting
+            # (un solo round trip)
             expiration_seconds = self.token_expiration_hours * 3600
-            await self.redis_client.setex(
-                reset_key, expiration_seconds, json.dumps(token_data)
-            )
-
-            # También almacenar por email para rate limiting
             email_key = f"reset_attempts:{email}"
-            await self.redis_client.incr(email_key)
-            await self.redis_client.expire(email_key, 3600)  # 1 hora
+            await redis_manager.execute_batch(
+                [
+                    ("setex", reset_key, expiration_seconds, json.dumps(token_data)),
+                    ("incr", email_key),
+                    ("expire", email_key, 3600),  # 1 hora
+                ]
+            )
 
         except Exception as e:
             logger.error(f"Error almacenando reset token: {e}")
@@ -244,18 +226,14 @@ class PasswordResetService:
 
     async def _send_reset_email(self, to_email: str, reset_token: str, user_name: str):
         """
-        Envía el email de recuperación de contraseña.
+        Encola el email de recuperación de contraseña.
+
+        El envío SMTP lo hace el worker de emails, fuera de la petición.
         """
         try:
             # Construir URL de reset
             reset_url = f"{settings.FRONTEND_URL}/reset-password?token={reset_token}"
 
-            # Crear mensaje
-            message = MIMEMultipart()
-            message["From"] = self.from_email
-            message["To"] = to_email
-            message["Subject"] = "Recuperación de contraseña - Hydrous"
-
             # Cuerpo del email
             body = f"""
             Hola {user_name},
@@ -273,20 +251,12 @@ class PasswordResetService:
             El equipo de Hydrous
             """
 
-            message.attach(MIMEText(body, "plain"))
-
-            # Enviar email
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                if self.smtp_user and self.smtp_password:
-                    server.login(self.smtp_user, self.smtp_password)
-
-                server.send_message(message)
-
-            logger.info(f"Email de reset enviado a: {to_email}")
+            await email_service.enqueue(
+                to_email, "Recuperación de contraseña - Hydrous", body
+            )
 
         except Exception as e:
-            logger.error(f"Error enviando email de reset: {e}")
+            logger.error(f"Error encolando email de reset: {e}")
             raise
 
     async def _check_rate_limit(self, email: str) -> bool:
@@ -312,8 +282,9 @@ class PasswordResetService:
         """
         try:
             email_key = f"reset_attempts:{email}"
-            await self.redis_client.incr(email_key)
-            await self.redis_client.expire(email_key, 3600)
+            await redis_manager.execute_batch(
+                [("incr", email_key), ("expire", email_key, 3600)]
+            )
         except Exception as e:
             logger.error(f"Error tracking failed attempt: {e}")
 
@@ -0,0 +1,121 @@
+import os
+import uuid
+import hashlib
+import logging
+from typing import Optional
+
+from app.config import settings
+
+logger = logging.getLogger("hydrous")
+
+
+class PDFCache:
+    """
+    Caché en disco de PDFs direccionada por contenido.
+
+    La clave es sha256(texto de la propuesta + versión del renderer + versión
+    de estilos): el mismo texto siempre produce el mismo archivo, así que no
+    hace falta volver a renderizar ni guardar copias .bak. Cambiar el renderer
+    o los estilos cambia la versión e invalida las entradas antiguas.
+
+    Eviction LRU acotada por número de archivos y bytes totales; la fecha de
+    modificación se actualiza en cada acierto y sirve como "último uso".
+    """
+
+    def __init__(self):
+        self.cache_dir = os.path.join(settings.UPLOAD_DIR, "pdf_cache")
+        self.max_files = settings.PDF_CACHE_MAX_FILES
+        self.max_bytes = settings.PDF_CACHE_MAX_BYTES
+
+    def cache_key(
+        self, proposal_text: str, renderer_version: str, style_version: str
+    ) -> str:
+        digest = hashlib.sha256()
+        for part in (renderer_version, style_version, proposal_text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def get(self, key: str) -> Optional[str]:
+        """Devuelve la ruta del PDF en caché (y lo marca como usado) o None"""
+        path = self.path_for(key)
+        try:
+            if os.path.getsize(path) > 0:
+                os.utime(path)
+                return path
+        except OSError:
+            pass
+        return None
+
+    def temp_path_for(self, key: str) -> str:
+        """Ruta temporal donde renderizar antes de publicar con commit()"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        return os.path.join(self.cache_dir, f"{key}.{uuid.uuid4().hex}.tmp")
+
+    def commit(self, key: str, temp_path: str) -> Optional[str]:
+        """
+        Publica un PDF renderizado (rename atómico) y aplica la eviction.
+
+        Returns:
+            str: Ruta final en caché o None si el archivo temporal no es válido
+        """
+        try:
+            if os.path.getsize(temp_path) == 0:
+                os.remove(temp_path)
+                return None
+        except OSError:
+            return None
+
+        path = self.path_for(key)
+        os.replace(temp_path, path)
+        os.chmod(path, 0o644)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """
+        Elimina los PDFs menos usados hasta cumplir los límites.
+
+        Returns:
+            int: Archivos eliminados
+        """
+        try:
+            entries = []
+            for entry in os.scandir(self.cache_dir):
+                # Los .tmp son renders en curso
+                if not entry.is_file() or not entry.name.endswith(".pdf"):
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError as e:
+            logger.warning(f"No se pudo revisar la caché de PDFs: {e}")
+            return 0
+
+        total_bytes = sum(size for _, size, _ in entries)
+        total_files = len(entries)
+        removed = 0
+
+        # Más antiguos primero
+        for _, size, path in sorted(entries):
+            if total_files <= self.max_files and total_bytes <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_files -= 1
+            total_bytes -= size
+            removed += 1
+
+        if removed:
+            logger.info(f"Caché de PDFs: {removed} archivos eliminados (LRU)")
+        return removed
+
+
+# Instancia global
+pdf_cache = PDFCache()
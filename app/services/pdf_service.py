@@ -11,6 +11,12 @@ from typing import Optional
 # -------------------------------
 
 from app.config import settings
+from app.core.process_pool import pdf_render_pool
+from app.services.proposal_markdown import (
+    BASIC_THEME,
+    DIRECT_THEME,
+    markdown_to_flowables,
+)
 
 logger = logging.getLogger("hydrous")
 
@@ -157,7 +163,9 @@ class PDFService:
                     pass
             return False
 
-    def _format_proposal_text_to_html(self, proposal_text: str) -> str:
+    def _format_proposal_text_to_html(
+        self, proposal_text: str, conversation_id: Optional[str] = None
+    ) -> str:
         """Mejora la conversión de texto/markdown a HTML, especialmente para tablas."""
 
         import markdown
@@ -176,25 +184,11 @@ class PDFService:
                 # Tomar solo la parte después de ese texto
                 proposal_text = parts[1]
 
-        # Guardar para debug
-        debug_dir = os.path.join(settings.UPLOAD_DIR, "debug")
-        os.makedirs(debug_dir, exist_ok=True)
-        with open(
-            os.path.join(debug_dir, "proposal_pre_html.txt"), "w", encoding="utf-8"
-        ) as f:
-            f.write(proposal_text)
-
         # Conversión simple de markdown a HTML
         html_content = markdown.markdown(
             proposal_text, extensions=["tables", "fenced_code", "nl2br"]
         )
 
-        # Guardar HTML para debug
-        with open(
-            os.path.join(debug_dir, "proposal_html.html"), "w", encoding="utf-8"
-        ) as f:
-            f.write(html_content)
-
         # Crear documento HTML completo con estilos
         complete_html = f"""
         <!DOCTYPE html>
@@ -227,13 +221,43 @@ class PDFService:
 
     async def generate_pdf_from_text(
         self, conversation_id: str, proposal_text: str
+    ) -> Optional[str]:
+        """Genera un PDF a partir del texto de la propuesta (en el pool de procesos)."""
+        return await self._run_in_pool(
+            render_basic_pdf, conversation_id, proposal_text
+        )
+
+    async def generate_direct_pdf(
+        self, conversation_id: str, proposal_text: str
+    ) -> Optional[str]:
+        """
+        Genera un PDF directamente usando ReportLab, sin conversión a HTML
+        (en el pool de procesos).
+        """
+        return await self._run_in_pool(
+            render_direct_pdf, conversation_id, proposal_text
+        )
+
+    async def _run_in_pool(
+        self, renderer, conversation_id: str, proposal_text: str
+    ) -> Optional[str]:
+        try:
+            return await pdf_render_pool.run(
+                renderer, str(conversation_id), proposal_text
+            )
+        except Exception as e:
+            logger.error(
+                f"Error renderizando PDF de {conversation_id} en el pool: {e}"
+            )
+            return None
+
+    def _render_basic_pdf(
+        self, conversation_id: str, proposal_text: str
     ) -> Optional[str]:
         """Genera un PDF a partir del texto de la propuesta ya generado."""
         try:
             from reportlab.lib.pagesizes import A4
-            from reportlab.lib import colors
-            from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-            from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+            from reportlab.platypus import SimpleDocTemplate
 
             # Eliminar marcador y texto previo a la propuesta
             proposal_text = proposal_text.replace(
@@ -246,15 +270,6 @@ class PDFService:
                 if len(parts) > 1:
                     proposal_text = parts[1].strip()
 
-            # Guardar texto crudo para debug
-            debug_dir = os.path.join(settings.UPLOAD_DIR, "debug")
-            os.makedirs(debug_dir, exist_ok=True)
-            with open(
-                os.path.join(debug_dir, f"final_text_{conversation_id}.txt"),
-                "w",
-                encoding="utf-8",
-            ) as f:
-                f.write(proposal_text)
 
             # Crear PDF directo
             pdf_filename = f"propuesta_{conversation_id}.pdf"
@@ -270,29 +285,7 @@ class PDFService:
                 bottomMargin=72,
             )
 
-            # Estilos
-            styles = getSampleStyleSheet()
-
-            # CORREGIDO: Modificar estilos existentes en lugar de añadirlos
-            title_style = styles["Heading1"]
-            title_style.fontSize = 16
-            title_style.textColor = colors.blue
-
-            # Procesar el texto línea por línea
-            elements = []
-            for line in proposal_text.split("\n"):
-                if not line.strip():
-                    elements.append(Spacer(1, 12))
-                    continue
-
-                if line.startswith("# "):
-                    elements.append(Paragraph(line[2:], title_style))
-                elif line.startswith("## "):
-                    elements.append(Paragraph(line[3:], styles["Heading2"]))
-                elif line.startswith("- "):
-                    elements.append(Paragraph("• " + line[2:], styles["BodyText"]))
-                else:
-                    elements.append(Paragraph(line, styles["BodyText"]))
+            elements = markdown_to_flowables(proposal_text, BASIC_THEME)
 
             # Construir PDF
             doc.build(elements)
@@ -302,7 +295,7 @@ class PDFService:
             logger.error(f"Error generando PDF básico: {e}", exc_info=True)
             return None
 
-    async def generate_direct_pdf(
+    def _render_direct_pdf(
         self, conversation_id: str, proposal_text: str
     ) -> Optional[str]:
         """
@@ -311,17 +304,8 @@ class PDFService:
         """
         try:
             from reportlab.lib.pagesizes import A4
-            from reportlab.lib import colors
-            from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-            from reportlab.platypus import (
-                SimpleDocTemplate,
-                Paragraph,
-                Spacer,
-                Table,
-                TableStyle,
-            )
+            from reportlab.platypus import SimpleDocTemplate
             from reportlab.lib.units import cm
-            import re
 
             # Eliminar marcador y cualquier texto previo a la propuesta
             proposal_text = proposal_text.replace(
@@ -332,15 +316,6 @@ class PDFService:
                     "Con esto, hemos completado todas las preguntas"
                 )[1]
 
-            # Guardar texto limpio para depuración
-            debug_dir = os.path.join(settings.UPLOAD_DIR, "debug")
-            os.makedirs(debug_dir, exist_ok=True)
-            with open(
-                os.path.join(debug_dir, f"direct_pdf_text_{conversation_id}.txt"),
-                "w",
-                encoding="utf-8",
-            ) as f:
-                f.write(proposal_text)
 
             # Crear PDF usando ReportLab
             pdf_filename = f"propuesta_{conversation_id}.pdf"
@@ -356,114 +331,7 @@ class PDFService:
                 bottomMargin=2 * cm,
             )
 
-            # Estilos
-            styles = getSampleStyleSheet()
-            styles.add(
-                ParagraphStyle(
-                    name="Title",
-                    parent=styles["Heading1"],
-                    fontSize=18,
-                    spaceAfter=12,
-                    textColor=colors.HexColor("#0056b3"),
-                )
-            )
-            styles.add(
-                ParagraphStyle(
-                    name="Heading2",
-                    parent=styles["Heading2"],
-                    fontSize=14,
-                    spaceAfter=8,
-                    textColor=colors.HexColor("#0056b3"),
-                )
-            )
-            styles.add(
-                ParagraphStyle(
-                    name="Normal", parent=styles["Normal"], fontSize=10, spaceAfter=6
-                )
-            )
-
-            # Procesar texto en elementos para PDF
-            elements = []
-
-            # Separar por líneas y procesar
-            lines = proposal_text.split("\n")
-            in_table = False
-            table_data = []
-
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-
-                # Verificar si es un encabezado
-                if line.startswith("# "):
-                    elements.append(Paragraph(line[2:], styles["Title"]))
-                elif line.startswith("## "):
-                    elements.append(Paragraph(line[3:], styles["Heading2"]))
-                elif line.startswith("### "):
-                    elements.append(Paragraph(line[4:], styles["Heading2"]))
-                # Verificar si es una línea de tabla
-                elif line.startswith("|") and line.endswith("|"):
-                    if not in_table:
-                        in_table = True
-                        table_data = []
-                    cells = [cell.strip() for cell in line.split("|")[1:-1]]
-                    table_data.append(cells)
-                # Si termina la tabla
-                elif in_table and not line.startswith("|"):
-                    if table_data:
-                        # Crear tabla
-                        table = Table(table_data)
-                        table.setStyle(
-                            TableStyle(
-                                [
-                                    (
-                                        "BACKGROUND",
-                                        (0, 0),
-                                        (-1, 0),
-                                        colors.HexColor("#f2f2f2"),
-                                    ),
-                                    ("TEXTCOLOR", (0, 0), (-1, 0), colors.black),
-                                    ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-                                    ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                                    ("FONTSIZE", (0, 0), (-1, 0), 10),
-                                    ("BOTTOMPADDING", (0, 0), (-1, 0), 12),
-                                    ("BACKGROUND", (0, 1), (-1, -1), colors.white),
-                                    ("GRID", (0, 0), (-1, -1), 1, colors.black),
-                                    ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
-                                    ("PADDING", (0, 0), (-1, -1), 6),
-                                ]
-                            )
-                        )
-                        elements.append(table)
-                        elements.append(Spacer(1, 0.5 * cm))
-                    in_table = False
-                    # Procesar esta línea normalmente
-                    elements.append(Paragraph(line, styles["Normal"]))
-                # Si es texto normal y no estamos en una tabla
-                elif not in_table:
-                    elements.append(Paragraph(line, styles["Normal"]))
-
-            # Si terminamos en una tabla
-            if in_table and table_data:
-                table = Table(table_data)
-                table.setStyle(
-                    TableStyle(
-                        [
-                            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#f2f2f2")),
-                            ("TEXTCOLOR", (0, 0), (-1, 0), colors.black),
-                            ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-                            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                            ("FONTSIZE", (0, 0), (-1, 0), 10),
-                            ("BOTTOMPADDING", (0, 0), (-1, 0), 12),
-                            ("BACKGROUND", (0, 1), (-1, -1), colors.white),
-                            ("GRID", (0, 0), (-1, -1), 1, colors.black),
-                            ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
-                            ("PADDING", (0, 0), (-1, -1), 6),
-                        ]
-                    )
-                )
-                elements.append(table)
+            elements = markdown_to_flowables(proposal_text, DIRECT_THEME)
 
             # Construir PDF
             doc.build(elements)
@@ -475,5 +343,14 @@ class PDFService:
             return None
 
 
+# Puntos de entrada del pool de procesos (funciones de módulo, picklables)
+def render_basic_pdf(conversation_id: str, proposal_text: str) -> Optional[str]:
+    return pdf_service._render_basic_pdf(conversation_id, proposal_text)
+
+
+def render_direct_pdf(conversation_id: str, proposal_text: str) -> Optional[str]:
+    return pdf_service._render_direct_pdf(conversation_id, proposal_text)
+
+
 # Instancia global
 pdf_service = PDFService()
@@ -0,0 +1,139 @@
+"""
+Registro de estilos de los PDFs de propuestas.
+
+Se construye una sola vez por proceso (al importar el módulo) y lo comparten
+todos los renderers. Antes cada render llamaba a getSampleStyleSheet() y
+creaba todos los ParagraphStyle / TableStyle de nuevo.
+
+Los registros son de solo lectura (MappingProxyType) y los estilos no deben
+modificarse: para una variante se crea un ParagraphStyle hijo con parent=.
+Al cambiar cualquier estilo hay que subir STYLE_VERSION (forma parte de la
+clave de la caché de PDFs).
+"""
+
+from types import MappingProxyType
+
+from reportlab.lib import colors
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.platypus import TableStyle
+
+STYLE_VERSION = "1"
+
+PRIMARY_COLOR = colors.HexColor("#0056b3")
+HEADER_BACKGROUND = colors.HexColor("#f2f2f2")
+GRID_COLOR = colors.HexColor("#cccccc")
+FOOTER_COLOR = colors.HexColor("#555555")
+
+_sample = getSampleStyleSheet()
+
+_proposal_normal = ParagraphStyle(
+    name="NormalStyle",
+    parent=_sample["Normal"],
+    fontSize=10,
+    spaceAfter=6,
+    leading=12,
+)
+
+PARAGRAPH_STYLES = MappingProxyType(
+    {
+        # Estilos base de ReportLab (PDF de emergencia)
+        "title": _sample["Title"],
+        "heading1": _sample["Heading1"],
+        "heading2": _sample["Heading2"],
+        "normal": _sample["Normal"],
+        "body": _sample["BodyText"],
+        # Propuesta (DirectProposalGenerator)
+        "proposal_title": ParagraphStyle(
+            name="TitleStyle",
+            parent=_sample["Heading1"],
+            fontSize=16,
+            textColor=PRIMARY_COLOR,
+            spaceAfter=10,
+            alignment=1,
+        ),
+        "proposal_heading2": ParagraphStyle(
+            name="Heading2Style",
+            parent=_sample["Heading2"],
+            fontSize=14,
+            textColor=PRIMARY_COLOR,
+            spaceAfter=8,
+            spaceBefore=12,
+        ),
+        "proposal_normal": _proposal_normal,
+        "proposal_bold": ParagraphStyle(
+            name="BoldStyle",
+            parent=_proposal_normal,
+            fontName="Helvetica-Bold",
+        ),
+        "proposal_list": ParagraphStyle(
+            name="ListStyle",
+            parent=_sample["Normal"],
+            fontSize=10,
+            leftIndent=15,
+            spaceAfter=3,
+            bulletIndent=8,
+            leading=12,
+        ),
+        # PDF directo (PDFService.generate_direct_pdf)
+        "direct_title": ParagraphStyle(
+            name="DirectTitle",
+            parent=_sample["Heading1"],
+            fontSize=18,
+            spaceAfter=12,
+            textColor=PRIMARY_COLOR,
+        ),
+        "direct_heading2": ParagraphStyle(
+            name="DirectHeading2",
+            parent=_sample["Heading2"],
+            fontSize=14,
+            spaceAfter=8,
+            textColor=PRIMARY_COLOR,
+        ),
+        "direct_normal": ParagraphStyle(
+            name="DirectNormal", parent=_sample["Normal"], fontSize=10, spaceAfter=6
+        ),
+        # PDF básico (PDFService.generate_pdf_from_text)
+        "basic_title": ParagraphStyle(
+            name="BasicTitle",
+            parent=_sample["Heading1"],
+            fontSize=16,
+            textColor=colors.blue,
+        ),
+    }
+)
+
+TABLE_STYLES = MappingProxyType(
+    {
+        "proposal": TableStyle(
+            [
+                # Encabezado
+                ("BACKGROUND", (0, 0), (-1, 0), HEADER_BACKGROUND),
+                ("TEXTCOLOR", (0, 0), (-1, 0), PRIMARY_COLOR),
+                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+                ("FONTSIZE", (0, 0), (-1, 0), 10),
+                ("BOTTOMPADDING", (0, 0), (-1, 0), 6),
+                # Cuerpo
+                ("FONTSIZE", (0, 1), (-1, -1), 9),
+                ("GRID", (0, 0), (-1, -1), 0.25, GRID_COLOR),
+                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+                ("PADDING", (0, 0), (-1, -1), 4),
+                # Crucial para evitar truncamiento
+                ("WORDWRAP", (0, 0), (-1, -1), True),
+            ]
+        ),
+        "direct": TableStyle(
+            [
+                ("BACKGROUND", (0, 0), (-1, 0), HEADER_BACKGROUND),
+                ("TEXTCOLOR", (0, 0), (-1, 0), colors.black),
+                ("ALIGN", (0, 0), (-1, -1), "LEFT"),
+                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+                ("FONTSIZE", (0, 0), (-1, 0), 10),
+                ("BOTTOMPADDING", (0, 0), (-1, 0), 12),
+                ("BACKGROUND", (0, 1), (-1, -1), colors.white),
+                ("GRID", (0, 0), (-1, -1), 1, colors.black),
+                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+                ("PADDING", (0, 0), (-1, -1), 6),
+            ]
+        ),
+    }
+)
@@ -0,0 +1,139 @@
+import time
+import uuid
+import logging
+from typing import Any, Dict, Optional
+
+from app.config import settings
+from app.core.redis_manager import redis_manager
+from app.core.redis_queue import ReliableQueue
+
+logger = logging.getLogger("hydrous")
+
+
+class ProposalJobService:
+    """
+    Cola persistente de generación de propuestas (LLM + PDF).
+
+    ¿Por qué?
+    - La generación tarda decenas de segundos: la petición HTTP solo encola
+      el trabajo y el cliente consulta /chat/{id}/proposal/status
+    - Los trabajos viven en Redis: sobreviven a reinicios y cualquier worker
+      (python -m app.workers.proposal_worker) puede procesarlos
+
+    Idempotencia: una conversación tiene como máximo un trabajo activo
+    (clave proposal_job_active:{id} con SET NX). Encolar de nuevo mientras
+    está en cola o en proceso devuelve el trabajo existente.
+    """
+
+    ACTIVE_STATUSES = ("queued", "running")
+
+    def __init__(self):
+        self.queue = ReliableQueue(
+            "proposal_jobs",
+            max_attempts=settings.PROPOSAL_JOB_MAX_ATTEMPTS,
+            visibility_timeout=settings.PROPOSAL_JOB_TIMEOUT,
+        )
+        self.JOB_PREFIX = "proposal_job:"
+        self.ACTIVE_PREFIX = "proposal_job_active:"
+        self.JOB_TTL = 7 * 24 * 3600  # El estado se conserva 7 días
+
+    @property
+    def redis_client(self):
+        return redis_manager.client
+
+    async def get_status(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Estado del último trabajo de la conversación.
+
+        Returns:
+            dict: job_id, status, attempts, error, pdf_path... o None si no hay trabajo
+        """
+        job = await self.redis_client.hgetall(f"{self.JOB_PREFIX}{conversation_id}")
+        if not job:
+            return None
+        job["attempts"] = int(job.get("attempts", 0))
+        return job
+
+    async def is_active(self, conversation_id: str) -> bool:
+        """True si la conversación tiene un trabajo en cola o en proceso"""
+        job = await self.get_status(conversation_id)
+        return bool(job) and job.get("status") in self.ACTIVE_STATUSES
+
+    async def enqueue(self, conversation_id: str, user_id: str) -> Dict[str, Any]:
+        """
+        Encola la generación de la propuesta (idempotente por conversación).
+
+        Returns:
+            dict: Estado del trabajo (nuevo o el que ya estaba activo)
+        """
+        conversation_id = str(conversation_id)
+        job_id = str(uuid.uuid4())
+
+        # Solo una petición gana la clave activa; las demás reutilizan el trabajo
+        acquired = await self.redis_client.set(
+            f"{self.ACTIVE_PREFIX}{conversation_id}",
+            job_id,
+            nx=True,
+            ex=settings.PROPOSAL_JOB_TIMEOUT * settings.PROPOSAL_JOB_MAX_ATTEMPTS * 2,
+        )
+        if not acquired:
+            existing = await self.get_status(conversation_id)
+            if existing:
+                logger.info(
+                    f"Trabajo de propuesta {existing.get('job_id')} ya activo para {conversation_id}"
+                )
+                return existing
+
+        now = time.time()
+        job = {
+            "job_id": job_id,
+            "conversation_id": conversation_id,
+            "user_id": str(user_id),
+            "status": "queued",
+            "attempts": 0,
+            "error": "",
+            "pdf_path": "",
+            "created_at": now,
+            "updated_at": now,
+        }
+        await self._write(conversation_id, job)
+        await self.queue.enqueue(
+            {"conversation_id": conversation_id, "user_id": str(user_id)},
+            message_id=job_id,
+        )
+        logger.info(f"Trabajo de propuesta {job_id} encolado para {conversation_id}")
+        return {**job, "created_at": str(now), "updated_at": str(now)}
+
+    async def mark_running(self, conversation_id: str, attempts: int):
+        await self._write(
+            conversation_id, {"status": "running", "attempts": attempts + 1}
+        )
+
+    async def mark_completed(self, conversation_id: str, pdf_path: str):
+        await self._write(
+            conversation_id, {"status": "completed", "pdf_path": pdf_path, "error": ""}
+        )
+        await self.redis_client.delete(f"{self.ACTIVE_PREFIX}{conversation_id}")
+
+    async def mark_failed(self, conversation_id: str, error: str, final: bool):
+        """
+        Registra un intento fallido. Si aún quedan reintentos el trabajo
+        vuelve a 'queued'; si no, queda 'failed' y se libera la clave activa.
+        """
+        await self._write(
+            conversation_id,
+            {"status": "failed" if final else "queued", "error": error[:500]},
+        )
+        if final:
+            await self.redis_client.delete(f"{self.ACTIVE_PREFIX}{conversation_id}")
+
+    async def _write(self, conversation_id: str, fields: Dict[str, Any]):
+        key = f"{self.JOB_PREFIX}{conversation_id}"
+        pipe = redis_manager.pipeline(transaction=True)
+        pipe.hset(key, mapping={**fields, "updated_at": time.time()})
+        pipe.expire(key, self.JOB_TTL)
+        await pipe.execute()
+
+
+# Instancia global
+proposal_job_service = ProposalJobService()
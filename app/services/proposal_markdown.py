@@ -0,0 +1,248 @@
+"""
+Compilador markdown → flowables de ReportLab para las propuestas.
+
+Dos fases:
+1. parse_proposal_markdown(): tokeniza el texto en una representación
+   intermedia inmutable (títulos, párrafos, listas, tablas, líneas en blanco).
+   El resultado se cachea por texto, así que regenerar el PDF del mismo
+   texto (otro renderer, reintentos) no vuelve a parsear.
+2. compile_flowables(): recorre la representación una sola vez y emite los
+   flowables con el tema (estilos) de cada renderer.
+
+Todos los renderers (DirectProposalGenerator y PDFService) usan este módulo;
+ya no hay detección de tablas ni regex de formato duplicadas en cada uno.
+"""
+
+import re
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Tuple, Union
+
+from reportlab.lib.units import cm
+from reportlab.platypus import Paragraph, Spacer, Table
+
+from app.services.pdf_styles import PARAGRAPH_STYLES, TABLE_STYLES
+
+_BOLD_PATTERN = re.compile(r"\*\*(.*?)\*\*")
+_HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*)$")
+
+
+# --- Representación intermedia ---
+
+
+class Heading(NamedTuple):
+    level: int
+    text: str
+
+
+class Text(NamedTuple):
+    text: str
+
+
+class ListItem(NamedTuple):
+    marker: str
+    text: str
+
+
+class TableBlock(NamedTuple):
+    rows: Tuple[Tuple[str, ...], ...]
+
+
+class Blank(NamedTuple):
+    pass
+
+
+Block = Union[Heading, Text, ListItem, TableBlock, Blank]
+
+
+class Theme(NamedTuple):
+    """Estilos y reglas de maquetación de un renderer."""
+
+    heading_styles: Tuple[object, ...]  # índice = nivel - 1 (el último se repite)
+    text_style: object
+    list_style: object
+    table_style: object
+    table_width: Optional[float] = None  # None: ancho automático
+    table_max_cols: Optional[int] = None
+    table_repeat_rows: int = 0
+    table_spacer: float = 0
+    blank_spacer: float = 0  # > 0: las líneas en blanco generan espacio
+
+
+PROPOSAL_THEME = Theme(
+    heading_styles=(
+        PARAGRAPH_STYLES["proposal_title"],
+        PARAGRAPH_STYLES["proposal_heading2"],
+    ),
+    text_style=PARAGRAPH_STYLES["proposal_normal"],
+    list_style=PARAGRAPH_STYLES["proposal_list"],
+    table_style=TABLE_STYLES["proposal"],
+    table_width=16 * cm,
+    table_spacer=0.2 * cm,
+)
+
+DIRECT_THEME = Theme(
+    heading_styles=(
+        PARAGRAPH_STYLES["direct_title"],
+        PARAGRAPH_STYLES["direct_heading2"],
+    ),
+    text_style=PARAGRAPH_STYLES["direct_normal"],
+    list_style=PARAGRAPH_STYLES["direct_normal"],
+    table_style=TABLE_STYLES["direct"],
+    table_spacer=0.5 * cm,
+)
+
+BASIC_THEME = Theme(
+    heading_styles=(PARAGRAPH_STYLES["basic_title"], PARAGRAPH_STYLES["heading2"]),
+    text_style=PARAGRAPH_STYLES["body"],
+    list_style=PARAGRAPH_STYLES["body"],
+    table_style=TABLE_STYLES["direct"],
+    blank_spacer=12,
+)
+
+
+# --- Tokenizador ---
+
+
+def _escape(text: str) -> str:
+    """Escapa el texto para el mini-HTML de Paragraph (un '<' suelto rompe el PDF)"""
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _inline(text: str) -> str:
+    """**negrita** → <b>negrita</b>"""
+    return _BOLD_PATTERN.sub(r"<b>\1</b>", _escape(text))
+
+
+def _plain(text: str) -> str:
+    """Quita los marcadores de negrita (listas)"""
+    return _BOLD_PATTERN.sub(r"\1", _escape(text))
+
+
+def _cell(text: str) -> str:
+    """Las celdas se dibujan como texto plano: sin negrita y sin escapar"""
+    return _BOLD_PATTERN.sub(r"\1", text)
+
+
+def _is_table_line(line: str) -> bool:
+    return line.count("|") >= 2
+
+
+def _parse_table_row(line: str) -> Tuple[str, ...]:
+    cells = []
+    for cell in line.split("|"):
+        cell = cell.strip()
+        if not cell:
+            continue
+        # Guiones solitarios (restos de separadores)
+        if cell == "-":
+            cell = " "
+        cells.append(_cell(cell))
+    return tuple(cells)
+
+
+def _parse_line(line: str) -> Block:
+    heading = _HEADING_PATTERN.match(line)
+    if heading:
+        return Heading(len(heading.group(1)), _inline(heading.group(2)))
+
+    # Encabezados con formato "**Título**"
+    if (
+        line.startswith("**")
+        and line.endswith("**")
+        and len(line) > 4
+        and " " not in line[:5]
+    ):
+        return Heading(2, _plain(line[2:-2]))
+
+    if line.startswith("✓ "):
+        return ListItem("✓", _plain(line[2:]))
+    if line.startswith("- ") or line.startswith("* "):
+        return ListItem("•", _plain(line[2:]))
+
+    return Text(_inline(line))
+
+
+@lru_cache(maxsize=64)
+def parse_proposal_markdown(proposal_text: str) -> Tuple[Block, ...]:
+    """
+    Convierte el markdown de una propuesta en bloques (resultado cacheado).
+
+    Las filas separadoras de tablas (|---|---|) y las reglas horizontales
+    (---) se descartan.
+    """
+    blocks: List[Block] = []
+    table_rows: List[Tuple[str, ...]] = []
+
+    def close_table():
+        if table_rows:
+            blocks.append(TableBlock(tuple(table_rows)))
+            table_rows.clear()
+
+    for raw_line in proposal_text.replace("---", "").split("\n"):
+        line = raw_line.strip()
+
+        if not line:
+            close_table()
+            # Colapsar líneas en blanco consecutivas
+            if blocks and not isinstance(blocks[-1], Blank):
+                blocks.append(Blank())
+            continue
+
+        if _is_table_line(line):
+            row = _parse_table_row(line)
+            if row:
+                table_rows.append(row)
+            continue
+
+        close_table()
+        blocks.append(_parse_line(line))
+
+    close_table()
+    return tuple(blocks)
+
+
+# --- Compilador ---
+
+
+def _build_table(block: TableBlock, theme: Theme) -> Optional[Table]:
+    num_cols = max(len(row) for row in block.rows)
+    if theme.table_max_cols:
+        num_cols = min(num_cols, theme.table_max_cols)
+
+    # Filas rectangulares: ReportLab no admite filas de distinto largo
+    data = [list(row[:num_cols]) + [""] * (num_cols - len(row)) for row in block.rows]
+
+    col_widths = (
+        [theme.table_width / num_cols] * num_cols if theme.table_width else None
+    )
+    table = Table(data, colWidths=col_widths, repeatRows=theme.table_repeat_rows)
+    table.setStyle(theme.table_style)
+    return table
+
+
+def compile_flowables(blocks: Tuple[Block, ...], theme: Theme) -> list:
+    """Emite los flowables de ReportLab en una sola pasada sobre los bloques."""
+    elements = []
+    heading_styles = theme.heading_styles
+
+    for block in blocks:
+        if isinstance(block, Text):
+            elements.append(Paragraph(block.text, theme.text_style))
+        elif isinstance(block, Heading):
+            style = heading_styles[min(block.level, len(heading_styles)) - 1]
+            elements.append(Paragraph(block.text, style))
+        elif isinstance(block, ListItem):
+            elements.append(Paragraph(f"{block.marker} {block.text}", theme.list_style))
+        elif isinstance(block, TableBlock):
+            elements.append(_build_table(block, theme))
+            if theme.table_spacer:
+                elements.append(Spacer(1, theme.table_spacer))
+        elif isinstance(block, Blank) and theme.blank_spacer:
+            elements.append(Spacer(1, theme.blank_spacer))
+
+    return elements
+
+
+def markdown_to_flowables(proposal_text: str, theme: Theme = PROPOSAL_THEME) -> list:
+    """Atajo: parsea (con caché) y compila."""
+    return compile_flowables(parse_proposal_markdown(proposal_text), theme)
@@ -6,6 +6,7 @@ import json
 import re
 from typing import Dict, Any, Optional
 
+from app.core.debug_artifacts import debug_recorder
 from app.models.conversation import Conversation
 
 # Importar ai_service si queremos que LLM refine secciones (Opcional)
@@ -293,16 +294,16 @@ class ProposalService:
         data["DISEÑO_PROCESO_TEXTO"] = (
             "[PENDIENTE - Se requiere análisis detallado o consulta a IA]"
         )
-        data["EQUIPOS_DIMENSIONES_TEXTO"] = (
-            "[PENDIENTE - Se requiere dimensionamiento basado en flujo y carga]"
-        )
-        data["OPEX_RANGE"] = "[Rango OPEX pendiente]"
-        data["ANALISIS_ROI_TEXTO"] = (
-            "[Análisis ROI pendiente - requiere estimaciones CAPEX/OPEX y ahorros]"
-        )
-        data["RESUMEN_Q&A_TEXTO"] = (
-            "[Resumen de preguntas y respuestas clave de la consulta]"  # Podríamos construir esto
+        # Dimensionamiento y cifras financieras deterministas
+        from app.services.financial_engine import financial_engine
+
+        model = financial_engine.calculate(
+            {**metadata, "collected_data": collected_data}
         )
+        data["EQUIPOS_DIMENSIONES_TEXTO"] = financial_engine.equipment_markdown(model)
+        data["OPEX_RANGE"] = f"${model.opex_month['total']:,.0f} USD/mes"
+        data["ANALISIS_ROI_TEXTO"] = financial_engine.financial_markdown(model)
+        data["RESUMEN_Q&A_TEXTO"] = self._generate_qa_summary(collected_data, metadata)
 
         logger.debug(f"Datos formateados para plantilla: {data}")
         return data
@@ -356,16 +357,30 @@ class ProposalService:
             )
             return f"[{section_name} - Error al generar contenido]"
 
-    def _generate_qa_summary(self, collected_data: Dict[str, Any]) -> str:
-        """Genera un resumen de Q&A a partir de los datos recolectados."""
+    def _generate_qa_summary(
+        self, collected_data: Dict[str, Any], metadata: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """Genera un resumen de Q&A en el orden del cuestionario."""
         summary = "A continuación se resumen las preguntas clave y respuestas proporcionadas:\n\n"
         # Importar questionnaire_service aquí para obtener textos de preguntas
         try:
             from app.services.questionnaire_service import questionnaire_service
 
-            for q_id, answer in collected_data.items():
-                q_details = questionnaire_service.get_question_details(q_id)
-                q_text = q_details.get("text", q_id) if q_details else q_id
+            metadata = metadata or {}
+            index = questionnaire_service.get_path_index(
+                metadata.get("selected_sector"), metadata.get("selected_subsector")
+            )
+            # Respuestas fuera de la ruta (p. ej. sub-preguntas) al final
+            ordered = sorted(
+                collected_data.items(),
+                key=lambda item: (
+                    index.position(item[0])
+                    if index.position(item[0]) is not None
+                    else index.total
+                ),
+            )
+            for q_id, answer in ordered:
+                q_text = questionnaire_service.get_question_text(q_id) or q_id
                 # Limpiar placeholders del texto de la pregunta si los hubiera
                 q_text = re.sub(r"{.*?}", "", q_text).strip()
                 summary += f"- **P: {q_text}**\n"
@@ -427,15 +442,11 @@ class ProposalService:
         from app.services.ai_service import ai_service
 
         try:
-            # Log de depuración
-            debug_dir = os.path.join(settings.UPLOAD_DIR, "debug")
-            os.makedirs(debug_dir, exist_ok=True)
-            with open(
-                os.path.join(debug_dir, f"prompt_final_{conversation.id}.txt"),
-                "w",
-                encoding="utf-8",
-            ) as f:
-                f.write(prompt)
+            # Log de depuración (muestreado, en segundo plano)
+            debug_opt_in = conversation.metadata.get("debug_artifacts", False)
+            debug_recorder.record(
+                conversation.id, "prompt_final.txt", prompt, opt_in=debug_opt_in
+            )
 
             # Llamar a la API con temperatura alta para mayor creatividad
             messages = [{"role": "user", "content": prompt}]
@@ -446,12 +457,12 @@ class ProposalService:
             )
 
             # Log de la respuesta
-            with open(
-                os.path.join(debug_dir, f"response_final_{conversation.id}.txt"),
-                "w",
-                encoding="utf-8",
-            ) as f:
-                f.write(proposal_text)
+            debug_recorder.record(
+                conversation.id,
+                "response_final.txt",
+                proposal_text,
+                opt_in=debug_opt_in,
+            )
 
             # Añadir marcador y devolver
             proposal_text = (
@@ -0,0 +1,197 @@
+"""
+Artefacto compilado del cuestionario.
+
+questionnaire_data.py es la única fuente de verdad. Este módulo la compila
+(preguntas en orden y rutas por sector/subsector ya resueltas) a un archivo
+binario marshal compacto que los workers cargan con mmap al primer uso, sin
+importar ni evaluar el literal de ~4.000 líneas.
+
+Formato del archivo:
+    MAGIC | longitud de la cabecera (4 bytes) | cabecera marshal | cuerpo marshal
+
+La cabecera guarda la versión de Python/marshal y el sha256 de
+questionnaire_data.py: si no coinciden (artefacto de otra versión de
+Python o fuente modificada) el artefacto se ignora y se compila en memoria.
+
+Cada cuestionario compilado lleva su versión (structure_version): el hash del
+contenido, igual para el cuestionario de la imagen y para el mismo
+cuestionario publicado con app.services.questionnaire_versions.
+
+Compilar (lo hace el Dockerfile en el build):
+    python -m app.services.questionnaire_artifact [ruta_destino]
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+import marshal
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("hydrous")
+
+MAGIC = b"HYDQST01"
+FORMAT_VERSION = 2
+SOURCE_PATH = os.path.join(os.path.dirname(__file__), "questionnaire_data.py")
+DEFAULT_ARTIFACT_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "data", "questionnaire.bin"
+)
+
+_HEADER_LENGTH = struct.Struct(">I")
+
+
+def source_digest(path: str = SOURCE_PATH) -> str:
+    """sha256 de questionnaire_data.py (identifica la versión compilada)"""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def plain_structure(value: Any) -> Any:
+    """
+    Copia con solo tipos JSON. Quita los marcadores "..." que quedan en
+    algunas listas de opciones abreviadas de questionnaire_data.py.
+    """
+    if isinstance(value, dict):
+        return {k: plain_structure(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain_structure(v) for v in value if v is not Ellipsis]
+    return value
+
+
+def structure_version(structure: Dict[str, Any]) -> str:
+    """Versión de un cuestionario: hash de su contenido en JSON canónico"""
+    canonical = json.dumps(
+        structure, sort_keys=True, ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:12]
+
+
+def _header(digest: str) -> Dict[str, Any]:
+    return {
+        "format": FORMAT_VERSION,
+        "python": tuple(sys.version_info[:2]),
+        "marshal": marshal.version,
+        "source_sha256": digest,
+    }
+
+
+def compile_questionnaire(structure: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Aplana la estructura: índice plano de preguntas por ID (incluidas las
+    sub-preguntas) y la ruta de IDs de cada (sector, subsector). Solo tipos
+    básicos (serializable con marshal y JSON).
+    """
+    structure = plain_structure(structure)
+    questions: Dict[str, Dict[str, Any]] = {}
+    initial_ids: List[str] = []
+
+    def add(q: Dict[str, Any]):
+        questions[q["id"]] = q
+        # Las sub-preguntas (p. ej. parámetros de calidad) también se responden
+        for sub in q.get("sub_questions", []):
+            if "id" in sub:
+                questions.setdefault(sub["id"], sub)
+
+    for q in structure.get("initial_questions", []):
+        if "id" in q:
+            add(q)
+            initial_ids.append(q["id"])
+        else:
+            logger.error(f"Pregunta inicial sin ID encontrada: {q.get('text', 'N/A')}")
+
+    paths: List[tuple] = []
+    for sector, subsectors in structure.get("sector_questionnaires", {}).items():
+        for subsector, sector_questions in subsectors.items():
+            if not isinstance(sector_questions, list):
+                logger.error(
+                    f"Estructura inválida para {sector}/{subsector}. Se esperaba lista, se encontró {type(sector_questions)}"
+                )
+                sector_questions = subsectors.get("Otro", [])
+                if not isinstance(sector_questions, list):
+                    sector_questions = []
+            ids = []
+            for q in sector_questions:
+                if "id" in q:
+                    add(q)
+                    ids.append(q["id"])
+                else:
+                    logger.error(
+                        f"Pregunta sin ID en {sector}/{subsector}: {q.get('text', 'N/A')}"
+                    )
+            paths.append((sector, subsector, tuple(initial_ids + ids)))
+
+    return {
+        "version": structure_version(structure),
+        "initial_greeting": structure.get("initial_greeting", "¡Bienvenido!"),
+        "initial_ids": tuple(initial_ids),
+        "questions": questions,
+        "paths": paths,
+    }
+
+
+def build_artifact(path: str = DEFAULT_ARTIFACT_PATH) -> int:
+    """Compila questionnaire_data.py al artefacto; devuelve su tamaño en bytes"""
+    from app.services.questionnaire_data import QUESTIONNAIRE_STRUCTURE
+
+    header = marshal.dumps(_header(source_digest()))
+    body = marshal.dumps(compile_questionnaire(QUESTIONNAIRE_STRUCTURE))
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(_HEADER_LENGTH.pack(len(header)))
+        f.write(header)
+        f.write(body)
+    os.replace(temp_path, path)
+    return len(MAGIC) + _HEADER_LENGTH.size + len(header) + len(body)
+
+
+def _read_artifact(view: memoryview, path: str) -> Optional[Dict[str, Any]]:
+    if view[: len(MAGIC)] != MAGIC:
+        logger.warning(f"Artefacto de cuestionario inválido: {path}")
+        return None
+    offset = len(MAGIC)
+    (header_length,) = _HEADER_LENGTH.unpack_from(view, offset)
+    offset += _HEADER_LENGTH.size
+    header = marshal.loads(view[offset : offset + header_length])
+    if header != _header(source_digest()):
+        logger.warning(
+            f"Artefacto de cuestionario desactualizado ({path}); "
+            "se compila desde questionnaire_data.py"
+        )
+        return None
+    return marshal.loads(view[offset + header_length :])
+
+
+def load_artifact(path: str = DEFAULT_ARTIFACT_PATH) -> Optional[Dict[str, Any]]:
+    """
+    Carga el artefacto con mmap (sin copia intermedia del archivo).
+
+    Returns:
+        El cuestionario compilado, o None si no existe o no corresponde a
+        esta versión de Python / de questionnaire_data.py
+    """
+    try:
+        with open(path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    return _read_artifact(view, path)
+                finally:
+                    # Liberar la vista antes de cerrar el mmap
+                    view.release()
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, EOFError, TypeError, struct.error) as e:
+        logger.warning(f"No se pudo cargar el artefacto de cuestionario {path}: {e}")
+        return None
+
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_ARTIFACT_PATH
+    size = build_artifact(target)
+    print(f"Artefacto de cuestionario compilado: {target} ({size} bytes)")
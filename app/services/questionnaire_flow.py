@@ -0,0 +1,448 @@
+"""
+Máquina de estados del cuestionario.
+
+El servidor decide qué se pregunta: recorre la ruta compilada del
+sector/subsector (QuestionnaireIndex), salta lo ya respondido y lo que no
+aplica según depends_on, y registra cada respuesta contra el ID real de la
+pregunta en metadata["collected_data"]. El LLM solo redacta la pregunta que
+esta máquina elige (ver ai_service.phrase_question).
+"""
+
+import re
+import logging
+import unicodedata
+from typing import Any, Dict, Optional, Set, Tuple
+
+from app.core.redis_manager import redis_manager
+from app.services.lab_analysis import lab_analysis_service
+from app.services.questionnaire_service import Question, questionnaire_service
+
+logger = logging.getLogger("hydrous")
+
+# Respuestas que cuentan como "no" para depends_on.value_is_negative
+NEGATIVE_ANSWERS = {
+    "no",
+    "n",
+    "nope",
+    "none",
+    "ninguno",
+    "ninguna",
+    "nada",
+    "no tengo",
+    "no se",
+    "no lo se",
+    "n/a",
+    "na",
+}
+
+# Confirmaciones: "sí" en preguntas Sí/No y acuse de las informativas
+AFFIRMATIVE_ANSWERS = {
+    "si",
+    "s",
+    "yes",
+    "y",
+    "yep",
+    "claro",
+    "correcto",
+    "afirmativo",
+    "ok",
+    "okay",
+    "de acuerdo",
+    "entendido",
+    "si, correcto",
+    "asi es",
+    "exacto",
+}
+
+# Hash de Redis con los contadores de turnos (compartido entre workers)
+TURN_STATS_KEY = "questionnaire:turn_stats"
+
+_NUMBERS_ONLY = re.compile(r"^\d+(?:\s*(?:,|;|/|y|and|&)?\s*\d+)*$")
+
+# Respuestas que son una duda sobre la pregunta, no una respuesta
+CLARIFICATION_PREFIXES = (
+    "que es",
+    "que son",
+    "que significa",
+    "a que te refieres",
+    "a que se refiere",
+    "no entiendo",
+    "no entendi",
+    "what is",
+    "what does",
+    "what do you mean",
+)
+
+
+def normalize_answer(text: Any) -> str:
+    """Minúsculas, sin acentos, sin puntuación final ni espacios repetidos."""
+    text = unicodedata.normalize("NFKD", str(text or ""))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.lower().split()).strip(" .!¡?¿")
+
+
+def is_affirmative_answer(answer: Any) -> bool:
+    return normalize_answer(answer) in AFFIRMATIVE_ANSWERS
+
+
+def is_negative_answer(answer: Any) -> bool:
+    normalized = normalize_answer(answer)
+    return normalized in NEGATIVE_ANSWERS or normalized.startswith("no ")
+
+
+class QuestionnaireFlow:
+    """Decide la siguiente pregunta y registra respuestas (sin LLM)."""
+
+    COMPANY_QUESTION_ID = "INIT_0"
+    SECTOR_QUESTION_ID = "INIT_1"
+    SUBSECTOR_QUESTION_ID = "INIT_2"
+
+    def sectors(self) -> Set[str]:
+        return {
+            sector
+            for sector, _ in questionnaire_service.path_indexes
+            if sector is not None
+        }
+
+    def has_path(self, sector: Optional[str], subsector: Optional[str]) -> bool:
+        return (
+            sector is not None
+            and (sector, subsector) in questionnaire_service.path_indexes
+        )
+
+    def resolve_options(
+        self, question: Question, answer: Any, sector: Optional[str] = None
+    ) -> Tuple[str, ...]:
+        """
+        Opciones que corresponden a la respuesta: por número ("2", "1, 5")
+        o por etiqueta exacta (sin distinguir mayúsculas ni acentos).
+        Tupla vacía si la respuesta no coincide con ninguna opción.
+        """
+        options = question.options_for(sector)
+        normalized = normalize_answer(answer)
+        if not options or not normalized:
+            return ()
+
+        if _NUMBERS_ONLY.match(normalized):
+            numbers = [int(n) for n in re.findall(r"\d+", normalized)]
+            if all(1 <= n <= len(options) for n in numbers):
+                return tuple(dict.fromkeys(options[n - 1] for n in numbers))
+            return ()
+
+        for option in options:
+            if normalize_answer(option) == normalized:
+                return (option,)
+        return ()
+
+    def resolve_option(
+        self, question: Question, answer: Any, sector: Optional[str] = None
+    ) -> Optional[str]:
+        """Opción única que corresponde a la respuesta, None si no hay una sola."""
+        matches = self.resolve_options(question, answer, sector)
+        return matches[0] if len(matches) == 1 else None
+
+    def resolve_answer(
+        self, question_id: str, answer: Any, metadata: Dict[str, Any]
+    ) -> Optional[str]:
+        """
+        Normaliza localmente (sin LLM) respuestas a preguntas con opciones
+        definidas: número(s) u etiqueta de la opción y confirmaciones sí/no.
+
+        Returns:
+            Valor canónico para collected_data (etiquetas de las opciones, o
+            "Sí"/"No"), o None si la respuesta es libre y no se reconoce
+        """
+        question = questionnaire_service.all_questions_base.get(question_id)
+        if question is None:
+            return None
+
+        matches = self.resolve_options(
+            question, answer, metadata.get("selected_sector")
+        )
+        if matches:
+            return ", ".join(matches)
+
+        options = {
+            normalize_answer(option): option
+            for option in question.options_for(metadata.get("selected_sector"))
+        }
+        if question.type == "confirmation" or "si" in options:
+            if is_affirmative_answer(answer):
+                return options.get("si", "Sí")
+            if "no" in options and normalize_answer(answer) in NEGATIVE_ANSWERS:
+                return options["no"]
+        return None
+
+    def is_clarification(self, answer: Any) -> bool:
+        """La respuesta es una pregunta del usuario ("¿qué es DQO?")"""
+        text = str(answer or "")
+        return (
+            "?" in text
+            or "¿" in text
+            or normalize_answer(text).startswith(CLARIFICATION_PREFIXES)
+        )
+
+    def accepts_answer(
+        self,
+        question_id: str,
+        answer: Any,
+        metadata: Dict[str, Any],
+        resolved: Optional[str] = None,
+    ) -> bool:
+        """
+        Indica si la respuesta se puede registrar para la pregunta. No se
+        registran las dudas del usuario ni, en preguntas con opciones, lo que
+        no corresponde a ninguna (salvo "sí, ..."/"no, ..." en las de Sí/No y
+        texto libre si hay una opción "Otro"): la pregunta se vuelve a hacer.
+        """
+        if resolved is not None:
+            return True
+        if self.is_clarification(answer):
+            return False
+
+        question = questionnaire_service.all_questions_base.get(question_id)
+        if question is None:
+            return True
+        options = {
+            normalize_answer(option)
+            for option in question.options_for(metadata.get("selected_sector"))
+        }
+        if not options:
+            return True
+        if any(option.startswith("otro") for option in options):
+            return True
+        if "si" in options or "no" in options:
+            first_word = normalize_answer(re.split(r"[\s,;]+", str(answer).strip())[0])
+            return first_word in AFFIRMATIVE_ANSWERS or first_word in NEGATIVE_ANSWERS
+        return False
+
+    def _answer_text(self, question_id: str, answer: Any, sector: Optional[str]) -> str:
+        """Respuesta con los números de opción sustituidos por sus etiquetas."""
+        question = questionnaire_service.all_questions_base.get(question_id)
+        if question is not None:
+            matches = self.resolve_options(question, answer, sector)
+            if matches:
+                return ", ".join(matches)
+        return str(answer)
+
+    def is_applicable(self, question: Question, metadata: Dict[str, Any]) -> bool:
+        """Evalúa depends_on contra las respuestas ya registradas."""
+        condition = question.depends_on
+        if not condition:
+            return True
+
+        answer = metadata.get("collected_data", {}).get(condition.get("id"))
+        if answer is None:
+            # La pregunta de la que depende no se ha respondido (o no aplicó)
+            return False
+
+        sector = metadata.get("selected_sector")
+        text = self._answer_text(condition["id"], answer, sector)
+        if condition.get("value_is_negative"):
+            return is_negative_answer(text)
+        if "value_contains" in condition:
+            return normalize_answer(condition["value_contains"]) in normalize_answer(
+                text
+            )
+        if "value" in condition:
+            return normalize_answer(text) == normalize_answer(condition["value"])
+
+        logger.warning(f"depends_on no reconocido en {question.id}: {condition}")
+        return True
+
+    def canonicalize_path(self, metadata: Dict[str, Any]):
+        """
+        Ajusta sector/subsector del perfil (p. ej. "comercial") a las claves
+        del cuestionario ("Comercial"); los valores desconocidos se conservan.
+        """
+        sectors = {normalize_answer(sector): sector for sector in self.sectors()}
+        sector = sectors.get(normalize_answer(metadata.get("selected_sector")))
+        if sector is None:
+            return
+        metadata["selected_sector"] = metadata["sector"] = sector
+
+        subsectors = {
+            normalize_answer(subsector): subsector
+            for known_sector, subsector in questionnaire_service.path_indexes
+            if known_sector == sector
+        }
+        subsector = subsectors.get(normalize_answer(metadata.get("selected_subsector")))
+        if subsector is not None:
+            metadata["selected_subsector"] = metadata["subsector"] = subsector
+
+    def is_answered(self, question_id: str, metadata: Dict[str, Any]) -> bool:
+        """Las preguntas iniciales también se dan por respondidas con el perfil."""
+        sector = metadata.get("selected_sector")
+        if question_id == self.SECTOR_QUESTION_ID:
+            return sector in self.sectors()
+        if question_id == self.SUBSECTOR_QUESTION_ID:
+            return self.has_path(sector, metadata.get("selected_subsector"))
+        if question_id == self.COMPANY_QUESTION_ID and metadata.get("company_name"):
+            return True
+        return question_id in metadata.get("collected_data", {})
+
+    def next_question_id(self, metadata: Dict[str, Any]) -> Optional[str]:
+        """
+        Primera pregunta de la ruta sin responder que aplica.
+        None cuando el cuestionario está completo.
+        """
+        self.canonicalize_path(metadata)
+        index = questionnaire_service.get_path_index(
+            metadata.get("selected_sector"), metadata.get("selected_subsector")
+        )
+        questions = questionnaire_service.all_questions_base
+        for question_id in index.ids:
+            if self.is_answered(question_id, metadata):
+                continue
+            question = questions.get(question_id)
+            if question is None or self.is_applicable(question, metadata):
+                return question_id
+        return None
+
+    def record_answer(
+        self, metadata: Dict[str, Any], question_id: str, answer: str
+    ) -> str:
+        """
+        Guarda la respuesta en collected_data bajo el ID real de la pregunta.
+        Las respuestas de sector/subsector actualizan la ruta del cuestionario
+        y aplican a la nueva ruta el análisis de laboratorio ya subido.
+
+        Returns:
+            El valor guardado
+        """
+        answer = answer.strip()
+        metadata.setdefault("collected_data", {})[question_id] = answer
+
+        question = questionnaire_service.all_questions_base.get(question_id)
+        if question is None:
+            return answer
+
+        if question_id == self.SECTOR_QUESTION_ID:
+            sector = self.resolve_option(question, answer)
+            if sector in self.sectors():
+                if sector != metadata.get("selected_sector"):
+                    # Cambiar de sector invalida el subsector anterior
+                    metadata["selected_subsector"] = None
+                    metadata["subsector"] = None
+                metadata["selected_sector"] = sector
+                metadata["sector"] = sector
+                # Un análisis subido antes de elegir la ruta aún no se aplicó
+                lab_analysis_service.reapply(metadata)
+            else:
+                # Sin sector válido se vuelve a preguntar
+                metadata["collected_data"].pop(question_id, None)
+        elif question_id == self.SUBSECTOR_QUESTION_ID:
+            sector = metadata.get("selected_sector")
+            subsector = self.resolve_option(question, answer, sector)
+            if subsector is None and self.has_path(sector, "Otro"):
+                # Giro no listado: cuestionario genérico del sector
+                subsector = "Otro"
+            if self.has_path(sector, subsector):
+                metadata["selected_subsector"] = subsector
+                metadata["subsector"] = subsector
+                lab_analysis_service.reapply(metadata)
+            else:
+                metadata["collected_data"].pop(question_id, None)
+        elif question_id == self.COMPANY_QUESTION_ID and answer:
+            metadata["company_name"] = answer
+
+        return metadata["collected_data"].get(question_id, answer)
+
+    def progress(self, metadata: Dict[str, Any]) -> Tuple[int, int]:
+        """
+        (respondidas, total) sobre la ruta actual, para mostrar avance. No
+        cuentan las preguntas que ya se sabe que no aplican.
+        """
+        index = questionnaire_service.get_path_index(
+            metadata.get("selected_sector"), metadata.get("selected_subsector")
+        )
+        questions = questionnaire_service.all_questions_base
+        collected_data = metadata.get("collected_data", {})
+        answered = total = 0
+        for question_id in index.ids:
+            if self.is_answered(question_id, metadata):
+                answered += 1
+                total += 1
+                continue
+            question = questions.get(question_id)
+            if (
+                question is None
+                or not question.depends_on
+                or question.depends_on.get("id") not in collected_data
+                or self.is_applicable(question, metadata)
+            ):
+                total += 1
+        return answered, total
+
+    def format_question(self, question_id: str, metadata: Dict[str, Any]) -> str:
+        """
+        Pregunta en markdown sin LLM: respaldo si el LLM falla y camino rápido
+        (QUESTIONNAIRE_TEMPLATE_FAST_PATH) tras una respuesta resuelta localmente.
+        """
+        question = questionnaire_service.get_question_details(question_id)
+        if question is None:
+            return ""
+        sector = metadata.get("selected_sector")
+
+        parts = [f"**QUESTION:** {question.text_for(sector)}"]
+        if question.confirmation_text:
+            parts.append(question.confirmation_text)
+        options = question.options_for(sector)
+        if options:
+            parts.append(
+                "\n".join(f"{i}. {option}" for i, option in enumerate(options, 1))
+            )
+            parts.append("*You can reply with just the number.*")
+        collected_data = metadata.get("collected_data", {})
+        pending = [
+            sub.text for sub in question.sub_questions if sub.id not in collected_data
+        ]
+        if pending:
+            parts.append("\n".join(f"- {text}" for text in pending))
+        if question.explanation:
+            parts.append(f"*Why do we ask this?* {question.explanation}")
+        return "\n\n".join(parts)
+
+    async def record_turn(self, fast_path: bool, llm_skipped: bool):
+        """
+        Cuenta un turno respondido: si la respuesta se resolvió localmente
+        (fast_path) y si la siguiente pregunta se mostró sin llamar al LLM.
+        """
+        try:
+            pipe = redis_manager.client.pipeline(transaction=False)
+            pipe.hincrby(TURN_STATS_KEY, "turns", 1)
+            if fast_path:
+                pipe.hincrby(TURN_STATS_KEY, "fast_path", 1)
+            if llm_skipped:
+                pipe.hincrby(TURN_STATS_KEY, "llm_skipped", 1)
+            await pipe.execute()
+        except Exception as e:
+            # Las métricas nunca deben romper un turno
+            logger.warning(f"No se pudo registrar el turno del cuestionario: {e}")
+
+    async def turn_stats(self) -> Dict[str, Any]:
+        """Turnos totales, por camino rápido y sin LLM, con sus fracciones."""
+        try:
+            raw = await redis_manager.client.hgetall(TURN_STATS_KEY)
+        except Exception as e:
+            logger.error(f"Error leyendo métricas del cuestionario: {e}")
+            return {"status": "error"}
+
+        counts = {
+            (k.decode() if isinstance(k, bytes) else k): int(v) for k, v in raw.items()
+        }
+        turns = counts.get("turns", 0)
+        fast_path = counts.get("fast_path", 0)
+        llm_skipped = counts.get("llm_skipped", 0)
+        return {
+            "status": "ok",
+            "turns": turns,
+            "fast_path": fast_path,
+            "llm_skipped": llm_skipped,
+            "fast_path_ratio": round(fast_path / turns, 4) if turns else 0.0,
+            "llm_skipped_ratio": round(llm_skipped / turns, 4) if turns else 0.0,
+        }
+
+
+# Instancia global
+questionnaire_flow = QuestionnaireFlow()
@@ -1,85 +1,390 @@
 # app/services/questionnaire_service.py
 import logging
-from typing import Optional, List, Dict, Any
+import threading
+from contextvars import ContextVar
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Optional, List, Dict, Any, Mapping, NamedTuple, Tuple
+
+from app.config import settings
 
 # Quitar: from app.models.conversation_state import ConversationState
-from app.services.questionnaire_data import QUESTIONNAIRE_STRUCTURE
+from app.services.questionnaire_artifact import (
+    DEFAULT_ARTIFACT_PATH,
+    compile_questionnaire,
+    load_artifact,
+)
 
 # Quitar: import copy
 
 logger = logging.getLogger("hydrous")
 
 
+_EMPTY: Mapping[str, Any] = MappingProxyType({})
+
+
+def _freeze(value: Any) -> Any:
+    """Copia de solo lectura (dict → MappingProxyType, list → tuple)."""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+@dataclass(frozen=True, slots=True)
+class Question:
+    """
+    Pregunta congelada al cargar el cuestionario.
+
+    Inmutable y compartida: get_question_details la devuelve sin copiarla.
+    Las opciones condicionales (p. ej. INIT_2 según el sector) y el texto con
+    {sector} se resuelven al cargar, una vez por sector.
+    """
+
+    id: str
+    text: str
+    type: str
+    explanation: str = ""
+    options: Tuple[str, ...] = ()
+    depends_on: Optional[Mapping[str, Any]] = None
+    depends_on_key: Optional[str] = None
+    conditions: Mapping[str, Tuple[str, ...]] = _EMPTY
+    sub_questions: Tuple["Question", ...] = ()
+    confirmation_text: Optional[str] = None
+    extra: Mapping[str, Any] = _EMPTY  # Claves no previstas en la estructura
+    sector_texts: Mapping[str, str] = _EMPTY
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Question":
+        known = {
+            "id",
+            "text",
+            "type",
+            "explanation",
+            "options",
+            "depends_on",
+            "depends_on_key",
+            "conditions",
+            "sub_questions",
+            "confirmation_text",
+        }
+        conditions = _freeze(data.get("conditions") or {})
+        # Las sub-preguntas solo tienen "label"
+        text = data.get("text") or data.get("label", "")
+        return cls(
+            id=data["id"],
+            text=text,
+            type=data.get("type", "open"),
+            explanation=data.get("explanation", ""),
+            options=_freeze(data.get("options") or ()),
+            depends_on=_freeze(data.get("depends_on")),
+            depends_on_key=data.get("depends_on_key"),
+            conditions=conditions,
+            sub_questions=tuple(
+                cls.from_dict(sub)
+                for sub in data.get("sub_questions", [])
+                if "id" in sub
+            ),
+            confirmation_text=data.get("confirmation_text"),
+            extra=_freeze({k: v for k, v in data.items() if k not in known}),
+            sector_texts=MappingProxyType(
+                {sector: text.replace("{sector}", sector) for sector in conditions}
+                if "{sector}" in text
+                else {}
+            ),
+        )
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Acceso estilo dict para el código que trataba las preguntas como dicts."""
+        if key in ("extra", "sector_texts") or key not in self.__dataclass_fields__:
+            value = self.extra.get(key)
+        else:
+            value = getattr(self, key)
+        return default if value is None else value
+
+    def text_for(self, sector: Optional[str]) -> str:
+        """Texto con el sector ya sustituido (resuelto al cargar)."""
+        return self.sector_texts.get(sector, self.text)
+
+    def options_for(self, sector: Optional[str]) -> Tuple[str, ...]:
+        """Opciones de la pregunta; las condicionales según el sector."""
+        return self.conditions.get(sector, self.options)
+
+
+class QuestionTable(Mapping):
+    """
+    Índice de solo lectura ID → Question que congela cada pregunta en su
+    primer acceso: cargar el cuestionario no paga el costo de las ~600.
+    """
+
+    def __init__(self, raw_questions: Dict[str, Dict[str, Any]]):
+        self._raw = raw_questions
+        self._frozen: Dict[str, Question] = {}
+
+    def __getitem__(self, question_id: str) -> Question:
+        question = self._frozen.get(question_id)
+        if question is None:
+            # Si dos corrutinas/hilos coinciden, ambas construyen una pregunta igual
+            question = Question.from_dict(self._raw[question_id])
+            self._frozen[question_id] = question
+        return question
+
+    def __contains__(self, question_id: object) -> bool:
+        return question_id in self._raw
+
+    def __iter__(self):
+        return iter(self._raw)
+
+    def __len__(self) -> int:
+        return len(self._raw)
+
+
+class QuestionnaireIndex(NamedTuple):
+    """
+    Ruta compilada de un cuestionario (preguntas iniciales + subsector).
+
+    Inmutable y compartida entre conversaciones: posición, siguiente,
+    anterior y última pregunta se resuelven en O(1).
+    """
+
+    ids: Tuple[str, ...]
+    positions: Mapping[str, int]
+
+    @classmethod
+    def build(cls, ids: List[str]) -> "QuestionnaireIndex":
+        positions = {}
+        for position, question_id in enumerate(ids):
+            # Si un ID se repite cuenta su primera aparición (como list.index)
+            positions.setdefault(question_id, position)
+        return cls(tuple(ids), MappingProxyType(positions))
+
+    @property
+    def total(self) -> int:
+        return len(self.ids)
+
+    def position(self, question_id: Optional[str]) -> Optional[int]:
+        """Posición (base 0) de la pregunta en la ruta, None si no pertenece"""
+        return self.positions.get(question_id)
+
+    def next_id(self, question_id: Optional[str]) -> Optional[str]:
+        position = self.positions.get(question_id)
+        if position is None or position + 1 >= len(self.ids):
+            return None
+        return self.ids[position + 1]
+
+    def previous_id(self, question_id: Optional[str]) -> Optional[str]:
+        position = self.positions.get(question_id)
+        if not position:
+            return None
+        return self.ids[position - 1]
+
+    def is_last(self, question_id: Optional[str]) -> bool:
+        position = self.positions.get(question_id)
+        return position is not None and position == len(self.ids) - 1
+
+
+class QuestionnaireSnapshot(NamedTuple):
+    """
+    Una versión compilada del cuestionario. Inmutable: publicar una versión
+    nueva crea otra instantánea y la activa con un solo cambio de referencia.
+    """
+
+    version: str
+    initial_greeting: str
+    initial_question_id: Optional[str]
+    questions: Mapping[str, Question]
+    path_indexes: Mapping[Tuple[Optional[str], Optional[str]], QuestionnaireIndex]
+
+    @classmethod
+    def build(cls, compiled: Dict[str, Any]) -> "QuestionnaireSnapshot":
+        initial_ids = list(compiled["initial_ids"])
+        # Sin sector/subsector elegidos la ruta son solo las preguntas iniciales
+        indexes = {(None, None): QuestionnaireIndex.build(initial_ids)}
+        for sector, subsector, ids in compiled["paths"]:
+            indexes[(sector, subsector)] = QuestionnaireIndex.build(list(ids))
+        return cls(
+            version=compiled["version"],
+            initial_greeting=compiled["initial_greeting"],
+            initial_question_id=initial_ids[0] if initial_ids else None,
+            questions=QuestionTable(compiled["questions"]),
+            path_indexes=MappingProxyType(indexes),
+        )
+
+
+# Versión fijada para la tarea actual (petición o trabajo del worker)
+_pinned_version: ContextVar[Optional[str]] = ContextVar(
+    "questionnaire_version", default=None
+)
+
+
 class QuestionnaireService:
-    """Servicio simplificado para acceder a la estructura del cuestionario."""
+    """
+    Servicio simplificado para acceder a la estructura del cuestionario.
+
+    Carga perezosa: nada se lee al importar. En el primer uso se carga el
+    artefacto compilado (app/data/questionnaire.bin, con mmap) o, si no existe
+    o está desactualizado, se compila en memoria desde questionnaire_data.py.
+
+    Versiones: además de la de la imagen se pueden instalar versiones
+    publicadas (questionnaire_versions). Las consultas usan la versión fijada
+    con use_version en la tarea actual (la de la conversación) o, si no hay,
+    la activa.
+    """
+
+    def __init__(self, artifact_path: Optional[str] = None):
+        self.artifact_path = (
+            artifact_path or settings.QUESTIONNAIRE_ARTIFACT or DEFAULT_ARTIFACT_PATH
+        )
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._snapshots: Dict[str, QuestionnaireSnapshot] = {}
+        self._active: Optional[QuestionnaireSnapshot] = None
+
+    @property
+    def structure(self) -> Dict[str, Any]:
+        """Estructura original (importa questionnaire_data.py; solo para depurar)."""
+        from app.services.questionnaire_data import QUESTIONNAIRE_STRUCTURE
+
+        return QUESTIONNAIRE_STRUCTURE
+
+    @property
+    def snapshot(self) -> QuestionnaireSnapshot:
+        """Versión fijada en la tarea actual o, si no hay, la activa."""
+        self._ensure_loaded()
+        pinned = _pinned_version.get()
+        if pinned is not None:
+            snapshot = self._snapshots.get(pinned)
+            if snapshot is not None:
+                return snapshot
+        return self._active
+
+    @property
+    def active_version(self) -> str:
+        self._ensure_loaded()
+        return self._active.version
+
+    @property
+    def all_questions_base(self) -> Mapping[str, Question]:
+        return self.snapshot.questions
+
+    @property
+    def path_indexes(
+        self,
+    ) -> Mapping[Tuple[Optional[str], Optional[str]], QuestionnaireIndex]:
+        return self.snapshot.path_indexes
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if not self._loaded:
+                self._load()
+                self._loaded = True
+
+    def _load(self):
+        compiled = load_artifact(self.artifact_path)
+        source = "artefacto"
+        if compiled is None:
+            from app.services.questionnaire_data import QUESTIONNAIRE_STRUCTURE
+
+            compiled = compile_questionnaire(QUESTIONNAIRE_STRUCTURE)
+            source = "questionnaire_data.py"
+
+        snapshot = QuestionnaireSnapshot.build(compiled)
+        self._snapshots[snapshot.version] = snapshot
+        self._active = snapshot
 
-    def __init__(self):
-        self.structure = QUESTIONNAIRE_STRUCTURE
-        self.all_questions_base: Dict[str, Dict[str, Any]] = self._flatten_questions()
         logger.info(
-            f"Servicio de Cuestionario (Simplificado) inicializado con {len(self.all_questions_base)} preguntas base."
+            f"Servicio de Cuestionario (Simplificado) inicializado con {len(snapshot.questions)} preguntas base (desde {source}, versión {snapshot.version})."
+        )
+
+    def has_version(self, version: str) -> bool:
+        self._ensure_loaded()
+        return version in self._snapshots
+
+    def install(
+        self, compiled: Dict[str, Any], activate: bool = False
+    ) -> QuestionnaireSnapshot:
+        """
+        Instala una versión compilada (compile_questionnaire) sin reiniciar.
+        Con activate=True pasa a ser la versión de las conversaciones nuevas;
+        las existentes siguen con la suya.
+        """
+        self._ensure_loaded()
+        snapshot = self._snapshots.get(compiled["version"])
+        if snapshot is None:
+            snapshot = QuestionnaireSnapshot.build(compiled)
+            with self._lock:
+                snapshot = self._snapshots.setdefault(snapshot.version, snapshot)
+        if activate:
+            self.activate(snapshot.version)
+        return snapshot
+
+    def activate(self, version: str) -> bool:
+        """Activa una versión ya instalada; False si no está instalada."""
+        self._ensure_loaded()
+        snapshot = self._snapshots.get(version)
+        if snapshot is None:
+            return False
+        if self._active is not snapshot:
+            # Cambio atómico de referencia: las lecturas en curso siguen con
+            # la instantánea anterior, completa
+            self._active = snapshot
+            logger.info(
+                f"Versión activa del cuestionario: {version} ({len(snapshot.questions)} preguntas)"
+            )
+        return True
+
+    def use_version(self, version: Optional[str]):
+        """
+        Fija la versión del cuestionario para la tarea actual (cada petición y
+        cada trabajo del worker corren en su propia tarea). None usa la activa.
+        """
+        _pinned_version.set(version)
+
+    def get_path_index(
+        self, sector: Optional[str], subsector: Optional[str]
+    ) -> QuestionnaireIndex:
+        """Ruta compilada del subsector (solo preguntas iniciales si no existe)."""
+        return self.path_indexes.get(
+            (sector, subsector), self.path_indexes[(None, None)]
         )
 
-    def _flatten_questions(self) -> Dict[str, Dict[str, Any]]:
-        """Crea un diccionario plano de todas las preguntas por ID (sin cambios)."""
-        # ... (La lógica de _flatten_questions se mantiene igual que antes) ...
-        flat_questions = {}
-        # Añadir preguntas iniciales
-        for q in self.structure.get("initial_questions", []):
-            if "id" in q:
-                flat_questions[q["id"]] = q
-            else:
-                logger.error(
-                    f"Pregunta inicial sin ID encontrada: {q.get('text', 'N/A')}"
-                )
-
-        # Añadir preguntas de sector/subsector
-        for sector, subsectors in self.structure.get(
-            "sector_questionnaires", {}
-        ).items():
-            for subsector, questions in subsectors.items():
-                if not isinstance(questions, list):
-                    logger.error(
-                        f"Estructura inválida para {sector}/{subsector}. Se esperaba lista, se encontró {type(questions)}"
-                    )
-                    continue
-                for q in questions:
-                    if "id" in q:
-                        flat_questions[q["id"]] = q
-                    else:
-                        logger.error(
-                            f"Pregunta sin ID en {sector}/{subsector}: {q.get('text', 'N/A')}"
-                        )
-        return flat_questions
+    def get_question_text(self, question_id: str) -> Optional[str]:
+        """Texto base de una pregunta sin copiar su definición."""
+        question = self.all_questions_base.get(question_id)
+        return question.text if question else None
 
     def get_initial_greeting(self) -> str:
-        """Devuelve el saludo inicial (sin cambios)."""
-        return self.structure.get("initial_greeting", "¡Bienvenido!")
+        """Devuelve el saludo inicial."""
+        return self.snapshot.initial_greeting
 
     def get_initial_question_id(self) -> Optional[str]:
-        """Devuelve el ID de la primera pregunta inicial (sin cambios)."""
-        initial_questions = self.structure.get("initial_questions", [])
-        return (
-            initial_questions[0]["id"]
-            if initial_questions and "id" in initial_questions[0]
-            else None
-        )
+        """Devuelve el ID de la primera pregunta inicial."""
+        return self.snapshot.initial_question_id
 
-    def get_question_details(self, question_id: str) -> Optional[Dict[str, Any]]:
+    def get_question_details(self, question_id: str) -> Optional[Question]:
         """
         Obtiene los detalles BASE de una pregunta por su ID.
-        NO resuelve condicionales ni formato aquí. Devuelve una copia.
+        Devuelve la pregunta inmutable compartida (sin copia); las opciones y el
+        texto condicionales se obtienen con options_for/text_for o
+        get_question_options.
         """
-        question_base = self.all_questions_base.get(question_id)
-        if not question_base:
+        question = self.all_questions_base.get(question_id)
+        if not question:
             logger.error(
                 f"get_question_details: No se encontró pregunta con ID: {question_id}"
             )
             return None
-        # Devolver una copia para evitar modificaciones accidentales
-        import copy
+        return question
 
-        return copy.deepcopy(question_base)
+    def get_question_options(
+        self, question_id: str, sector: Optional[str] = None
+    ) -> Tuple[str, ...]:
+        """Opciones de una pregunta resueltas para el sector (tupla compartida)."""
+        question = self.all_questions_base.get(question_id)
+        return question.options_for(sector) if question else ()
 
     # --- ELIMINAR LAS SIGUIENTES FUNCIONES ---
     # def get_question(...) # La que resolvía condicionales
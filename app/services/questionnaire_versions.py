@@ -0,0 +1,219 @@
+"""
+Versiones publicadas del cuestionario (recarga en caliente).
+
+- Cada versión se guarda en blob storage como JSON
+  (questionnaire_versions/{version}.json); la versión es el hash del
+  contenido (structure_version), así publicar dos veces lo mismo no duplica
+- La versión activa vive en Redis (questionnaire:active_version); al
+  activarla se avisa por pub/sub (canal questionnaire:updates) y cada proceso
+  (API y workers) compila e instala la nueva versión sin reiniciar
+- Las conversaciones guardan la versión con la que empezaron
+  (metadata["questionnaire_version"]) y siguen con ella: pin() la carga bajo
+  demanda si el proceso todavía no la tiene
+
+Publicar/activar (desde la raíz del repositorio):
+    python -m app.services.questionnaire_versions publish [estructura.json] [--no-activate]
+    python -m app.services.questionnaire_versions activate <versión>
+Sin archivo se publica el QUESTIONNAIRE_STRUCTURE de questionnaire_data.py.
+"""
+
+import sys
+import json
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+from app.core.blob_storage import blob_storage
+from app.core.redis_manager import redis_manager
+from app.services.questionnaire_artifact import (
+    compile_questionnaire,
+    plain_structure,
+)
+from app.services.questionnaire_service import questionnaire_service
+
+logger = logging.getLogger("hydrous")
+
+VERSION_PREFIX = "questionnaire_versions/"
+ACTIVE_VERSION_KEY = "questionnaire:active_version"
+UPDATES_CHANNEL = "questionnaire:updates"
+
+# Espera antes de volver a suscribirse si se pierde la conexión
+RESUBSCRIBE_DELAY = 5
+
+
+class QuestionnaireVersionService:
+    """Publica versiones y mantiene instalada la activa en este proceso."""
+
+    def __init__(self):
+        self._listener: Optional[asyncio.Task] = None
+
+    def _key(self, version: str) -> str:
+        return f"{VERSION_PREFIX}{version}.json"
+
+    async def publish(self, structure: Dict[str, Any], activate: bool = True) -> str:
+        """
+        Valida (compila) y guarda una versión del cuestionario.
+
+        Returns:
+            La versión publicada
+        """
+        compiled = compile_questionnaire(structure)
+        if not compiled["initial_ids"] or not compiled["paths"]:
+            raise ValueError("Cuestionario sin preguntas iniciales o sin rutas")
+
+        version = compiled["version"]
+        data = json.dumps(plain_structure(structure), ensure_ascii=False).encode(
+            "utf-8"
+        )
+        await blob_storage.put_bytes(self._key(version), data, "application/json")
+        logger.info(
+            f"Versión {version} del cuestionario publicada ({len(compiled['questions'])} preguntas)"
+        )
+
+        if activate:
+            await self.activate(version)
+        return version
+
+    async def activate(self, version: str):
+        """Marca la versión como activa y avisa a todos los procesos."""
+        if not await blob_storage.exists(self._key(version)):
+            raise ValueError(f"La versión {version} del cuestionario no existe")
+
+        pipe = redis_manager.pipeline(transaction=True)
+        pipe.set(ACTIVE_VERSION_KEY, version)
+        pipe.publish(UPDATES_CHANNEL, version)
+        await pipe.execute()
+        logger.info(f"Versión {version} del cuestionario activada")
+
+    async def _fetch(self, version: str) -> Optional[Dict[str, Any]]:
+        """Descarga y compila una versión; None si no existe o es inválida."""
+        try:
+            if not await blob_storage.exists(self._key(version)):
+                logger.error(f"Versión {version} del cuestionario no encontrada")
+                return None
+            chunks = [
+                chunk async for chunk in blob_storage.iter_bytes(self._key(version))
+            ]
+            compiled = compile_questionnaire(json.loads(b"".join(chunks)))
+        except Exception as e:
+            logger.error(f"Error cargando la versión {version} del cuestionario: {e}")
+            return None
+
+        if compiled["version"] != version:
+            logger.error(
+                f"Contenido de la versión {version} no coincide con su hash ({compiled['version']})"
+            )
+            return None
+        return compiled
+
+    async def ensure_version(self, version: str, activate: bool = False) -> bool:
+        """Instala la versión en este proceso si aún no la tiene."""
+        if not questionnaire_service.has_version(version):
+            compiled = await self._fetch(version)
+            if compiled is None:
+                return False
+            questionnaire_service.install(compiled)
+        if activate:
+            questionnaire_service.activate(version)
+        return True
+
+    async def pin(self, metadata: Dict[str, Any]):
+        """
+        Fija para la tarea actual la versión con la que empezó la
+        conversación. Sin versión (conversaciones anteriores) o si no se puede
+        cargar, se usa la activa.
+        """
+        version = metadata.get("questionnaire_version")
+        if version and not await self.ensure_version(version):
+            logger.warning(
+                f"Versión {version} del cuestionario no disponible; se usa la activa"
+            )
+            version = None
+        questionnaire_service.use_version(version)
+
+    async def sync_active(self):
+        """Instala y activa la versión marcada como activa en Redis."""
+        try:
+            version = await redis_manager.client.get(ACTIVE_VERSION_KEY)
+        except Exception as e:
+            logger.error(f"No se pudo leer la versión activa del cuestionario: {e}")
+            return
+        if version and version != questionnaire_service.active_version:
+            await self.ensure_version(version, activate=True)
+
+    async def _listen(self):
+        while True:
+            # Conexión sin timeout de lectura: una suscripción ociosa no es un error
+            pubsub = redis_manager.blocking_client.pubsub(
+                ignore_subscribe_messages=True
+            )
+            try:
+                await pubsub.subscribe(UPDATES_CHANNEL)
+                # Lo publicado mientras no había suscripción no llega por el canal
+                await self.sync_active()
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        version = message["data"]
+                        if isinstance(version, bytes):
+                            version = version.decode()
+                        await self.ensure_version(version, activate=True)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Suscripción a versiones del cuestionario perdida: {e}")
+                await asyncio.sleep(RESUBSCRIBE_DELAY)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    def start(self):
+        """Empieza a escuchar activaciones (startup de la API y de los workers)."""
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is None:
+            return
+        self._listener.cancel()
+        try:
+            await self._listener
+        except asyncio.CancelledError:
+            pass
+        self._listener = None
+
+
+# Instancia global
+questionnaire_versions = QuestionnaireVersionService()
+
+
+async def _main(argv):
+    command = argv[0] if argv else ""
+    try:
+        if command == "publish":
+            paths = [arg for arg in argv[1:] if not arg.startswith("--")]
+            if paths:
+                with open(paths[0], "r", encoding="utf-8") as f:
+                    structure = json.load(f)
+            else:
+                from app.services.questionnaire_data import QUESTIONNAIRE_STRUCTURE
+
+                structure = QUESTIONNAIRE_STRUCTURE
+            version = await questionnaire_versions.publish(
+                structure, activate="--no-activate" not in argv
+            )
+            print(f"Versión publicada: {version}")
+        elif command == "activate" and len(argv) > 1:
+            await questionnaire_versions.activate(argv[1])
+            print(f"Versión activada: {argv[1]}")
+        else:
+            print(__doc__)
+            return 1
+    finally:
+        await redis_manager.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
@@ -0,0 +1,500 @@
+import os
+import re
+import json
+import asyncio
+import hashlib
+import logging
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from app.config import settings
+from app.core.redis_manager import redis_manager
+
+logger = logging.getLogger("hydrous")
+
+
+class ProposalSection(NamedTuple):
+    """
+    Sección de la propuesta redactada por una llamada LLM independiente,
+    o calculada por el motor financiero (computed=True, sin LLM)
+    """
+
+    id: str
+    title: str
+    template_sections: Tuple[int, ...]  # Secciones de Format Proposal.txt de referencia
+    max_tokens: int
+    output_format: str
+    depends_on: Tuple[str, ...] = ()  # Secciones cuyo texto se pasa como contexto
+    computed: bool = False
+
+
+class ProposalSectionsError(Exception):
+    """Secciones que no se pudieron generar (se reintentan solo esas)"""
+
+    def __init__(self, failed: List[str]):
+        self.failed = failed
+        super().__init__(f"Secciones sin generar: {', '.join(failed)}")
+
+
+# Cambiar al modificar SECTIONS o los prompts: invalida las secciones en Redis
+SECTIONS_VERSION = "3"
+
+# Orden de ensamblado. Equipos y finanzas los calcula financial_engine antes
+# de lanzar las llamadas; el tren de tratamiento recibe la tabla de equipos
+# para describir los mismos equipos. Las secciones LLM van todas en paralelo.
+SECTIONS: Tuple[ProposalSection, ...] = (
+    ProposalSection(
+        id="background",
+        title="2. Project Background",
+        template_sections=(2,),
+        max_tokens=500,
+        output_format="""| **Client Information** | **Details** |
+| ------------------ | --------------- |
+| **Client Name** | {client_name} |
+| **Location** | {user_location} |
+| **Company** | {company_name} |
+| **Industry** | {industry} |
+| **Water Source** | [Fuente] |
+| **Current Water Consumption** | [X m³/día] |
+| **Current Wastewater Generation** | [Y m³/día] |
+| **Existing Treatment System** | [Sistema o "No existing treatment"] |""",
+    ),
+    ProposalSection(
+        id="objectives",
+        title="3. Objective of the Project",
+        template_sections=(3,),
+        max_tokens=300,
+        output_format="""✓ **Regulatory Compliance** -- [1 frase específica]
+✓ **Cost Optimization** -- [1 frase específica]
+✓ **Water Reuse** -- [1 frase específica]
+✓ **Sustainability** -- [1 frase específica]""",
+    ),
+    ProposalSection(
+        id="design_parameters",
+        title="4. Key Design Parameters",
+        template_sections=(4,),
+        max_tokens=500,
+        output_format="""| **Parameter** | **Current Value** | **Target Value** |
+| ------------- | --------------- | ---------------- |
+| **TSS (mg/L)** | [valor] | [valor] |
+| **COD (mg/L)** | [valor] | [valor] |
+| **BOD (mg/L)** | [valor] | [valor] |
+| **pH** | [valor] | [valor] |""",
+    ),
+    ProposalSection(
+        id="treatment",
+        title="5. Recommended Treatment Process",
+        template_sections=(5,),
+        max_tokens=700,
+        depends_on=("equipment",),
+        output_format="""Usa las mismas tecnologías de la tabla de equipos de la sección 6.
+
+| **Treatment Stage** | **Technology** | **Function** |
+| ------------------ | ------------- | ------------ |
+| **Primary** | [tecnología específica] | [función principal] |
+| **Secondary** | [tecnología específica] | [función principal] |
+| **Tertiary** | [tecnología específica] | [función principal] |
+| **Final** | [tecnología específica] | [función principal] |""",
+    ),
+    ProposalSection(
+        id="equipment",
+        title="6. Equipment Specifications",
+        template_sections=(6,),
+        max_tokens=0,
+        output_format="",
+        computed=True,
+    ),
+    ProposalSection(
+        id="financials",
+        title="7. Financial Summary",
+        template_sections=(7, 8),
+        max_tokens=0,
+        output_format="",
+        computed=True,
+    ),
+)
+
+PROPOSAL_HEADER = """**Hydrous Management Group -- AI-Generated Wastewater Treatment Proposal**
+
+**Important Disclaimer**
+This proposal was generated using AI based on the information provided by the client and industry-standard benchmarks. Cost estimates and technical recommendations must be validated by Hydrous Management Group before implementation."""
+
+PROPOSAL_NEXT_STEPS = """**9. Next Steps**
+1. Technical validation meeting
+2. Site assessment
+3. Detailed engineering proposal
+4. Implementation schedule
+
+Contact: info@hydrous.com | www.hydrous.com | +52 55 1234 5678"""
+
+SECTION_FALLBACK = (
+    "_Esta sección no pudo generarse automáticamente. Hydrous Management Group "
+    "la completará durante la validación técnica._"
+)
+
+_TEMPLATE_HEADING = re.compile(r"^(\d+)\.\s+\S", re.MULTILINE)
+
+
+def load_template_sections(path: str) -> Dict[int, str]:
+    """Divide Format Proposal.txt en {número de sección: texto}"""
+    try:
+        with open(path, "r", encoding="utf-8-sig") as f:
+            content = f.read()
+    except OSError as e:
+        logger.error(f"Plantilla de propuesta no disponible ({path}): {e}")
+        return {}
+
+    matches = list(_TEMPLATE_HEADING.finditer(content))
+    sections = {}
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(content)
+        # Las tablas de la plantilla vienen con una celda por línea
+        text = re.sub(r"[ \t]*\n[ \t]*", "\n", content[match.start() : end]).strip()
+        sections[int(match.group(1))] = re.sub(r"\n{2,}", "\n", text)
+    return sections
+
+
+def client_data(metadata: dict) -> Dict[str, str]:
+    """Datos del cliente que toda sección debe respetar"""
+    client_name = metadata.get("client_name", "Cliente")
+    if client_name == "Cliente":
+        client_name = metadata.get("user_name", "Cliente")
+    selected_sector = metadata.get("selected_sector", "No especificado")
+    selected_subsector = metadata.get("selected_subsector", "")
+
+    # Combinar sector y subsector si ambos existen
+    industry = selected_sector
+    if selected_subsector and selected_subsector != "Otro":
+        industry = f"{selected_sector} - {selected_subsector}"
+
+    return {
+        "client_name": client_name,
+        "user_location": metadata.get("user_location", "No especificada"),
+        "company_name": metadata.get("company_name", "No especificada"),
+        "industry": industry if industry != "No especificado" else "No especificada",
+    }
+
+
+class SectionProposalGenerator:
+    """
+    Genera la propuesta sección por sección con llamadas LLM concurrentes.
+
+    - Cada sección de SECTIONS es una llamada corta (max_tokens propio) y
+      se lanzan en paralelo, acotadas por un semáforo, respetando las
+      dependencias declaradas; luego se ensamblan en orden.
+    - Introducción, disclaimer y próximos pasos son texto fijo; equipos,
+      CAPEX/OPEX y ROI los calcula financial_engine: no gastan tokens.
+    - Las secciones terminadas se guardan en Redis (hash por conversación,
+      invalidado si cambia la conversación). Si el trabajo se reintenta,
+      solo se regeneran las secciones que fallaron.
+    """
+
+    def __init__(self):
+        template_path = os.path.join(
+            os.path.dirname(__file__), "../prompts/Format Proposal.txt"
+        )
+        self.template_sections = load_template_sections(template_path)
+        self.concurrency = settings.PROPOSAL_SECTION_CONCURRENCY
+        self.attempts = settings.PROPOSAL_SECTION_ATTEMPTS
+        self.SECTIONS_PREFIX = "proposal_sections:"
+        self.SECTIONS_TTL = settings.PROPOSAL_SECTION_CACHE_TTL
+
+    @property
+    def redis_client(self):
+        return redis_manager.client
+
+    def build_section_prompt(
+        self,
+        section: ProposalSection,
+        conversation_text: str,
+        client: Dict[str, str],
+        related: Optional[Dict[str, str]] = None,
+        design_basis: Optional[str] = None,
+    ) -> str:
+        """
+        Prompt de una sección: conversación, datos del cliente, cifras de
+        financial_engine, contexto y formato
+        """
+        guidance = "\n\n".join(
+            self.template_sections[n]
+            for n in section.template_sections
+            if n in self.template_sections
+        )
+        related_text = "\n\n".join(
+            f"**{title}**\n{text}" for title, text in (related or {}).items()
+        )
+
+        prompt = f"""
+# REDACTA UNA SECCIÓN DE UNA PROPUESTA PROFESIONAL DE TRATAMIENTO DE AGUA
+
+Sección a redactar: **{section.title}**
+
+Basándote en la conversación:
+{conversation_text}
+
+## DATOS DEL CLIENTE A RESPETAR:
+- Nombre del cliente: {client["client_name"]}
+- Ubicación: {client["user_location"]}
+- Empresa: {client["company_name"]}
+- Sector/Industria: {client["industry"]}
+"""
+        if design_basis:
+            prompt += f"""
+## CIFRAS CALCULADAS (las mismas de las tablas de equipos y finanzas):
+{design_basis}
+"""
+        if related_text:
+            prompt += f"""
+## SECCIONES YA REDACTADAS (mantén coherencia con sus datos y cifras):
+{related_text}
+"""
+        if guidance:
+            prompt += f"""
+## REFERENCIA DE LA PLANTILLA (contenido esperado, no copies su formato):
+{guidance}
+"""
+        prompt += f"""
+## INSTRUCCIONES CRÍTICAS:
+1. Escribe SOLO el contenido de esta sección, sin repetir su título.
+2. Sé CONCISO y DIRECTO - menos texto, más información concreta.
+3. Usa SOLO las cifras de la conversación y de las cifras o tablas calculadas; NO inventes números. Si un dato no está, escribe "Por confirmar" (nunca marcadores como "$X,XXX").
+4. Tablas SIMPLES de máximo 4 columnas.
+
+## FORMATO EXACTO A SEGUIR:
+{section.output_format.format(**client)}
+"""
+        return prompt
+
+    def fingerprint(self, conversation_text: str, client: Dict[str, str]) -> str:
+        """Identifica la entrada: si cambia, las secciones guardadas no sirven"""
+        digest = hashlib.sha256()
+        for part in (
+            SECTIONS_VERSION,
+            json.dumps(client, sort_keys=True),
+            conversation_text,
+        ):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def estimate_tokens(self, conversation_text: str, metadata: dict) -> int:
+        """Tokens estimados de todas las llamadas (prompt + max_tokens de cada sección)"""
+        from app.services.token_budget_service import token_budget_service
+
+        client = client_data(metadata)
+        computed, design_basis = self.computed_sections(metadata)
+        titles = {section.id: section.title for section in SECTIONS}
+        max_tokens = {section.id: section.max_tokens for section in SECTIONS}
+        total = 0
+        for section in SECTIONS:
+            if section.computed:
+                continue
+            related = {
+                titles[dep]: computed[dep]
+                for dep in section.depends_on
+                if computed.get(dep)
+            }
+            prompt = self.build_section_prompt(
+                section, conversation_text, client, related, design_basis
+            )
+            # El texto de las dependencias LLM se añade al prompt: contar su máximo
+            related_tokens = sum(
+                max_tokens[dep] for dep in section.depends_on if dep not in computed
+            )
+            total += related_tokens + token_budget_service.estimate_tokens(
+                [{"role": "user", "content": prompt}], section.max_tokens
+            )
+        return total
+
+    def computed_sections(
+        self, metadata: dict
+    ) -> Tuple[Dict[str, Optional[str]], Optional[str]]:
+        """
+        Equipos y finanzas calculados con financial_engine (sin LLM) y las
+        cifras base (caudal de diseño, costos) para los prompts de las
+        secciones LLM.
+        """
+        from app.services.financial_engine import financial_engine
+
+        try:
+            model = financial_engine.calculate(metadata)
+        except Exception as e:
+            logger.error(f"Error en el cálculo financiero: {e}", exc_info=True)
+            return {"equipment": None, "financials": None}, None
+        return {
+            "equipment": financial_engine.equipment_markdown(model),
+            "financials": financial_engine.financial_markdown(model),
+        }, financial_engine.design_basis(model)
+
+    def _sections_key(self, conversation_id: str, fingerprint: str) -> str:
+        # La huella va en la clave: si la conversación cambia, las secciones
+        # anteriores dejan de leerse y caducan solas
+        return f"{self.SECTIONS_PREFIX}{conversation_id}:{fingerprint[:16]}"
+
+    async def _load_cached(
+        self, conversation_id: str, fingerprint: str
+    ) -> Dict[str, str]:
+        try:
+            return await self.redis_client.hgetall(
+                self._sections_key(conversation_id, fingerprint)
+            )
+        except Exception as e:
+            logger.warning(
+                f"No se pudieron leer secciones guardadas de {conversation_id}: {e}"
+            )
+            return {}
+
+    async def _save_section(
+        self, conversation_id: str, fingerprint: str, section_id: str, text: str
+    ):
+        key = self._sections_key(conversation_id, fingerprint)
+        try:
+            pipe = redis_manager.pipeline(transaction=True)
+            pipe.hset(key, section_id, text)
+            pipe.expire(key, self.SECTIONS_TTL)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(
+                f"No se pudo guardar la sección {section_id} de {conversation_id}: {e}"
+            )
+
+    @staticmethod
+    def _clean_section_text(section: ProposalSection, text: str) -> str:
+        """Quita el título si el modelo lo repitió"""
+        text = text.strip()
+        first_line, _, rest = text.partition("\n")
+        heading = first_line.strip().strip("#*").strip()
+        if heading and heading.lower() in (
+            section.title.lower(),
+            section.title.split(". ", 1)[-1].lower(),
+        ):
+            text = rest.strip()
+        return text
+
+    async def _generate_section(
+        self,
+        section: ProposalSection,
+        conversation_text: str,
+        client: Dict[str, str],
+        related: Dict[str, str],
+        design_basis: Optional[str],
+        semaphore: asyncio.Semaphore,
+    ) -> Optional[str]:
+        """Genera una sección con reintentos; None si todos los intentos fallan"""
+        from app.services.ai_service import ai_service
+
+        prompt = self.build_section_prompt(
+            section, conversation_text, client, related, design_basis
+        )
+        messages = [{"role": "user", "content": prompt}]
+
+        for attempt in range(1, self.attempts + 1):
+            try:
+                async with semaphore:
+                    text = await ai_service._call_llm_api(
+                        messages,
+                        max_tokens=section.max_tokens,
+                        temperature=0.7,
+                        raise_errors=True,
+                    )
+                text = self._clean_section_text(section, text)
+                if text:
+                    return text
+                raise ValueError("sección vacía")
+            except Exception as e:
+                logger.warning(
+                    f"Sección '{section.id}' falló (intento {attempt}/{self.attempts}): {e}"
+                )
+                if attempt < self.attempts:
+                    await asyncio.sleep(2 ** (attempt - 1))
+        return None
+
+    async def generate(
+        self,
+        conversation_id: str,
+        conversation_text: str,
+        metadata: dict,
+        final_attempt: bool = True,
+    ) -> str:
+        """
+        Genera y ensambla la propuesta completa.
+
+        Args:
+            final_attempt: si es el último intento del trabajo, las secciones que
+                sigan fallando se sustituyen por un aviso en lugar de fallar
+
+        Raises:
+            ProposalSectionsError: si quedan secciones sin generar y no es el
+                último intento (las generadas quedan guardadas para el reintento)
+        """
+        client = client_data(metadata)
+        fingerprint = self.fingerprint(conversation_text, client)
+        results: Dict[str, Optional[str]] = dict(
+            await self._load_cached(conversation_id, fingerprint)
+        )
+        if results:
+            logger.info(
+                f"Reutilizando {len(results)} secciones ya generadas para {conversation_id}"
+            )
+        # Deterministas y baratas: se recalculan siempre, no se guardan
+        computed, design_basis = self.computed_sections(metadata)
+        results.update(computed)
+
+        sections_by_id = {section.id: section for section in SECTIONS}
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run(section: ProposalSection) -> Optional[str]:
+            if results.get(section.id):
+                return results[section.id]
+            related = {}
+            for dependency in section.depends_on:
+                if dependency in tasks:
+                    dependency_text = await tasks[dependency]
+                else:
+                    dependency_text = results.get(dependency)
+                if dependency_text:
+                    related[sections_by_id[dependency].title] = dependency_text
+            text = await self._generate_section(
+                section, conversation_text, client, related, design_basis, semaphore
+            )
+            if text:
+                await self._save_section(conversation_id, fingerprint, section.id, text)
+            return text
+
+        # Las tareas no empiezan hasta el primer await: todas existen ya
+        # cuando una sección espera a sus dependencias
+        for section in SECTIONS:
+            if not section.computed:
+                tasks[section.id] = asyncio.create_task(run(section))
+        for section_id, task in tasks.items():
+            results[section_id] = await task
+
+        # Solo se reintentan las secciones LLM: si financial_engine falla, un
+        # reintento daría el mismo resultado y esas secciones llevan el aviso
+        failed = [
+            section.id
+            for section in SECTIONS
+            if not section.computed and not results.get(section.id)
+        ]
+        if failed:
+            if not final_attempt:
+                raise ProposalSectionsError(failed)
+            logger.error(
+                f"Propuesta de {conversation_id} ensamblada sin las secciones: {', '.join(failed)}"
+            )
+
+        parts = [PROPOSAL_HEADER]
+        intro = self.template_sections.get(1)
+        if intro:
+            intro_title, _, intro_body = intro.partition("\n")
+            parts.append(f"**{intro_title.strip()}**\n{intro_body.strip()}")
+        for section in SECTIONS:
+            parts.append(
+                f"**{section.title}**\n\n{results.get(section.id) or SECTION_FALLBACK}"
+            )
+        parts.append(PROPOSAL_NEXT_STEPS)
+        return "\n\n".join(parts)
+
+
+# Instancia global
+section_proposal_generator = SectionProposalGenerator()
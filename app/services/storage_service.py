@@ -14,6 +14,7 @@ from app.db.models.message import Message as DBMessage, RoleEnum
 from app.db.base import get_db
 from app.repositories.conversation_repository import conversation_repository
 from app.repositories.message_repository import message_repository
+from app.services.document_service import document_service
 from app.config import settings
 
 logger = logging.getLogger("hydrous")
@@ -31,7 +32,6 @@ class StorageService:
             "collected_data": {},
             "selected_sector": None,
             "selected_subsector": None,
-            "questionnaire_path": [],
             "is_complete": False,
             "has_proposal": False,
             "proposal_text": None,
@@ -107,7 +107,6 @@ class StorageService:
                 "collected_data": {},
                 "selected_sector": None,
                 "selected_subsector": None,
-                "questionnaire_path": [],
                 "is_complete": False,
                 "has_proposal": False,
                 "proposal_text": None,
@@ -257,9 +256,18 @@ class StorageService:
             removed_count = 0
             for conv in old_conversations:
                 try:
-                    # Eliminar conversación (cascada elimina mensajes y metadata)
-                    conversation_repository.remove(db, id=conv.id)
-                    removed_count += 1
+                    # Archivos de sus documentos (compartidos por contenido):
+                    # la cascada borra los documentos sin tocar ref_count
+                    stored_file_ids = [
+                        doc.stored_file_id
+                        for doc in conv.documents
+                        if doc.stored_file_id
+                    ]
+                    # Eliminar conversación (cascada elimina mensajes, metadata
+                    # y documentos)
+                    if conversation_repository.remove(db, id=conv.id):
+                        removed_count += 1
+                        await document_service.release_stored_files(stored_file_ids)
                 except Exception as e:
                     logger.error(
                         f"Error eliminando conversación antigua {conv.id}: {e}"
@@ -0,0 +1,157 @@
+import time
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+
+from app.config import settings
+from app.core.redis_manager import redis_manager
+from app.utils.token_counter import count_tokens
+
+logger = logging.getLogger("hydrous")
+
+
+class TokenBudgetService:
+    """
+    Rate limiting ponderado por costo para las peticiones que llaman al LLM.
+
+    ¿Por qué un segundo limitador?
+    - RateLimitMiddleware cuenta peticiones: /auth/me cuesta lo mismo que una
+      propuesta de 7000 tokens
+    - Aquí cada petición consume sus tokens estimados (prompt + completion)
+
+    ¿Cómo funciona?
+    - Presupuestos por usuario y por tenant (empresa), por minuto y por día
+    - Ventanas fijas en Redis (INCRBY + TTL), compartidas entre workers
+    - Se cobra ANTES de llamar al LLM; si algún presupuesto se excede,
+      el cargo se revierte y la petición se rechaza
+    """
+
+    def __init__(self):
+        # Prefijo para las claves de presupuesto
+        self.BUDGET_PREFIX = "llm_budget:"
+
+        # Límites por (dimensión, ventana)
+        self.limits: Dict[Tuple[str, str], int] = {
+            ("user", "minute"): settings.LLM_TOKENS_PER_MINUTE_USER,
+            ("user", "day"): settings.LLM_TOKENS_PER_DAY_USER,
+            ("tenant", "minute"): settings.LLM_TOKENS_PER_MINUTE_TENANT,
+            ("tenant", "day"): settings.LLM_TOKENS_PER_DAY_TENANT,
+        }
+
+    @property
+    def redis_client(self):
+        """Cliente Redis compartido (pool del RedisManager)"""
+        return redis_manager.client
+
+    def estimate_tokens(
+        self,
+        messages: List[Dict[str, str]],
+        max_completion_tokens: int,
+        model: Optional[str] = None,
+    ) -> int:
+        """
+        Estima el costo de una llamada: tokens del prompt + máximo de completion.
+
+        Args:
+            messages: Mensajes que se enviarán al LLM
+            max_completion_tokens: max_tokens de la llamada
+            model: Modelo para elegir el tokenizador
+
+        Returns:
+            int: Tokens estimados
+        """
+        try:
+            prompt_tokens = count_tokens(messages, model or settings.MODEL)
+        except Exception as e:
+            # Sin tokenizador disponible (ej. sin red para descargar BPE): ~4 chars/token
+            logger.warning(f"No se pudo contar tokens con tiktoken, estimando: {e}")
+            prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+        return prompt_tokens + max_completion_tokens
+
+    def _window_keys(
+        self, dimension: str, identifier: str, now: float
+    ) -> List[Tuple[Tuple[str, str], str, int, float]]:
+        """Devuelve (límite, clave, ttl, fin_de_ventana) para minuto y día."""
+        minute_bucket = int(now // 60)
+        day_bucket = datetime.fromtimestamp(now, timezone.utc).strftime("%Y%m%d")
+        day_end = (int(now // 86400) + 1) * 86400
+        base = f"{self.BUDGET_PREFIX}{dimension}:{identifier}"
+        return [
+            (
+                (dimension, "minute"),
+                f"{base}:m:{minute_bucket}",
+                120,
+                (minute_bucket + 1) * 60,
+            ),
+            ((dimension, "day"), f"{base}:d:{day_bucket}", 90000, day_end),
+        ]
+
+    async def consume(
+        self, user_id: str, tenant_id: Optional[str], tokens: int
+    ) -> Tuple[bool, float, Optional[str]]:
+        """
+        Cobra tokens de los presupuestos del usuario y de su tenant.
+
+        Args:
+            user_id: ID del usuario
+            tenant_id: Identificador del tenant (empresa); None para omitir esa dimensión
+            tokens: Tokens estimados de la llamada
+
+        Returns:
+            tuple: (allowed, retry_after, presupuesto_excedido)
+        """
+        if tokens <= 0:
+            return True, 0, None
+
+        now = time.time()
+        windows = self._window_keys("user", str(user_id), now)
+        if tenant_id:
+            tenant_key = "".join(
+                c if c.isalnum() else "_" for c in tenant_id.strip().lower()
+            )
+            windows += self._window_keys("tenant", tenant_key, now)
+
+        try:
+            # Una llamada mayor que el límite de una ventana cobra como máximo
+            # ese límite; así puede pasar cuando la ventana está vacía
+            charges = [min(tokens, self.limits[limit_key]) for limit_key, *_ in windows]
+
+            # Cobrar en todas las ventanas en un solo round trip
+            pipe = self.redis_client.pipeline(transaction=False)
+            for (_, key, ttl, _), charge in zip(windows, charges):
+                pipe.incrby(key, charge)
+                pipe.expire(key, ttl)
+            results = await pipe.execute()
+            totals = results[::2]
+
+            exceeded = [
+                (limit_key, window_end)
+                for (limit_key, _, _, window_end), total in zip(windows, totals)
+                if total > self.limits[limit_key]
+            ]
+            if not exceeded:
+                return True, 0, None
+
+            # Revertir el cargo: la llamada no se hará
+            pipe = self.redis_client.pipeline(transaction=False)
+            for (_, key, _, _), charge in zip(windows, charges):
+                pipe.decrby(key, charge)
+            await pipe.execute()
+
+            retry_after = max(window_end - now for _, window_end in exceeded)
+            scope = ",".join(f"{dim}:{window}" for (dim, window), _ in exceeded)
+            logger.warning(
+                f"Presupuesto LLM excedido ({scope}) para usuario {user_id}. "
+                f"Tokens solicitados: {tokens}. Retry after: {retry_after:.0f}s"
+            )
+            return False, retry_after, scope
+
+        except Exception as e:
+            # Si Redis falla no bloqueamos el chat: el limitador por peticiones sigue activo
+            logger.error(f"Error verificando presupuesto LLM: {e}")
+            return True, 0, None
+
+
+# Instancia global
+token_budget_service = TokenBudgetService()
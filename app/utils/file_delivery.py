@@ -0,0 +1,181 @@
+"""
+Entrega de archivos con validación condicional y descargas parciales.
+
+- ETag fuerte derivado del contenido: para los PDFs de la caché es la propia
+  clave (sha256) del nombre del archivo; para el resto, el sha256 del archivo,
+  memorizado por (ruta, tamaño, mtime) para no releerlo en cada descarga;
+  la primera lectura corre en un hilo para no bloquear el event loop.
+- If-None-Match → 304 sin cuerpo.
+- Range (un solo rango de bytes) → 206; If-Range con otro ETag → 200 completo.
+- Cache-Control privado: el navegador reutiliza su copia y revalida barato.
+
+Se implementa aquí en lugar de depender del soporte de Range de FileResponse,
+que solo existe en versiones recientes de Starlette.
+"""
+
+import os
+import re
+import asyncio
+import hashlib
+import logging
+from functools import lru_cache
+from typing import Iterator, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+logger = logging.getLogger("hydrous")
+
+CHUNK_SIZE = 64 * 1024
+
+_SHA256_NAME = re.compile(r"^[0-9a-f]{64}$")
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+@lru_cache(maxsize=1024)
+def _file_digest(path: str, size: int, mtime_ns: int) -> str:
+    """sha256 del archivo; el tamaño y el mtime forman parte de la clave del memo"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def content_etag(path: str, stat_result: os.stat_result) -> str:
+    """ETag fuerte (entre comillas) derivado del contenido del archivo"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if _SHA256_NAME.match(stem):
+        # PDF de la caché: el nombre ya es el hash del contenido
+        return f'"{stem}"'
+    digest = await asyncio.to_thread(
+        _file_digest, path, stat_result.st_size, stat_result.st_mtime_ns
+    )
+    return f'"{digest}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """Comparación débil de If-None-Match (ignora el prefijo W/)"""
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header.split(",")]
+    return any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in candidates)
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Interpreta un Range de un solo rango de bytes.
+
+    Returns:
+        (inicio, fin) inclusivos, o None si el header no se puede usar
+        (se responde el archivo completo, como permite el RFC 9110)
+
+    Raises:
+        HTTPException 416 si el rango no es satisfacible
+    """
+    match = _RANGE_PATTERN.match(header.strip())
+    if not match:
+        # Malformado o varios rangos
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+
+    if not start:
+        # Sufijo: los últimos N bytes
+        length = int(end)
+        if length == 0:
+            raise _range_not_satisfiable(size)
+        return max(0, size - length), size - 1
+
+    first = int(start)
+    last = min(int(end), size - 1) if end else size - 1
+    if end and int(end) < first:
+        return None
+    if first >= size:
+        raise _range_not_satisfiable(size)
+    return first, last
+
+
+def _range_not_satisfiable(size: int) -> HTTPException:
+    return HTTPException(
+        status_code=416,
+        detail="Rango no satisfacible",
+        headers={"Content-Range": f"bytes */{size}"},
+    )
+
+
+def _iter_range(path: str, start: int, end: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def conditional_file_response(
+    request: Request,
+    path: str,
+    filename: str,
+    media_type: str = "application/pdf",
+    max_age: int = 0,
+) -> Response:
+    """
+    Responde un archivo con ETag, 304, 206 y Cache-Control privado.
+
+    Un solo os.stat por petición: si el archivo no existe lanza 404 y si
+    está vacío 500.
+    """
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        raise HTTPException(
+            status_code=404, detail="El archivo no fue encontrado en el servidor"
+        )
+    if stat_result.st_size == 0:
+        logger.error(f"Archivo vacío: {path}")
+        raise HTTPException(status_code=500, detail="El archivo está vacío")
+
+    size = stat_result.st_size
+    etag = await content_etag(path, stat_result)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={max_age}, must-revalidate",
+        "Accept-Ranges": "bytes",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    byte_range: Optional[Tuple[int, int]] = None
+    # If-Range con otro ETag (o una fecha): el archivo cambió, enviar completo
+    if range_header and (if_range is None or if_range.strip() == etag):
+        byte_range = _parse_range(range_header, size)
+
+    if byte_range is None:
+        return FileResponse(
+            path=path,
+            media_type=media_type,
+            headers=headers,
+            stat_result=stat_result,
+        )
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _iter_range(path, start, end),
+        status_code=206,
+        media_type=media_type,
+        headers=headers,
+    )
@@ -0,0 +1,104 @@
+"""
+Worker de la bandeja de salida de emails.
+
+Uso:
+    python -m app.workers.email_worker
+
+Para pruebas locales sin servidor real (aiosmtpd):
+    python -m aiosmtpd -n -l localhost:8025
+    SMTP_SERVER=localhost SMTP_PORT=8025 SMTP_USE_TLS=false python -m app.workers.email_worker
+"""
+
+import asyncio
+import signal
+import logging
+
+from app.config import settings
+from app.core.logging_config import get_logger
+from app.core.redis_manager import redis_manager
+from app.services.email_service import SMTPSender, email_service
+
+logger = logging.getLogger("hydrous")
+
+
+class EmailWorker:
+    """
+    Entrega los emails encolados por lotes, reutilizando la conexión SMTP.
+
+    Los emails fallidos se reintentan con backoff exponencial y, agotados los
+    intentos, quedan en la cola dead-letter para revisión manual.
+    """
+
+    def __init__(self):
+        self.outbox = email_service.outbox
+        self.sender = SMTPSender()
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def run_once(self) -> int:
+        """
+        Procesa un lote de la bandeja de salida.
+
+        Returns:
+            int: Emails enviados correctamente
+        """
+        await self.outbox.recover_expired()
+        messages = await self.outbox.reserve(
+            count=settings.EMAIL_BATCH_SIZE, timeout=settings.EMAIL_POLL_TIMEOUT
+        )
+        if not messages:
+            # Sin trabajo: no retener la conexión SMTP más de lo necesario
+            await asyncio.to_thread(self.sender.close)
+            return 0
+
+        # smtplib es bloqueante: el lote completo se envía en un hilo
+        results = await asyncio.to_thread(
+            self.sender.send_batch, [m["payload"] for m in messages]
+        )
+
+        sent = 0
+        for message, error in zip(messages, results):
+            if error is None:
+                await self.outbox.ack(message)
+                sent += 1
+            else:
+                logger.warning(
+                    f"Error enviando email {message['id']} a {message['payload']['to']}: {error}"
+                )
+                await self.outbox.retry(
+                    message, error, base_delay=settings.EMAIL_RETRY_BASE_SECONDS
+                )
+
+        if sent:
+            logger.info(f"Enviados {sent}/{len(messages)} emails")
+        return sent
+
+    async def run(self):
+        await redis_manager.start()
+        logger.info("Worker de emails iniciado")
+        try:
+            while not self._stopping.is_set():
+                try:
+                    await self.run_once()
+                except Exception as e:
+                    logger.error(f"Error en worker de emails: {e}")
+                    await asyncio.sleep(settings.EMAIL_POLL_TIMEOUT)
+        finally:
+            await asyncio.to_thread(self.sender.close)
+            await redis_manager.stop()
+            logger.info("Worker de emails detenido")
+
+
+async def main():
+    worker = EmailWorker()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    await worker.run()
+
+
+if __name__ == "__main__":
+    get_logger("hydrous")
+    asyncio.run(main())
@@ -0,0 +1,133 @@
+"""
+Worker de generación de propuestas.
+
+Uso:
+    python -m app.workers.proposal_worker
+
+Se pueden levantar tantos procesos como se necesite: los trabajos se
+reparten a través de la cola en Redis.
+"""
+
+import os
+import asyncio
+import signal
+import logging
+from typing import Any, Dict
+
+from app.config import settings
+from app.core.debug_artifacts import debug_recorder
+from app.core.logging_config import get_logger
+from app.core.process_pool import pdf_render_pool
+from app.core.redis_manager import redis_manager
+from app.db.base import SessionLocal
+from app.services.direct_proposal_generator import direct_proposal_generator
+from app.services.proposal_job_service import proposal_job_service
+from app.services.questionnaire_versions import questionnaire_versions
+from app.services.storage_service import storage_service
+
+logger = logging.getLogger("hydrous")
+
+
+class ProposalWorker:
+    """
+    Consume la cola de propuestas y ejecuta la generación completa
+    (LLM + render en el pool de procesos) fuera de las peticiones HTTP.
+    """
+
+    def __init__(self, concurrency: int = settings.PROPOSAL_WORKER_CONCURRENCY):
+        self.queue = proposal_job_service.queue
+        self.concurrency = concurrency
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def process(self, message: Dict[str, Any]):
+        """Genera la propuesta de un trabajo y actualiza su estado"""
+        conversation_id = message["payload"]["conversation_id"]
+        attempts = message.get("attempts", 0)
+        await proposal_job_service.mark_running(conversation_id, attempts)
+
+        db = SessionLocal()
+        try:
+            conversation = await storage_service.get_conversation(conversation_id, db)
+            if not conversation:
+                raise ValueError(f"Conversación {conversation_id} no encontrada")
+            # Misma versión del cuestionario con la que se respondió
+            await questionnaire_versions.pin(conversation.metadata)
+
+            # En el último intento se ensambla aunque falte alguna sección
+            pdf_path = await direct_proposal_generator.generate_complete_proposal(
+                conversation, final_attempt=attempts + 1 >= self.queue.max_attempts
+            )
+            if not pdf_path or not os.path.exists(pdf_path):
+                raise RuntimeError("La generación no produjo un PDF")
+
+            conversation.metadata["pdf_path"] = pdf_path
+            conversation.metadata["has_proposal"] = True
+            conversation.metadata["is_complete"] = True
+            await storage_service.save_conversation(conversation, db)
+            db.commit()
+
+            await proposal_job_service.mark_completed(conversation_id, pdf_path)
+            await self.queue.ack(message)
+            logger.info(
+                f"Propuesta generada por worker para {conversation_id}: {pdf_path}"
+            )
+
+        except Exception as e:
+            db.rollback()
+            logger.error(
+                f"Error generando propuesta para {conversation_id} (intento {attempts + 1}): {e}",
+                exc_info=True,
+            )
+            retried = await self.queue.retry(message, str(e), base_delay=10)
+            await proposal_job_service.mark_failed(
+                conversation_id, str(e), final=not retried
+            )
+        finally:
+            db.close()
+
+    async def _abandon(self, message: Dict[str, Any]):
+        """Trabajo que agotó sus intentos por expirar (el worker murió o se colgó)"""
+        await proposal_job_service.mark_failed(
+            message["payload"]["conversation_id"],
+            "El trabajo expiró demasiadas veces sin terminar",
+            final=True,
+        )
+
+    async def _consume(self):
+        while not self._stopping.is_set():
+            try:
+                await self.queue.recover_expired(on_dead=self._abandon)
+                for message in await self.queue.reserve(count=1, timeout=5):
+                    await self.process(message)
+            except Exception as e:
+                logger.error(f"Error en worker de propuestas: {e}")
+                await asyncio.sleep(5)
+
+    async def run(self):
+        await redis_manager.start()
+        questionnaire_versions.start()
+        logger.info(f"Worker de propuestas iniciado ({self.concurrency} consumidores)")
+        try:
+            await asyncio.gather(*(self._consume() for _ in range(self.concurrency)))
+        finally:
+            pdf_render_pool.shutdown()
+            debug_recorder.stop()
+            await questionnaire_versions.stop()
+            await redis_manager.stop()
+            logger.info("Worker de propuestas detenido")
+
+
+async def main():
+    worker = ProposalWorker()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    await worker.run()
+
+
+if __name__ == "__main__":
+    get_logger("hydrous")
+    asyncio.run(main())
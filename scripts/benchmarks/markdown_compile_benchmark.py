@@ -0,0 +1,70 @@
+"""
+Micro-benchmark del compilador markdown → flowables de las propuestas.
+
+Mide por separado, sobre propuestas sintéticas grandes:
+- parse: tokenización a la representación intermedia (sin caché)
+- parse (caché): segunda llamada con el mismo texto
+- compile: emisión de flowables desde la representación ya parseada
+
+Uso (desde la raíz del repositorio):
+    PYTHONPATH=. python scripts/benchmarks/markdown_compile_benchmark.py
+    PYTHONPATH=. python scripts/benchmarks/markdown_compile_benchmark.py --sections 200 --iterations 30
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pdf_render_benchmark import build_synthetic_proposal  # noqa: E402
+
+
+def _report(label: str, timings: list):
+    print(
+        f"  {label:<14} mediana {statistics.median(timings):8.3f} ms"
+        f"  (mín {min(timings):.3f} / máx {max(timings):.3f})"
+    )
+
+
+def run(sections: int, iterations: int):
+    from app.services.proposal_markdown import (
+        PROPOSAL_THEME,
+        compile_flowables,
+        parse_proposal_markdown,
+    )
+
+    proposal_text = build_synthetic_proposal(sections)
+
+    parse_timings, cached_timings, compile_timings = [], [], []
+    for _ in range(iterations):
+        parse_proposal_markdown.cache_clear()
+
+        start = time.perf_counter()
+        blocks = parse_proposal_markdown(proposal_text)
+        parse_timings.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        parse_proposal_markdown(proposal_text)
+        cached_timings.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        elements = compile_flowables(blocks, PROPOSAL_THEME)
+        compile_timings.append((time.perf_counter() - start) * 1000)
+
+    print(f"Propuesta sintética: {sections} secciones, {len(proposal_text)} caracteres")
+    print(f"Bloques: {len(blocks)}, flowables: {len(elements)}")
+    print(f"Iteraciones: {iterations}")
+    _report("parse", parse_timings)
+    _report("parse (caché)", cached_timings)
+    _report("compile", compile_timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sections", type=int, default=200)
+    parser.add_argument("--iterations", type=int, default=30)
+    args = parser.parse_args()
+    run(args.sections, args.iterations)
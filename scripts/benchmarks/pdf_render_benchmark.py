@@ -0,0 +1,78 @@
+"""
+Micro-benchmark del render de PDFs de propuestas.
+
+Mide el tiempo por propuesta de DirectProposalGenerator._generate_pdf
+(en el proceso actual, sin pool) sobre una propuesta sintética.
+
+Uso (desde la raíz del repositorio):
+    PYTHONPATH=. python scripts/benchmarks/pdf_render_benchmark.py
+    PYTHONPATH=. python scripts/benchmarks/pdf_render_benchmark.py --sections 40 --iterations 30
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+
+def build_synthetic_proposal(sections: int) -> str:
+    """Propuesta markdown con la mezcla habitual: títulos, texto, listas y tablas."""
+    parts = ["# Propuesta de Tratamiento de Agua - Cliente de Prueba", ""]
+    for i in range(1, sections + 1):
+        parts += [
+            f"## {i}. Sección de la propuesta",
+            "",
+            f"Texto descriptivo de la sección {i} con **datos clave** y detalles "
+            "técnicos sobre el sistema de tratamiento propuesto para el cliente.",
+            "",
+            "- Parámetro **DQO**: 1200 mg/L",
+            "- Parámetro **SST**: 350 mg/L",
+            "✓ Cumple con la normativa aplicable",
+            "",
+            "| Parámetro | Entrada | Salida | Eficiencia |",
+            "|---|---|---|---|",
+            "| DQO | 1200 mg/L | 150 mg/L | 87% |",
+            "| DBO | 600 mg/L | 30 mg/L | 95% |",
+            "| SST | 350 mg/L | 20 mg/L | 94% |",
+            "",
+            "**Conclusión**",
+            "",
+        ]
+    return "\n".join(parts)
+
+
+def run(sections: int, iterations: int, warmup: int):
+    from app.services.direct_proposal_generator import direct_proposal_generator
+
+    proposal_text = build_synthetic_proposal(sections)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        timings = []
+        for i in range(warmup + iterations):
+            output_path = os.path.join(tmp_dir, f"bench_{i}.pdf")
+            start = time.perf_counter()
+            result = direct_proposal_generator._generate_pdf(
+                proposal_text, "benchmark", output_path
+            )
+            elapsed = time.perf_counter() - start
+            if not result:
+                raise RuntimeError("El render no produjo un PDF")
+            if i >= warmup:
+                timings.append(elapsed * 1000)
+
+    print(f"Propuesta sintética: {sections} secciones, {len(proposal_text)} caracteres")
+    print(f"Iteraciones: {iterations} (warmup {warmup})")
+    print(f"  media:   {statistics.mean(timings):8.2f} ms")
+    print(f"  mediana: {statistics.median(timings):8.2f} ms")
+    print(f"  mínimo:  {min(timings):8.2f} ms")
+    print(f"  máximo:  {max(timings):8.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sections", type=int, default=12)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=3)
+    args = parser.parse_args()
+    run(args.sections, args.iterations, args.warmup)
@@ -0,0 +1,91 @@
+"""
+Benchmark de arranque del cuestionario en un proceso nuevo (como un worker).
+
+Cada medición corre en un subproceso limpio y reporta:
+- import: tiempo de importar app.services.questionnaire_service
+- primer uso: tiempo hasta resolver la primera búsqueda (carga perezosa)
+- RSS: memoria residente máxima añadida por el cuestionario
+
+Compara la carga desde el artefacto compilado con la carga desde
+questionnaire_data.py (QUESTIONNAIRE_ARTIFACT apuntando a un archivo
+inexistente fuerza el camino de respaldo), con y sin bytecode en caché:
+en frío (PYTHONDONTWRITEBYTECODE, imagen sin .pyc) importar
+questionnaire_data.py obliga a compilar el literal en cada arranque.
+
+Uso (desde la raíz del repositorio):
+    python -m app.services.questionnaire_artifact   # compilar el artefacto
+    PYTHONPATH=. python scripts/benchmarks/questionnaire_load_benchmark.py --runs 7
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROBE = """
+import json, resource, sys, time
+import app.config  # dependencia común: fuera de la medición
+base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+t0 = time.perf_counter()
+from app.services.questionnaire_service import questionnaire_service
+t1 = time.perf_counter()
+questionnaire_service.get_path_index("Comercial", "Hotel").next_id("INIT_2")
+questionnaire_service.get_question_details("IAB_8_COD")
+t2 = time.perf_counter()
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"import": (t1 - t0) * 1000, "first_use": (t2 - t1) * 1000,
+                  "rss_kb": rss - base_rss}))
+"""
+
+
+def _measure(artifact: str, runs: int, cold: bool) -> dict:
+    env = dict(os.environ, QUESTIONNAIRE_ARTIFACT=artifact, PYTHONPATH=".")
+    samples = []
+    for _ in range(runs):
+        if cold:
+            # Caché de bytecode vacía y sin escribir: todo se compila desde fuente
+            env["PYTHONPYCACHEPREFIX"] = tempfile.mkdtemp(prefix="pyc-")
+            env["PYTHONDONTWRITEBYTECODE"] = "1"
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {key: statistics.median(s[key] for s in samples) for key in samples[0]}
+
+
+def run(runs: int, artifact: str):
+    if not os.path.exists(artifact):
+        print(
+            f"No existe {artifact}: ejecuta python -m app.services.questionnaire_artifact"
+        )
+        return
+    for cold in (False, True):
+        print("Sin bytecode en caché (frío):" if cold else "Con bytecode en caché:")
+        for label, path in (
+            ("questionnaire_data.py", "/nonexistent/questionnaire.bin"),
+            ("artefacto compilado", artifact),
+        ):
+            _report(label, _measure(path, runs, cold))
+
+
+def _report(label: str, result: dict):
+    print(
+        f"  {label:<22} import {result['import']:7.2f} ms"
+        f"  primer uso {result['first_use']:7.2f} ms"
+        f"  RSS +{result['rss_kb'] / 1024:6.2f} MB"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--artifact", default="app/data/questionnaire.bin")
+    args = parser.parse_args()
+    run(args.runs, args.artifact)